@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Time the chat prompt completions per keystroke.
+
+Compares the completer the prompt used to create for every question (shlex
+over the whole buffer, linear scan of the p-commands, all wrapped in a
+FuzzyCompleter) with `completion.CompletionIndex`, on short p-commands and
+on large pasted buffers.
+
+    python benchmarks/bench_completion.py --buffer-kb 100
+"""
+
+
+import sys
+import time
+import shlex
+import random
+import argparse
+import statistics
+import typing as t
+
+from prompt_toolkit.completion import CompleteEvent, Completer, Completion, FuzzyCompleter
+from prompt_toolkit.document import Document
+
+from chatgpt_cli.completion import CompletionIndex
+
+
+_COMMANDS = ["/hist", "/context", "/prompt", "/title", "/sessions", "/switch",
+             "/search", "/stats", "/exit", "/quit", "/help"]
+
+
+class LegacyCompleter(Completer):
+    """The completer the chat prompt used before the index."""
+
+    def __init__(self, arguments: t.Dict[str, t.List[str]]):
+        self.arguments = arguments
+
+    def get_completions(self, document, complete_event):
+        if not document.text.startswith("/"):
+            return
+        try:
+            pargs = shlex.split(document.text)
+        except ValueError:
+            return
+        if len(pargs) == 0:
+            return
+        input_cmd, input_args = pargs[0], pargs[1:]
+        matched = None
+        for match in _COMMANDS:
+            if input_cmd == match:
+                matched = match
+                break
+            if match.startswith(input_cmd):
+                yield Completion(match, start_position=-len(input_cmd))
+        if matched is None or input_args:
+            return
+        for value in self.arguments.get(matched, []):
+            yield Completion(value, start_position=0)
+
+
+def keystroke_time(completer: Completer, text: str, repeat: int) -> float:
+    document = Document(text)
+    event = CompleteEvent(text_inserted=True)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in completer.get_completions(document, event):
+            pass
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--buffer-kb", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rnd = random.Random(20230401)
+    arguments = {
+        "/prompt": [f"prompt-{i}" for i in range(50)],
+        "/switch": [f"Chat{i:02d}" for i in range(args.sessions)],
+        "/stats": ["session", "model", "clear"],
+        "/context": ["on", "off"],
+    }
+    words = "how do I write a python function that parses json from a stream".split()
+    questions = [" ".join(rnd.choice(words) for _ in range(rnd.randint(3, 15)))
+                 for _ in range(args.questions)]
+
+    start = time.perf_counter()
+    index = CompletionIndex()
+    for command in _COMMANDS:
+        index.add_command(command, arguments.get(command, []))
+    for question in questions:
+        index.add_question(question)
+    build = time.perf_counter() - start
+    legacy = FuzzyCompleter(LegacyCompleter(arguments))
+
+    paste = " ".join(rnd.choice(words) for _ in range(args.buffer_kb * 1024 // 5))
+    paste = paste[:args.buffer_kb * 1024]
+    buffers = [
+        ("/pro", "/pro"),
+        ("/switch Chat1", "/switch Chat1"),
+        ("question prefix", "how do"),
+        (f"{args.buffer_kb} KB text", paste),
+        (f"{args.buffer_kb} KB /command", "/title " + paste),
+    ]
+    print(f"index of {len(_COMMANDS)} commands, {args.sessions} sessions and "
+          f"{args.questions} questions built in {build * 1000:.1f} ms")
+    for name, text in buffers:
+        old = keystroke_time(legacy, text, args.repeat)
+        new = keystroke_time(index, text, args.repeat)
+        print(f"{name:18} legacy {old * 1e6:9.1f} us   index {new * 1e6:9.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Compare the memory of a long session history.
+
+Builds the same history of `--messages` messages as a plain list of
+`ChatMessage` (the previous layout) and as `chatapi.MessageHistory`, with
+token counts filled in as a chat session does, and reports the bytes
+tracemalloc attributes to each and the time to build the query messages.
+
+    python benchmarks/bench_history_memory.py --messages 100000
+"""
+
+
+import gc
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+import typing as t
+
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, MessageHistory
+
+
+_WORDS = (
+    "the request stream token buffer render terminal socket latency client "
+    "server python markdown block paragraph chunk answer model context cache"
+).split()
+_MODEL = "gpt-3.5-turbo"
+
+
+def texts(count: int, seed: int = 20230401) -> t.Iterator[t.Tuple[str, ChatMessageType]]:
+    """Fresh message texts, as they would come from the API or the store."""
+    rnd = random.Random(seed)
+    for i in range(count):
+        role = ChatMessageType.USER if i % 2 == 0 else ChatMessageType.ASSISTANT
+        words = rnd.randint(5, 30) if role == ChatMessageType.USER else rnd.randint(20, 120)
+        yield " ".join(rnd.choice(_WORDS) for _ in range(words)), role
+
+
+def build_list(source: t.Iterable[t.Tuple[str, ChatMessageType]]) -> t.List[ChatMessage]:
+    histories = []
+    for i, (text, role) in enumerate(source):
+        message = ChatMessage(text, role, 1680000000 + i)
+        message.count_tokens(_MODEL)
+        histories.append(message)
+    return histories
+
+
+def build_history(source: t.Iterable[t.Tuple[str, ChatMessageType]]) -> MessageHistory:
+    histories = MessageHistory()
+    for i, (text, role) in enumerate(source):
+        message = ChatMessage(text, role, 1680000000 + i)
+        message.count_tokens(_MODEL)
+        histories.append(message)
+    return histories
+
+
+def measure(build: t.Callable[[], t.Any]) -> t.Tuple[t.Any, int, int]:
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    args = parser.parse_args()
+
+    text_bytes = sum(len(text.encode("utf-8")) for text, _ in texts(args.messages))
+    print(f"{args.messages} messages, {text_bytes / 2**20:.1f} MiB of text")
+
+    as_list, list_bytes, list_peak = measure(lambda: build_list(texts(args.messages)))
+    start = time.perf_counter()
+    for message in as_list:
+        message.to_message_json()
+    list_query = time.perf_counter() - start
+    del as_list
+
+    history, history_bytes, history_peak = measure(lambda: build_history(texts(args.messages)))
+    start = time.perf_counter()
+    for i in range(len(history)):
+        history.message_json(i)
+    history_query = time.perf_counter() - start
+
+    print(f"list of ChatMessage: {list_bytes / 2**20:7.1f} MiB (peak {list_peak / 2**20:.1f}), "
+          f"query messages {list_query * 1000:.0f} ms")
+    print(f"MessageHistory:      {history_bytes / 2**20:7.1f} MiB (peak {history_peak / 2**20:.1f}), "
+          f"query messages {history_query * 1000:.0f} ms")
+    print(f"MessageHistory uses {history_bytes / list_bytes * 100:.0f}% of the list, "
+          f"{(history_bytes - text_bytes) / args.messages:.1f} bytes per message over the text")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
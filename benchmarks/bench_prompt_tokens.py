@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Measure input tokens per turn of a chat with a long prompt.
+
+Replays a conversation with the `check-grammar` prompt and counts the query
+tokens of every turn for the legacy layout (prompt prefixed to every user
+message) and the current one (prompt sent once as a system message).  Also
+reports how many tokens each query shares with the previous one as a prefix,
+which is what upstream prompt caching can reuse.
+
+    python benchmarks/bench_prompt_tokens.py --turns 20
+"""
+
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+import typing as t
+
+
+_WORDS = (
+    "the request stream token buffer render terminal socket latency client "
+    "server python markdown block paragraph chunk answer model context cache"
+).split()
+
+
+def _fake_home() -> str:
+    home = tempfile.mkdtemp(prefix="chatgpt-cli-bench-")
+    config_dir = os.path.join(home, ".config", "chatgpt-cli")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "config.toml"), "w", encoding="utf-8") as f:
+        # no truncation, so both layouts send the whole history
+        f.write("[API]\nOPENAI_API_KEY = sk-bench\nCONTEXT_WINDOW = 10000000\n")
+    return home
+
+
+def _sentence(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def query_tokens(messages: t.List[t.Dict[str, str]], model: str) -> t.List[int]:
+    from chatgpt_cli import tokens
+    return [tokens.count_tokens(m["content"], model) + tokens.MESSAGE_OVERHEAD
+            for m in messages]
+
+
+def shared_prefix(previous: t.List[t.Dict[str, str]], current: t.List[t.Dict[str, str]],
+                  costs: t.List[int]) -> int:
+    shared = 0
+    for old, new, cost in zip(previous, current, costs):
+        if old != new:
+            break
+        shared += cost
+    return shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--prompt", default="check-grammar")
+    args = parser.parse_args()
+
+    home = _fake_home()
+    os.environ["HOME"] = home
+    os.environ["USERPROFILE"] = home
+
+    from chatgpt_cli import config, tokens
+    from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession
+    config.init()
+    model = config.get_config().get('API', 'CHATGPT_MODEL')
+    prompt_text = config.get_prompt_message(args.prompt)
+    if prompt_text is None:
+        parser.error(f"unknown prompt {args.prompt}")
+
+    rnd = random.Random(20230401)
+    session = ChatSession("bench", args.prompt)
+    session.no_context = False
+    legacy : t.List[t.Dict[str, str]] = []
+    previous : t.Dict[str, t.List[t.Dict[str, str]]] = {"legacy": [], "system": []}
+    totals = {"legacy": 0, "system": 0}
+    cached = {"legacy": 0, "system": 0}
+
+    print(f"prompt {args.prompt!r}: {tokens.count_tokens(prompt_text, model)} tokens")
+    print(f"{'turn':>4} {'legacy':>8} {'system':>8} {'saved':>7} "
+          f"{'legacy prefix':>14} {'system prefix':>14}")
+    for turn in range(1, args.turns + 1):
+        question = _sentence(rnd, rnd.randint(10, 30))
+        answer = " ".join(_sentence(rnd, rnd.randint(8, 20)) for _ in range(rnd.randint(3, 8)))
+
+        legacy.append({"role": "user", "content": f"{prompt_text}\n\n{question}"})
+        session.add_message(ChatMessage(question, ChatMessageType.USER))
+        queries = {"legacy": list(legacy), "system": session.generate_query_messages(model)}
+        row = {}
+        for layout, messages in queries.items():
+            costs = query_tokens(messages, model)
+            prefix = shared_prefix(previous[layout], messages, costs)
+            row[layout] = (sum(costs) + tokens.REPLY_OVERHEAD, prefix)
+            totals[layout] += row[layout][0]
+            cached[layout] += prefix
+            previous[layout] = messages
+        print(f"{turn:>4} {row['legacy'][0]:>8} {row['system'][0]:>8} "
+              f"{row['legacy'][0] - row['system'][0]:>7} "
+              f"{row['legacy'][1]:>14} {row['system'][1]:>14}")
+
+        legacy.append({"role": "assistant", "content": answer})
+        session.add_message(ChatMessage(answer, ChatMessageType.ASSISTANT))
+
+    saved = totals["legacy"] - totals["system"]
+    print(f"total input tokens: legacy {totals['legacy']}, system {totals['system']} "
+          f"({saved / totals['legacy'] * 100:.1f}% fewer)")
+    print(f"shared prefix: legacy {cached['legacy'] / totals['legacy'] * 100:.1f}%, "
+          f"system {cached['system'] / totals['system'] * 100:.1f}% of input tokens")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
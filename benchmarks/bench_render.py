@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Benchmark streamed Markdown rendering of a long answer.
+
+Streams a recorded-style answer of ~20k tokens through the legacy renderer
+(re-join + full Markdown per chunk) and through `render.LiveMarkdown`, and
+reports CPU time and per-chunk render time for both.  The legacy renderer is
+quadratic, so by default it only replays the first `--legacy-chunks` chunks.
+
+    python benchmarks/bench_render.py --tokens 20000
+"""
+
+
+import io
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+import typing as t
+
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+
+from chatgpt_cli import render
+
+
+_WORDS = (
+    "the request stream token buffer render terminal socket latency client "
+    "server python markdown block paragraph chunk answer model context cache "
+    "session prompt history config output input value result error retry"
+).split()
+
+
+def recorded_answer(tokens: int, seed: int = 20230401) -> str:
+    """Build a deterministic answer shaped like a long ChatGPT reply."""
+    rnd = random.Random(seed)
+    parts : t.List[str] = []
+    count = 0
+    section = 0
+    while count < tokens:
+        kind = rnd.random()
+        if kind < 0.08:
+            section += 1
+            parts.append(f"## Section {section}")
+            count += 3
+        elif kind < 0.55:
+            sentences = []
+            for _ in range(rnd.randint(2, 5)):
+                words = [rnd.choice(_WORDS) for _ in range(rnd.randint(6, 18))]
+                sentences.append(" ".join(words).capitalize() + ".")
+                count += len(words) + 1
+            parts.append(" ".join(sentences))
+        elif kind < 0.8:
+            items = []
+            for _ in range(rnd.randint(3, 7)):
+                words = [rnd.choice(_WORDS) for _ in range(rnd.randint(3, 10))]
+                items.append("- " + " ".join(words))
+                count += len(words) + 1
+            parts.append("\n".join(items))
+        else:
+            lines = ["```python"]
+            for i in range(rnd.randint(4, 12)):
+                name = rnd.choice(_WORDS)
+                lines.append(f"    {name}_{i} = compute({name!r}, {rnd.randint(0, 99)})")
+                count += 9
+            lines.append("```")
+            parts.append("\n".join(lines))
+    return "\n\n".join(parts) + "\n"
+
+
+def split_chunks(answer: str) -> t.List[str]:
+    """Split the answer into token-sized deltas like the streaming API does."""
+    return re.findall(r"\s*\S+|\s+", answer)
+
+
+def _new_console() -> Console:
+    return Console(file=io.StringIO(), force_terminal=True, width=100,
+                   color_system="truecolor")
+
+
+def run_legacy(chunks: t.List[str]) -> t.List[float]:
+    timings = []
+    output : t.List[str] = []
+    console = _new_console()
+    with Live(console=console) as live:
+        for chunk in chunks:
+            start = time.perf_counter()
+            output.append(chunk)
+            live.update(Markdown("".join(output)), refresh=True)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_incremental(chunks: t.List[str], refresh_rate: float = 0) -> t.List[float]:
+    timings = []
+    console = _new_console()
+    with render.LiveMarkdown(console, refresh_rate=refresh_rate) as live:
+        for chunk in chunks:
+            start = time.perf_counter()
+            live.feed(chunk)
+            timings.append(time.perf_counter() - start)
+    if refresh_rate:
+        print(f"scheduler: {live.scheduler.stats}")
+    return timings
+
+
+def report(name: str, timings: t.List[float], cpu: float):
+    ordered = sorted(timings)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:12} chunks={len(timings):6d} cpu={cpu:8.3f}s "
+          f"mean={statistics.mean(timings) * 1000:7.3f}ms "
+          f"p95={p95 * 1000:7.3f}ms max={ordered[-1] * 1000:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--legacy-chunks", type=int, default=2000,
+                        help="Chunks replayed through the legacy renderer, 0 for all.")
+    parser.add_argument("--refresh-rate", type=float, default=0,
+                        help="Frame rate cap for the incremental renderer, 0 for none.")
+    parser.add_argument("--skip-legacy", action="store_true",
+                        help="Only run the incremental renderer.")
+    args = parser.parse_args()
+
+    chunks = split_chunks(recorded_answer(args.tokens))
+    print(f"answer: {sum(len(c) for c in chunks)} chars, {len(chunks)} chunks")
+    cpu_start = time.process_time()
+    timings = run_incremental(chunks, args.refresh_rate)
+    report("incremental", timings, time.process_time() - cpu_start)
+    if args.skip_legacy:
+        return 0
+    legacy_chunks = chunks[:args.legacy_chunks] if args.legacy_chunks else chunks
+    cpu_start = time.process_time()
+    timings = run_legacy(legacy_chunks)
+    report("legacy", timings, time.process_time() - cpu_start)
+    # same prefix through the incremental renderer for a like-for-like figure
+    cpu_start = time.process_time()
+    timings = run_incremental(legacy_chunks, args.refresh_rate)
+    report("incremental", timings, time.process_time() - cpu_start)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
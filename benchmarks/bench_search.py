@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Time `/search` queries over a large session store.
+
+Fills a temporary store with `--messages` messages of Zipf-distributed words
+in sessions of 50 messages, indexed by the same triggers as a chat session's
+messages, then reports the median time of full-text queries for rare,
+common, combined and prefix terms next to a LIKE scan of the messages.
+
+    python benchmarks/bench_search.py --messages 1000000
+"""
+
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import itertools
+import tempfile
+import statistics
+import typing as t
+
+from chatgpt_cli.store import SessionStore
+
+
+_VOCABULARY = 20000
+_SESSION_MESSAGES = 50
+_QUERIES : t.List[t.Tuple[str, t.List[str]]] = [
+    ("rare term", ["w19000"]),
+    ("mid term", ["w500"]),
+    ("common term", ["w1"]),
+    ("two terms", ["w50", "w60"]),
+    ("prefix", ["w1234*"]),
+]
+
+
+def fill(store: SessionStore, count: int, seed: int = 20230401):
+    rnd = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, _VOCABULARY + 1)))
+    vocabulary = [f"w{rank}" for rank in range(1, _VOCABULARY + 1)]
+    db = store._db  # pylint: disable=protected-access
+    with db:
+        for session_id in range(1, count // _SESSION_MESSAGES + 2):
+            db.execute("INSERT INTO sessions (id, name, prompt, no_context, created, updated) "
+                       "VALUES (?, ?, 'default', 0, 0, 0)", (session_id, f"Chat{session_id}"))
+    for start in range(0, count, 10000):
+        rows = []
+        for i in range(start, min(count, start + 10000)):
+            words = rnd.choices(vocabulary, cum_weights=cum_weights, k=rnd.randint(5, 60))
+            rows.append((i // _SESSION_MESSAGES + 1, "user" if i % 2 == 0 else "assistant",
+                         " ".join(words), 1680000000 + i))
+        with db:
+            db.executemany("INSERT INTO messages (session_id, role, content, timestamp) "
+                           "VALUES (?, ?, ?, ?)", rows)
+
+
+def timed(fn: t.Callable[[], t.Any], repeat: int) -> t.Tuple[float, t.Any]:
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    store = SessionStore(os.path.join(tmp_dir, "sessions.db"))
+    try:
+        start = time.perf_counter()
+        fill(store, args.messages)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(store.path) + os.path.getsize(store.path + "-wal")
+        print(f"{args.messages} messages indexed in {elapsed:.1f}s, "
+              f"{size / 2**20:.0f} MiB on disk")
+        for name, terms in _QUERIES:
+            fts, hits = timed(lambda terms=terms: store.search(terms), args.repeat)
+            scan, _ = timed(lambda terms=terms: store._scan(terms, 20),  # pylint: disable=protected-access
+                            1)
+            print(f"{name:12} {' '.join(terms):12} {len(hits):3} hits  "
+                  f"fts {fts * 1000:7.1f} ms  scan {scan * 1000:7.1f} ms")
+    finally:
+        store.close()
+        shutil.rmtree(tmp_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
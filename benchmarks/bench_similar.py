@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Time near-duplicate lookups in a large `similar.SimilarityIndex`.
+
+Fills a temporary index with `--entries` questions of 5 to 20
+Zipf-distributed pseudo-words, then looks up questions differing from stored ones
+only in case, punctuation and spacing, questions with one word replaced,
+and unseen questions, reporting the median lookup time and how many found
+a question at least `--threshold` similar.
+
+    python benchmarks/bench_similar.py --entries 1000000
+"""
+
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import itertools
+import tempfile
+import statistics
+import typing as t
+
+from chatgpt_cli.similar import SimilarityIndex
+
+
+_VOCABULARY = 20000
+_SCOPE = "bench"
+
+
+class Questions:
+
+    def __init__(self, seed: int):
+        self.rnd = random.Random(seed)
+        self.cum_weights = list(itertools.accumulate(
+            1.0 / rank for rank in range(1, _VOCABULARY + 1)))
+        # pseudo-words, so that unrelated questions share few shingles
+        words = random.Random(0)
+        self.vocabulary = ["".join(words.choice("abcdefghijklmnopqrstuvwxyz")
+                                   for _ in range(words.randint(2, 9)))
+                           for _ in range(_VOCABULARY)]
+
+    def words(self) -> t.List[str]:
+        return self.rnd.choices(self.vocabulary, cum_weights=self.cum_weights,
+                                k=self.rnd.randint(5, 20))
+
+    def reformat(self, words: t.List[str]) -> str:
+        """The same question with other case, punctuation and spacing."""
+        text = "  ".join(word.upper() if self.rnd.random() < 0.3 else word for word in words)
+        return text[0].upper() + text[1:] + self.rnd.choice(["?", "??", " ?", "!", ""])
+
+    def replace_word(self, words: t.List[str]) -> str:
+        words = list(words)
+        words[self.rnd.randrange(len(words))] = self.rnd.choice(self.vocabulary)
+        return " ".join(words)
+
+
+def lookup_times(index: SimilarityIndex, questions: t.List[str],
+                 threshold: float) -> t.Tuple[float, int]:
+    times = []
+    found = 0
+    for question in questions:
+        start = time.perf_counter()
+        hits = index.lookup(_SCOPE, question, threshold)
+        times.append(time.perf_counter() - start)
+        found += bool(hits)
+    return statistics.median(times), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        index = SimilarityIndex(os.path.join(tmp_dir, "similar.db"), max_entries=0)
+        source = Questions(20230401)
+        stored : t.List[t.List[str]] = []
+        start = time.perf_counter()
+        for batch in range(0, args.entries, 10000):
+            entries = []
+            for i in range(batch, min(args.entries, batch + 10000)):
+                words = source.words()
+                if len(stored) < args.queries:
+                    stored.append(words)
+                entries.append((" ".join(words), f"key{i}"))
+            index.add_many(_SCOPE, entries)
+        build = time.perf_counter() - start
+        size = os.path.getsize(index.path)
+        print(f"{args.entries} questions indexed in {build:.1f}s, "
+              f"{size / 1024 / 1024:.0f} MB")
+
+        unseen = Questions(7)
+        queries = [
+            ("reformatted", [source.reformat(words) for words in stored]),
+            ("one word replaced", [source.replace_word(words) for words in stored]),
+            ("unseen", [" ".join(unseen.words()) for _ in range(args.queries)]),
+        ]
+        for name, questions in queries:
+            median, found = lookup_times(index, questions, args.threshold)
+            print(f"{name:18} median {median * 1e6:7.1f} us, "
+                  f"{found}/{len(questions)} found at {args.threshold}")
+        index.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Startup budget check for the chatgpt-cli entry point.
+
+Measures the `python -X importtime` cumulative time of `chatgpt_cli.main` and
+the wall-clock time of `chatgpt-cli ask --help`, checks that the heavy
+dependencies stay unimported, and exits non-zero when a budget is exceeded.
+
+    python benchmarks/bench_startup.py --import-budget-ms 150 --help-budget-ms 400
+"""
+
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import typing as t
+
+
+HEAVY_MODULES = ["openai", "prompt_toolkit", "pkg_resources", "rich.markdown"]
+
+_ASK_HELP = """\
+import json, sys
+sys.argv = ["chatgpt-cli", "ask", "--help"]
+from chatgpt_cli.main import main
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def _fake_home() -> str:
+    """A home directory with a config file, so `config.init` never prompts."""
+    home = tempfile.mkdtemp(prefix="chatgpt-cli-bench-")
+    for config_dir in (os.path.join(home, ".config", "chatgpt-cli"),
+                       os.path.join(home, "AppData", "Local", "chatgpt-cli")):
+        os.makedirs(config_dir)
+        with open(os.path.join(config_dir, "config.toml"), "w", encoding="utf-8") as f:
+            f.write("[API]\nOPENAI_API_KEY = sk-bench\n")
+    return home
+
+
+def _env(home: str) -> t.Dict[str, str]:
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["USERPROFILE"] = home
+    return env
+
+
+def import_time_us(env: t.Dict[str, str]) -> int:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import chatgpt_cli.main"],
+        env=env, capture_output=True, text=True, check=True)
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*chatgpt_cli\.main$", line)
+        if match:
+            return int(match.group(1))
+    raise RuntimeError("chatgpt_cli.main not found in -X importtime output")
+
+
+def ask_help(env: t.Dict[str, str]) -> t.Tuple[float, t.List[str]]:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _ASK_HELP],
+                          env=env, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    modules = json.loads(proc.stderr.strip().splitlines()[-1])
+    return elapsed, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--import-budget-ms", type=float, default=150)
+    parser.add_argument("--help-budget-ms", type=float, default=400)
+    args = parser.parse_args()
+
+    env = _env(_fake_home())
+    import_ms = statistics.median(
+        import_time_us(env) / 1000 for _ in range(args.runs))
+    help_runs = [ask_help(env) for _ in range(args.runs)]
+    help_ms = statistics.median(elapsed for elapsed, _ in help_runs) * 1000
+    loaded = [m for m in HEAVY_MODULES if m in help_runs[0][1]]
+
+    print(f"import chatgpt_cli.main: {import_ms:8.1f}ms (budget {args.import_budget_ms}ms)")
+    print(f"ask --help wall-clock:   {help_ms:8.1f}ms (budget {args.help_budget_ms}ms)")
+    print(f"heavy modules loaded:    {', '.join(loaded) or 'none'}")
+
+    failed = False
+    if import_ms > args.import_budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if help_ms > args.help_budget_ms:
+        print("FAIL: ask --help over budget")
+        failed = True
+    if loaded:
+        print("FAIL: ask --help imports heavy modules")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Offline end-to-end benchmark suite.
+
+Starts `mock_server.MockServer` with a long Markdown answer and measures:
+
+* startup: import time of `chatgpt_cli.main` and `ask --help` wall-clock
+* ask: `ChatSessionManager.ask` in process, rendering into an off-screen
+  console: time to first token, tokens/s, render overhead per chunk (against
+  reading the same stream without rendering) and peak RSS
+* commands: `chatgpt-cli ask` and a one question `chatgpt-cli chat` as
+  subprocesses: wall-clock and peak RSS
+
+Results are written as JSON; `--compare` prints the change against an
+earlier result file and exits non-zero on regressions over `--threshold`.
+
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --compare bench.json
+"""
+
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import typing as t
+
+from bench_render import recorded_answer
+from bench_startup import ask_help, import_time_us
+from mock_server import MockOptions, MockServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+
+# metrics where a larger value is better, every other one is a cost
+HIGHER_IS_BETTER = {"ask_tokens_per_s"}
+
+_RUN_CLI = "import sys; from chatgpt_cli.main import main; sys.argv[0] = 'chatgpt-cli'; main()"
+_QUESTION = "Explain the streaming renderer."
+
+
+def _fake_home(api_base: str) -> str:
+    home = tempfile.mkdtemp(prefix="chatgpt-cli-bench-")
+    for config_dir in (os.path.join(home, ".config", "chatgpt-cli"),
+                       os.path.join(home, "AppData", "Local", "chatgpt-cli")):
+        os.makedirs(config_dir)
+        with open(os.path.join(config_dir, "config.toml"), "w", encoding="utf-8") as f:
+            f.write(f"[API]\nOPENAI_API_KEY = sk-bench\nOPENAI_API_BASE = {api_base}\n")
+    return home
+
+
+def _env(home: str) -> t.Dict[str, str]:
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["USERPROFILE"] = home
+    return env
+
+
+def _max_rss_mib(rusage: t.Any) -> float:
+    # kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return rusage.ru_maxrss * scale / 2**20
+
+
+def run_command(args: t.List[str], env: t.Dict[str, str],
+                stdin: bytes = b"") -> t.Tuple[float, t.Optional[float]]:
+    """Wall-clock seconds and peak RSS (MiB, None if unknown) of a CLI run."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", _RUN_CLI] + args, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    assert proc.stdin is not None
+    proc.stdin.write(stdin)
+    proc.stdin.close()
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return time.perf_counter() - start, None
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    if proc.returncode != 0:
+        raise RuntimeError(f"chatgpt-cli {' '.join(args)} exited with {proc.returncode}")
+    return elapsed, _max_rss_mib(rusage)
+
+
+def read_stream(session_mgr: t.Any) -> t.Tuple[float, float, int]:
+    """Time to first token, total seconds and chunks of an unrendered stream."""
+    from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession
+    session = ChatSession("bench", "assist")
+    session.add_message(ChatMessage(_QUESTION, ChatMessageType.USER))
+    start = time.perf_counter()
+    response = session_mgr._new_chat_completion(  # pylint: disable=protected-access
+        stream=True, session=session)
+    first = None
+    chunks = 0
+    for chunk in response:
+        if chunk["choices"][0]["delta"].get("content"):
+            chunks += 1
+            if first is None:
+                first = time.perf_counter() - start
+    return first or 0.0, time.perf_counter() - start, chunks
+
+
+def measure_ask(session_mgr: t.Any, runs: int, tokens: int) -> t.Dict[str, float]:
+    from rich.console import Console
+    ttfts, raw_totals, ask_totals = [], [], []
+    chunks = 0
+    failures = 0
+    for i in range(runs):
+        try:
+            ttft, total, chunks = read_stream(session_mgr)
+            ttfts.append(ttft)
+            raw_totals.append(total)
+            console = Console(file=io.StringIO(), force_terminal=True, width=100,
+                              color_system="truecolor")
+            session_mgr.create(f"bench-{i}")
+            start = time.perf_counter()
+            session_mgr.ask(_QUESTION, stream=True, console=console)
+            ask_totals.append(time.perf_counter() - start)
+        except Exception:  # pylint: disable=broad-exception-caught
+            failures += 1
+    metrics = {"ask_failures": float(failures)}
+    if not ask_totals:
+        return metrics
+    raw = statistics.median(raw_totals)
+    ttft = statistics.median(ttfts)
+    metrics.update(
+        ask_ttft_ms=ttft * 1000,
+        ask_tokens_per_s=tokens / max(raw - ttft, 1e-9),
+        ask_total_ms=statistics.median(ask_totals) * 1000,
+        ask_render_us_per_chunk=max(0.0, statistics.median(ask_totals) - raw)
+        / max(chunks, 1) * 1e6,
+    )
+    if resource is not None:
+        metrics["ask_peak_rss_mib"] = _max_rss_mib(resource.getrusage(resource.RUSAGE_SELF))
+    return metrics
+
+
+def measure_commands(env: t.Dict[str, str], runs: int) -> t.Dict[str, float]:
+    metrics : t.Dict[str, float] = {}
+    commands = {
+        "cmd_ask": (["ask", "--no-cache", _QUESTION], b""),
+        "cmd_chat": (["chat"], _QUESTION.encode("utf-8") + b"\n"),
+    }
+    for name, (args, stdin) in commands.items():
+        results = [run_command(args, env, stdin) for _ in range(runs)]
+        metrics[f"{name}_ms"] = statistics.median(r[0] for r in results) * 1000
+        rss = [r[1] for r in results if r[1] is not None]
+        if rss:
+            metrics[f"{name}_peak_rss_mib"] = max(rss)
+    return metrics
+
+
+def git_commit() -> t.Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: t.Dict[str, float], new: t.Dict[str, float], threshold: float) -> bool:
+    """Print both results side by side, True when a metric regressed."""
+    regressed = False
+    print(f"{'metric':28} {'before':>10} {'after':>10} {'change':>8}")
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name], new[name]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:28} {before:10.2f} {after:10.2f} {change:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=3000,
+                        help="approximate tokens of the streamed answer")
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.0,
+                        help="keep 0 to measure the client, not the server pace")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--skip-commands", action="store_true",
+                        help="skip the startup and subprocess measurements")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="earlier JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change of a metric counted as a regression")
+    args = parser.parse_args()
+
+    server = MockServer(options=MockOptions(
+        ttft=args.ttft, token_delay=args.token_delay, chunk_tokens=args.chunk_tokens,
+        answer=recorded_answer(args.tokens), error_rate=args.error_rate,
+        disconnect_rate=args.disconnect_rate)).start()
+    tokens = len(server.words)
+    env = _env(_fake_home(server.api_base))
+    os.environ.update(HOME=env["HOME"], USERPROFILE=env["USERPROFILE"])
+
+    metrics : t.Dict[str, float] = {}
+    if not args.skip_commands:
+        metrics["startup_import_ms"] = statistics.median(
+            import_time_us(env) / 1000 for _ in range(args.runs))
+        metrics["startup_ask_help_ms"] = statistics.median(
+            ask_help(env)[0] for _ in range(args.runs)) * 1000
+
+    from chatgpt_cli import chatapi, config
+    config.init()
+    chatapi.init()
+    metrics.update(measure_ask(chatapi.get_session_manager(), args.runs, tokens))
+    if not args.skip_commands:
+        metrics.update(measure_commands(env, args.runs))
+    server.shutdown()
+
+    result = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "options": vars(args),
+        "metrics": {name: round(value, 3) for name, value in metrics.items()},
+    }
+    for name, value in result["metrics"].items():
+        print(f"{name:28} {value:10.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        print(f"\ncompared with {old.get('commit') or args.compare}:")
+        if compare(old["metrics"], result["metrics"], args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Benchmark time to first token against the local mock server.
+
+Runs the streamed completion path of chatgpt-cli against
+`mock_server.MockServer` and reports the median time to the first content
+delta for three cases:
+
+* cold: the connection pool is emptied before every request
+* reused: the request reuses the connection of the previous one
+* prewarmed: the pool is emptied, then `transport.prewarm` connects while
+  the "user types" (`--think`), as the chat prompt does
+
+    python benchmarks/bench_ttft.py --runs 10 --connect-delay 0.15
+"""
+
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import typing as t
+
+from mock_server import MockOptions, MockServer
+
+
+def _fake_home(api_base: str) -> str:
+    home = tempfile.mkdtemp(prefix="chatgpt-cli-bench-")
+    config_dir = os.path.join(home, ".config", "chatgpt-cli")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "config.toml"), "w", encoding="utf-8") as f:
+        f.write(f"[API]\nOPENAI_API_KEY = sk-bench\nOPENAI_API_BASE = {api_base}\n")
+    return home
+
+
+def first_token_latency(session_mgr: t.Any) -> float:
+    from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession
+    session = ChatSession("bench", "assist")
+    session.add_message(ChatMessage("ping", ChatMessageType.USER))
+    start = time.perf_counter()
+    response = session_mgr._new_chat_completion(  # pylint: disable=protected-access
+        stream=True, session=session)
+    latency = None
+    for chunk in response:
+        if latency is None and chunk["choices"][0]["delta"].get("content"):
+            latency = time.perf_counter() - start
+    assert latency is not None
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--ttft", type=float, default=0.05,
+                        help="server side seconds before the first token")
+    parser.add_argument("--connect-delay", type=float, default=0.15,
+                        help="seconds added to every new connection, a TLS handshake stand-in")
+    parser.add_argument("--think", type=float, default=0.5,
+                        help="seconds between prompt and question in the prewarmed case")
+    args = parser.parse_args()
+
+    server = MockServer(options=MockOptions(
+        ttft=args.ttft, tokens=5, connect_delay=args.connect_delay)).start()
+    home = _fake_home(server.api_base)
+    os.environ["HOME"] = home
+    os.environ["USERPROFILE"] = home
+
+    from chatgpt_cli import chatapi, config, transport
+    config.init()
+    chatapi.init()
+    session_mgr = chatapi.get_session_manager()
+    pool = transport.get_session()
+
+    results : t.Dict[str, t.List[float]] = {"cold": [], "reused": [], "prewarmed": []}
+    first_token_latency(session_mgr)  # import openai outside of the measurements
+    for _ in range(args.runs):
+        pool.shutdown()
+        results["cold"].append(first_token_latency(session_mgr))
+        results["reused"].append(first_token_latency(session_mgr))
+        pool.shutdown()
+        thread = transport.prewarm(lambda: chatapi.get_openai().api_base)
+        time.sleep(args.think)
+        if thread is not None:
+            thread.join()
+        results["prewarmed"].append(first_token_latency(session_mgr))
+
+    print(f"{args.runs} runs, server ttft {args.ttft * 1000:.0f} ms, "
+          f"connect delay {args.connect_delay * 1000:.0f} ms, "
+          f"{server.connections} connections for {server.requests} requests")
+    for name, values in results.items():
+        print(f"{name:>10}: ttft median {statistics.median(values) * 1000:7.1f} ms  "
+              f"max {max(values) * 1000:7.1f} ms")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
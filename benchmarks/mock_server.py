@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers `POST /v1/chat/completions` with a canned reply, streamed as SSE when
+the request asks for it, over HTTP/1.1 keep-alive.  Every new connection
+sleeps `connect_delay` first, standing in for the TCP and TLS handshakes of
+the real API, so connection reuse shows up in the measurements.
+
+Errors can be injected: `error_rate` of the requests get an `error_status`
+response in the OpenAI error format, and `disconnect_rate` of the streams
+are cut after half of the answer.
+
+    python benchmarks/mock_server.py --port 8765 --ttft 0.2 --connect-delay 0.15
+"""
+
+
+import re
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_ERROR_TYPES = {
+    429: "requests",
+    500: "server_error",
+    503: "server_error",
+}
+
+
+class MockOptions(t.NamedTuple):
+    ttft: float = 0.0
+    # delay between SSE events, each carrying `chunk_tokens` tokens
+    token_delay: float = 0.0
+    chunk_tokens: int = 1
+    # answer of `tokens` words, or `answer` split into words when given
+    tokens: int = 20
+    answer: t.Optional[str] = None
+    connect_delay: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    disconnect_rate: float = 0.0
+    seed: int = 0
+
+
+def answer_tokens(options: MockOptions) -> t.List[str]:
+    if options.answer is not None:
+        return re.findall(r"\s*\S+\s*", options.answer) or [options.answer]
+    return [f"word{i} " for i in range(options.tokens)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockServer"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count_connection()
+        if self.server.options.connect_delay:
+            time.sleep(self.server.options.connect_delay)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        request = json.loads(body or b"{}")
+        options = self.server.options
+        fail, disconnect = self.server.roll()
+        time.sleep(options.ttft)
+        if fail:
+            status = options.error_status
+            self._send_json(status, {"error": {
+                "message": f"Injected error {status}",
+                "type": _ERROR_TYPES.get(status, "server_error"),
+                "param": None,
+                "code": None,
+            }})
+            return
+        words = self.server.words
+        chunk_tokens = max(1, options.chunk_tokens)
+        chunks = ["".join(words[i:i + chunk_tokens])
+                  for i in range(0, len(words), chunk_tokens)]
+        if not request.get("stream"):
+            time.sleep(options.token_delay * len(chunks))
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": request.get("model", "mock"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(words)}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(words),
+                          "total_tokens": 10 + len(words)},
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._send_event({"role": "assistant"}, request)
+        for i, chunk in enumerate(chunks):
+            if disconnect and i == len(chunks) // 2:
+                # no terminating chunk, the client sees a broken stream
+                self.close_connection = True
+                return
+            self._send_event({"content": chunk}, request)
+            if options.token_delay:
+                time.sleep(options.token_delay)
+        self._send_event({}, request, finish_reason="stop")
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_event(self, delta: t.Dict[str, str], request: t.Dict[str, t.Any],
+                    finish_reason: t.Optional[str] = None):
+        event = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self._send_chunk(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: t.Dict[str, t.Any]):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, options: MockOptions = MockOptions()):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.options = options
+        self.words = answer_tokens(options)
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.disconnects = 0
+        self._counter_lock = threading.Lock()
+        self._random = random.Random(options.seed)
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def count_connection(self):
+        with self._counter_lock:
+            self.connections += 1
+
+    def roll(self) -> t.Tuple[bool, bool]:
+        """Count a request and decide whether it fails or gets cut."""
+        with self._counter_lock:
+            self.requests += 1
+            fail = self._random.random() < self.options.error_rate
+            disconnect = not fail and self._random.random() < self.options.disconnect_rate
+            self.errors += fail
+            self.disconnects += disconnect
+            return fail, disconnect
+
+    def start(self) -> "MockServer":
+        threading.Thread(target=self.serve_forever, daemon=True, name="mock-server").start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2,
+                        help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01,
+                        help="seconds between streamed tokens")
+    parser.add_argument("--chunk-tokens", type=int, default=1,
+                        help="tokens per streamed event")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--answer-file", help="answer with the text of this file")
+    parser.add_argument("--connect-delay", type=float, default=0.15,
+                        help="seconds added to every new connection")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="fraction of streams cut halfway")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    answer = None
+    if args.answer_file:
+        with open(args.answer_file, "r", encoding="utf-8") as f:
+            answer = f.read()
+    server = MockServer(args.port, MockOptions(
+        ttft=args.ttft, token_delay=args.token_delay, chunk_tokens=args.chunk_tokens,
+        tokens=args.tokens, answer=answer, connect_delay=args.connect_delay,
+        error_rate=args.error_rate, error_status=args.error_status,
+        disconnect_rate=args.disconnect_rate, seed=args.seed))
+    print(f"serving on {server.api_base}, set [API] OPENAI_API_BASE to it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
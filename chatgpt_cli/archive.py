@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Session archives, to move and back up saved sessions.
+
+An archive is a header, compressed blocks of records, an index block and a
+trailer::
+
+    header   b"CGCA" version:u8
+    block    kind:u8 codec:u8 raw_size:u32 size:u32 crc32:u32, `size` bytes
+    ...
+    index    a block of kind "I", the JSON list of `ArchivedSession`
+    trailer  index offset:u64 b"CGCA"
+
+The uncompressed data of a block is records, each a u32 size, a kind byte
+(``S`` a session, ``M`` a message) and a JSON body.  A session record is
+followed by the records of its messages, which may run over several
+blocks.  Blocks are compressed on their own, so that the index can point to
+the block and record a session starts at and a session is read without
+decompressing the others.  Both ways stream: a writer holds one block, and
+an archive can be read in order from a pipe, without its index.
+"""
+
+
+import io
+import gzip
+import json
+import zlib
+import struct
+import itertools
+import typing as t
+
+import attrs
+
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession
+from chatgpt_cli.error import CommandError
+
+
+MAGIC = b"CGCA"
+VERSION = 1
+CODECS = ("gzip", "zstd")
+_CODEC_IDS = {"gzip": 1, "zstd": 2}
+_HEADER = struct.Struct("<4sB")
+_BLOCK = struct.Struct("<BBIII")
+_RECORD = struct.Struct("<I")
+_TRAILER = struct.Struct("<Q4s")
+_DATA_BLOCK = ord("D")
+_INDEX_BLOCK = ord("I")
+_SESSION_RECORD = b"S"
+_MESSAGE_RECORD = b"M"
+# uncompressed bytes of a block, a larger record makes a larger block
+BLOCK_SIZE = 1 << 20
+
+
+@attrs.define
+class ArchivedSession:  # pylint: disable=too-many-instance-attributes
+    name : str
+    prompt : str
+    no_context : bool
+    # wall clock times of the session store
+    created : float = 0.0
+    updated : float = 0.0
+    message_count : int = 0
+    # offset of the block holding the session record, and of the record in
+    # the uncompressed block
+    block : int = 0
+    record : int = 0
+
+
+def _zstd() -> t.Any:
+    try:
+        import zstandard  # type: ignore # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise CommandError("zstd needs the zstandard package, "
+                           "pip install 'chatgpt-cli[zstd]'.")
+    return zstandard
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return _zstd().ZstdCompressor().compress(data)
+    # mtime=0 keeps archives of the same sessions identical, gzip.compress
+    # takes no mtime before 3.8
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb", mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _decompress(codec_id: int, data: bytes, raw_size: int) -> bytes:
+    if codec_id == _CODEC_IDS["zstd"]:
+        zstandard = _zstd()
+        try:
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_size)
+        except zstandard.ZstdError:
+            raise CommandError("The archive is damaged.")
+    if codec_id == _CODEC_IDS["gzip"]:
+        try:
+            return gzip.decompress(data)
+        except (OSError, EOFError, zlib.error):
+            raise CommandError("The archive is damaged.")
+    raise CommandError(f"Unknown archive codec {codec_id}.")
+
+
+def _message_body(message: ChatMessage) -> t.List[t.Any]:
+    return [message.message_type.value, message.message, message.timestamp]
+
+
+class ArchiveWriter:
+    """Writes sessions to the binary file `out`, which need not be seekable."""
+
+    def __init__(self, out: t.BinaryIO, codec: str = "gzip", block_size: int = BLOCK_SIZE):
+        if codec not in _CODEC_IDS:
+            raise CommandError(f"Unknown archive codec {codec!r}, use one of {', '.join(CODECS)}.")
+        if codec == "zstd":
+            _zstd()
+        self.out = out
+        self.codec = codec
+        self.block_size = block_size
+        self.sessions : t.List[ArchivedSession] = []
+        self._buffer = bytearray()
+        self._offset = 0
+        self._write(_HEADER.pack(MAGIC, VERSION))
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+
+    def _write(self, data: bytes):
+        self.out.write(data)
+        self._offset += len(data)
+
+    def _write_block(self, kind: int, raw: bytes):
+        data = _compress(self.codec, raw)
+        self._write(_BLOCK.pack(kind, _CODEC_IDS[self.codec], len(raw), len(data),
+                                zlib.crc32(raw)))
+        self._write(data)
+
+    def _add_record(self, kind: bytes, body: t.Any):
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._buffer += _RECORD.pack(len(data) + 1) + kind + data
+        if len(self._buffer) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """Write the records added so far as a block."""
+        if self._buffer:
+            self._write_block(_DATA_BLOCK, bytes(self._buffer))
+            self._buffer.clear()
+
+    def add_session(
+        self, name: str, prompt: str, no_context: bool,
+        created: float = 0.0, updated: float = 0.0
+    ) -> ArchivedSession:
+        """Start a session, its messages are the ones added until the next one."""
+        entry = ArchivedSession(name, prompt, no_context, created, updated,
+                                block=self._offset, record=len(self._buffer))
+        self.sessions.append(entry)
+        self._add_record(_SESSION_RECORD, {
+            "name": name, "prompt": prompt, "no_context": no_context,
+            "created": created, "updated": updated,
+        })
+        return entry
+
+    def add_message(self, message: ChatMessage):
+        if not self.sessions:
+            raise ValueError("add_session first")
+        self.sessions[-1].message_count += 1
+        self._add_record(_MESSAGE_RECORD, _message_body(message))
+
+    def write_session(self, session: ChatSession) -> ArchivedSession:
+        entry = self.add_session(session.session_name, session.prompt, session.no_context)
+        for message in session.histories:
+            self.add_message(message)
+        return entry
+
+    def close(self):
+        """Write the last block, the index and the trailer."""
+        self.flush()
+        index_offset = self._offset
+        self._write_block(_INDEX_BLOCK, json.dumps(
+            [attrs.asdict(entry) for entry in self.sessions],
+            ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        self._write(_TRAILER.pack(index_offset, MAGIC))
+        self.out.flush()
+
+
+class ArchiveReader:
+    """Reads the archive in the binary file `inp`.
+
+    `records` reads it in order and works on pipes, `index` and
+    `iter_messages` seek.
+    """
+
+    def __init__(self, inp: t.BinaryIO):
+        self.inp = inp
+        magic, version = _HEADER.unpack(self._read(_HEADER.size))
+        if magic != MAGIC:
+            raise CommandError("Not a chatgpt-cli session archive.")
+        if version > VERSION:
+            raise CommandError(f"Archive version {version} is newer than this chatgpt-cli.")
+
+    def _read(self, size: int) -> bytes:
+        data = self.inp.read(size)
+        if len(data) != size:
+            raise CommandError("The archive is truncated.")
+        return data
+
+    def _read_block(self) -> t.Tuple[int, bytes]:
+        kind, codec_id, raw_size, size, crc = _BLOCK.unpack(self._read(_BLOCK.size))
+        raw = _decompress(codec_id, self._read(size), raw_size)
+        if len(raw) != raw_size or zlib.crc32(raw) != crc:
+            raise CommandError("The archive is damaged.")
+        return kind, raw
+
+    @staticmethod
+    def _records(raw: bytes, start: int = 0) -> t.Iterator[t.Tuple[bytes, t.Any]]:
+        position = start
+        while position < len(raw):
+            size, = _RECORD.unpack_from(raw, position)
+            position += _RECORD.size
+            kind = raw[position:position + 1]
+            body = json.loads(raw[position + 1:position + size].decode("utf-8"))
+            position += size
+            yield kind, body
+
+    @staticmethod
+    def _message(body: t.List[t.Any]) -> ChatMessage:
+        role, content, timestamp = body
+        return ChatMessage(content, ChatMessageType(role), timestamp)
+
+    def records(self) -> t.Iterator[t.Union[ArchivedSession, ChatMessage]]:
+        """Every session followed by its messages, in order, block by block."""
+        while True:
+            kind, raw = self._read_block()
+            if kind == _INDEX_BLOCK:
+                return
+            for record_kind, body in self._records(raw):
+                if record_kind == _SESSION_RECORD:
+                    yield ArchivedSession(**body)
+                else:
+                    yield self._message(body)
+
+    def sessions(self) -> t.Iterator[t.Tuple[ArchivedSession, t.Iterator[ChatMessage]]]:
+        """Every session with its messages, in order.
+
+        Like `itertools.groupby`, the messages of a session are skipped
+        once the next session is taken.
+        """
+        count = 0
+
+        def session_of(record: t.Union[ArchivedSession, ChatMessage]) -> int:
+            nonlocal count
+            if isinstance(record, ArchivedSession):
+                count += 1
+            return count
+
+        for _, group in itertools.groupby(self.records(), session_of):
+            entry = next(group, None)
+            if not isinstance(entry, ArchivedSession):
+                raise CommandError("The archive is damaged.")
+            yield entry, t.cast(t.Iterator[ChatMessage], group)
+
+    def index(self) -> t.List[ArchivedSession]:
+        try:
+            self.inp.seek(-_TRAILER.size, 2)
+        except OSError:
+            # shorter than a trailer
+            raise CommandError("The archive is truncated.")
+        index_offset, magic = _TRAILER.unpack(self._read(_TRAILER.size))
+        if magic != MAGIC:
+            raise CommandError("The archive is truncated.")
+        self.inp.seek(index_offset)
+        kind, raw = self._read_block()
+        if kind != _INDEX_BLOCK:
+            raise CommandError("The archive is damaged.")
+        return [ArchivedSession(**entry) for entry in json.loads(raw.decode("utf-8"))]
+
+    def iter_messages(self, entry: ArchivedSession) -> t.Iterator[ChatMessage]:
+        """The messages of `entry`, reading its blocks only."""
+        self.inp.seek(entry.block)
+        _, raw = self._read_block()
+        records = self._records(raw, entry.record)
+        if next(records, None) is None:  # the session record
+            raise CommandError("The archive is damaged.")
+        left = entry.message_count
+        while left:
+            for _, body in records:
+                yield self._message(body)
+                left -= 1
+                if not left:
+                    return
+            kind, raw = self._read_block()
+            if kind != _DATA_BLOCK:
+                raise CommandError("The archive is damaged.")
+            records = self._records(raw)
+
+    def load_session(self, entry: ArchivedSession) -> ChatSession:
+        session = ChatSession(entry.name, entry.prompt)
+        session.no_context = entry.no_context
+        for message in self.iter_messages(entry):
+            session.add_message(message)
+        return session
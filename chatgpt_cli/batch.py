@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import csv
+import json
+import time
+import itertools
+import typing as t
+from concurrent import futures
+
+from chatgpt_cli import config
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession, ChatSessionManager
+from chatgpt_cli.error import CommandError
+from chatgpt_cli.metrics import percentile
+
+
+class BatchItem(t.NamedTuple):
+    # of the item in the input file, from 0
+    position: int
+    question: str
+    prompt: t.Optional[str] = None
+    model: t.Optional[str] = None
+    item_id: t.Optional[str] = None
+
+
+class BatchSummary(t.NamedTuple):
+    requests: int
+    failed: int
+    skipped: int
+    elapsed: float
+    tokens: int
+    latencies: t.List[float]
+
+
+def read_items(path: str) -> t.Iterator[BatchItem]:
+    """Read questions from a JSONL or CSV (by extension) file.
+
+    Each row needs a `question`, and may set `prompt`, `model` and `id`.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows : t.Iterable[t.Dict[str, t.Any]]
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        try:
+            for index, row in enumerate(rows):
+                if not isinstance(row, dict):
+                    raise CommandError(f"{path}: item {index} is not an object")
+                question = row.get("question")
+                if not question:
+                    raise CommandError(f"{path}: item {index} has no question")
+                yield BatchItem(
+                    position=index,
+                    question=question,
+                    prompt=row.get("prompt") or None,
+                    model=row.get("model") or None,
+                    item_id=row.get("id"),
+                )
+        except ValueError as e:
+            raise CommandError(f"{path}: invalid JSON line: {e}")
+
+
+def count_done(output_path: str) -> int:
+    """Count complete result lines and drop a partially written last line."""
+    if not os.path.exists(output_path):
+        return 0
+    done = 0
+    valid_size = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            done += 1
+            valid_size += len(line)
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_size)
+    return done
+
+
+T = t.TypeVar("T")
+R = t.TypeVar("R")
+
+
+def ordered_map(fn: t.Callable[[T], R], items: t.Iterable[T], concurrency: int,
+                window: t.Optional[int] = None) -> t.Iterator[R]:
+    """Like `map` on a thread pool, yielding results in order as soon as possible.
+
+    At most `concurrency` calls run at once, and an item is only started when
+    it is less than `window` (default `concurrency * 4`) items ahead of the
+    next result to yield, so memory stays bounded on endless inputs.
+    """
+    concurrency = max(1, concurrency)
+    window = window or concurrency * 4
+    # completed results wait here until every earlier one is yielded
+    finished : t.Dict[int, R] = {}
+    in_flight : t.Dict[futures.Future, int] = {}
+    next_index = 0
+    with futures.ThreadPoolExecutor(concurrency) as pool:
+
+        def collect() -> t.Iterator[R]:
+            nonlocal next_index
+            completed, _ = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+            for future in completed:
+                finished[in_flight.pop(future)] = future.result()
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+        try:
+            for index, item in enumerate(items):
+                while in_flight and (len(in_flight) >= concurrency
+                                     or index - next_index >= window):
+                    yield from collect()
+                in_flight[pool.submit(fn, item)] = index
+            while in_flight:
+                yield from collect()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+class BatchRunner:
+    """Answer many questions concurrently, writing results as ordered JSONL.
+
+    The output file doubles as the checkpoint: a rerun skips as many input
+    items as there are complete lines in it.  `prompt` is the prompt of the
+    items without one, `[CLI] default_prompt` when None.
+    """
+
+    def __init__(self, session_mgr: ChatSessionManager, concurrency: int = 4,
+                 use_cache: bool = True, prompt: t.Optional[str] = None):
+        self.session_mgr = session_mgr
+        self.concurrency = max(1, concurrency)
+        self.use_cache = use_cache
+        self.prompt = prompt
+
+    def run(self, input_path: str, output_path: str) -> BatchSummary:
+        done = count_done(output_path)
+        items = itertools.islice(read_items(input_path), done, None)
+        failed = 0
+        tokens = 0
+        latencies : t.List[float] = []
+        start = time.perf_counter()
+        with open(output_path, "a", encoding="utf-8") as out:
+            for record in ordered_map(self._run_item, items, self.concurrency):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                latencies.append(record["latency"])
+                tokens += record.get("usage", {}).get("total_tokens", 0)
+                if "error" in record:
+                    failed += 1
+        return BatchSummary(
+            requests=len(latencies),
+            failed=failed,
+            skipped=done,
+            elapsed=time.perf_counter() - start,
+            tokens=tokens,
+            latencies=latencies,
+        )
+
+    def _run_item(self, item: BatchItem) -> t.Dict[str, t.Any]:
+        start = time.perf_counter()
+        prompt = item.prompt or self.prompt or config.get_config()['CLI']['default_prompt']
+        model = item.model or config.get_config().get('API', 'CHATGPT_MODEL')
+        record : t.Dict[str, t.Any] = {"index": item.position}
+        if item.item_id is not None:
+            record["id"] = item.item_id
+        record.update(question=item.question, prompt=prompt, model=model)
+        try:
+            if config.get_prompt_message(prompt) is None:
+                raise CommandError(f"Prompt '{prompt}' is not found.")
+            session = ChatSession(f"batch-{item.position}", prompt)
+            session.add_message(ChatMessage(item.question, ChatMessageType.USER))
+            answer, usage = self.session_mgr.complete(
+                session, model=model, use_cache=self.use_cache)
+            record.update(answer=answer, usage=usage)
+        except CommandError as e:
+            record["error"] = e.message
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency"] = round(time.perf_counter() - start, 4)
+        return record
+
+
+def default_output_path(input_path: str) -> str:
+    return os.path.splitext(input_path)[0] + ".out.jsonl"
+
+
+def format_summary(summary: BatchSummary) -> str:
+    elapsed = max(summary.elapsed, 1e-9)
+    return (
+        f"{summary.requests} requests ({summary.failed} failed, "
+        f"{summary.skipped} resumed) in {summary.elapsed:.1f}s: "
+        f"{summary.requests / elapsed:.2f} req/s, {summary.tokens / elapsed:.1f} tokens/s, "
+        f"latency p50 {percentile(summary.latencies, 50):.2f}s "
+        f"p95 {percentile(summary.latencies, 95):.2f}s"
+    )
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import typing as t
+
+from chatgpt_cli import config
+
+
+_CACHE_FILE_NAME = 'cache.db'
+
+
+def make_key(model: str, messages: t.List[t.Dict[str, str]], temperature: float) -> str:
+    """Content address of a request: model, normalized messages and temperature."""
+    normalized = [
+        [message["role"], message["content"].replace("\r\n", "\n").strip()]
+        for message in messages
+    ]
+    payload = json.dumps([model, normalized, float(temperature)],
+                         ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Answers keyed by `make_key`, with a size cap, LRU and TTL eviction."""
+
+    def __init__(
+        self, path: str, max_size: int, ttl: float,
+        clock: t.Callable[[], float] = time.time
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def get(self, key: str) -> t.Optional[str]:
+        now = self._clock()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT answer, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            answer, created = row
+            if self.ttl and now - created > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return answer
+
+    def put(self, key: str, answer: str):
+        now = self._clock()
+        size = len(answer.encode("utf-8"))
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (key, answer, size, now, now))
+            self._evict(now)
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        if not self.max_size:
+            return
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used")
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+
+_response_cache : t.Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def is_cacheable(temperature: float) -> bool:
+    """Only deterministic requests are cached unless configured otherwise."""
+    conf = config.get_config()
+    if not conf.getboolean('CACHE', 'enable'):
+        return False
+    return temperature == 0 or conf.getboolean('CACHE', 'nondeterministic')
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            conf = config.get_config()
+            path = os.path.join(config.get_config_dir(try_create=True), _CACHE_FILE_NAME)
+            _response_cache = ResponseCache(
+                path,
+                max_size=int(conf.getfloat('CACHE', 'max_size_mb') * 1024 * 1024),
+                ttl=conf.getfloat('CACHE', 'ttl'),
+            )
+        return _response_cache
@@ -2,20 +2,29 @@
 #
 # Copyright 2023, JayPei <jaypei97159@gmail.com>
 #
+# pylint: disable=import-outside-toplevel
 
 
+import sys
+import time
+import array
 import datetime
 import enum
 import typing as t
 
 import attrs
-import openai
-from rich.live import Live
-from rich.markdown import Markdown
 
-from chatgpt_cli import config, term
+from chatgpt_cli import config, term, tokens
 from chatgpt_cli.error import CommandError
 
+if t.TYPE_CHECKING:
+    import openai
+    from rich.console import Console
+    from chatgpt_cli.metrics import RequestMetrics
+    from chatgpt_cli.output import RawWriter
+    from chatgpt_cli.pipeline import Delta
+    from chatgpt_cli.store import SearchHit, SessionMeta, SessionStore
+
 
 # define a enum type for ChatMessageType
 class ChatMessageType(enum.Enum):
@@ -29,6 +38,8 @@ class ChatMessage:
     message : str
     message_type : ChatMessageType = attrs.field(validator=attrs.validators.in_(ChatMessageType))
     timestamp : int = attrs.field(factory=lambda: int(datetime.datetime.now().timestamp()))
+    # tokens of the message in the chat format, counted once
+    token_count : t.Optional[int] = attrs.field(default=None, eq=False)
 
     def to_message_json(self) -> dict:
         return {
@@ -36,64 +47,293 @@ class ChatMessage:
             "content": self.message,
         }
 
+    def count_tokens(self, model: str) -> int:
+        if self.token_count is None:
+            self.token_count = tokens.count_tokens(self.message, model) + tokens.MESSAGE_OVERHEAD
+        return self.token_count
+
+
+_ROLES = tuple(ChatMessageType)
+_ROLE_INDEX = {role: i for i, role in enumerate(_ROLES)}
+_ROLE_NAMES = tuple(sys.intern(role.value) for role in _ROLES)
+
 
-class ChatSession:
+class MessageHistory(t.Sequence[ChatMessage]):
+    """Append-only list of chat messages stored in columns.
 
-    histories : t.List[ChatMessage] = attrs.field(factory=list)
+    Roles, timestamps, token counts and text offsets live in arrays and the
+    texts in one utf-8 buffer, so a message costs its text plus ~24 bytes
+    instead of a few Python objects.  Indexing builds a `ChatMessage`; hot
+    paths use the per-column accessors instead.
+    """
+
+    def __init__(self):
+        self._roles = array.array('B')
+        self._timestamps = array.array('q')
+        self._token_counts = array.array('i')
+        # end offset of every text in `_buffer`
+        self._offsets = array.array('Q')
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    @t.overload
+    def __getitem__(self, index: int) -> ChatMessage: ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> t.List[ChatMessage]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        token_count = self._token_counts[index]
+        return ChatMessage(self.text(index), _ROLES[self._roles[index]],
+                           self._timestamps[index],
+                           token_count=None if token_count < 0 else token_count)
+
+    def _index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        return index
+
+    def append(self, message: ChatMessage):
+        # `_roles` gives the length, appended last so that other threads
+        # only see whole messages
+        self._buffer += message.message.encode("utf-8")
+        self._offsets.append(len(self._buffer))
+        self._timestamps.append(message.timestamp)
+        self._token_counts.append(-1 if message.token_count is None else message.token_count)
+        self._roles.append(_ROLE_INDEX[message.message_type])
+
+    def role(self, index: int) -> ChatMessageType:
+        return _ROLES[self._roles[index]]
+
+    def indexes(
+        self, role: ChatMessageType, start: int = 0, stop: t.Optional[int] = None
+    ) -> t.List[int]:
+        """Indexes of the messages of `role` in `start:stop`, scanning the role column only."""
+        code = _ROLE_INDEX[role]
+        return [i for i, value in enumerate(self._roles[start:stop], start) if value == code]
+
+    def text(self, index: int) -> str:
+        index = self._index(index)
+        start = self._offsets[index - 1] if index else 0
+        return self._buffer[start:self._offsets[index]].decode("utf-8")
+
+    def token_count(self, index: int, model: str) -> int:
+        """Like `ChatMessage.count_tokens`, counted once per message."""
+        count = self._token_counts[index]
+        if count < 0:
+            count = tokens.count_tokens(self.text(index), model) + tokens.MESSAGE_OVERHEAD
+            self._token_counts[index] = count
+        return count
+
+    def message_json(self, index: int) -> dict:
+        return {
+            "role": _ROLE_NAMES[self._roles[index]],
+            "content": self.text(index),
+        }
+
+
+class ChatSession:  # pylint: disable=too-many-instance-attributes
 
     def __init__(self, session_name: str, prompt: str):
         self.session_name : str = session_name
         self.prompt : str = prompt
-        self.histories : t.List[ChatMessage] = []
+        self.histories : MessageHistory = MessageHistory()
         self.conversation_count : int = 0
+        # running token count of `histories`, None until a loaded session is
+        # counted, and user turns the last query left out
+        self.total_tokens : t.Optional[int] = 0
+        self.dropped_turns : int = 0
         self.no_context : bool = not config.get_config().getboolean('CLI', 'default_enable_context')
+        # set once the session is persisted in a SessionStore
+        self.session_id : t.Optional[int] = None
+        # answers being written by background requests, see `jobs`
+        self.pending : int = 0
+        self.store : t.Optional["SessionStore"] = None
+        self._system_message : t.Optional[ChatMessage] = None
 
     def __str__(self):
         return f"ChatSession({self.session_name}, {self.prompt}, {self.no_context})"
 
-    def generate_query_messages(self) -> t.List:
+    @staticmethod
+    def default_model() -> str:
+        return config.get_config().get('API', 'CHATGPT_MODEL')
+
+    def _last_user_message(self) -> t.Optional[ChatMessage]:
+        for i in range(len(self.histories) - 1, -1, -1):
+            if self.histories.role(i) == ChatMessageType.USER:
+                return self.histories[i]
+        return None
+
+    def _fit_history(self, model: str, budget: int) -> t.Tuple[int, int]:
+        """Index of the oldest message that fits in `budget`, and the tokens used.
+
+        The newest message is always kept, and the selection starts at a user
+        turn when possible.
+        """
+        if self.total_tokens is not None and self.total_tokens <= budget:
+            return 0, self.total_tokens
+        histories = self.histories
+        used = 0
+        start = len(histories)
+        for i in range(len(histories) - 1, -1, -1):
+            cost = histories.token_count(i, model)
+            if used + cost > budget and start < len(histories):
+                break
+            used += cost
+            start = i
+        if start == 0 and self.total_tokens is None:
+            # every message is counted by now
+            self.total_tokens = used
+        while start < len(histories) - 1 and histories.role(start) != ChatMessageType.USER:
+            used -= histories.token_count(start, model)
+            start += 1
+        return start, used
+
+    def system_message(self) -> t.Optional[ChatMessage]:
+        """The session prompt, sent once as the leading system message.
+
+        It is not part of `histories`, so changing the prompt leaves the
+        history untouched and the queries keep a stable prefix.
+        """
+        prompt_message = config.get_prompt_message(self.prompt) if self.prompt else None
+        if not prompt_message:
+            return None
+        if self._system_message is None or self._system_message.message != prompt_message:
+            self._system_message = ChatMessage(prompt_message, ChatMessageType.SYSTEM)
+        return self._system_message
+
+    def _system_tokens(self, model: str) -> int:
+        message = self.system_message()
+        return message.count_tokens(model) if message else 0
+
+    def context_tokens(self, model: t.Optional[str]=None) -> t.Tuple[int, int]:
+        """Tokens the next query would use, and the tokens available to it."""
+        model = model or self.default_model()
+        budget = tokens.prompt_budget(model)
+        used = self._system_tokens(model)
+        if self.no_context:
+            message = self._last_user_message()
+            return used + (message.count_tokens(model) if message else 0), budget
+        return used + self._fit_history(model, max(0, budget - used))[1], budget
+
+    def generate_query_messages(
+        self, model: t.Optional[str]=None, pending: t.Optional[ChatMessage]=None
+    ) -> t.List:
+        """The messages to send, `pending` being a question not in `histories` yet."""
         query_messages = []
+        self.dropped_turns = 0
+        system_message = self.system_message()
+        if system_message is not None:
+            query_messages.append(system_message.to_message_json())
         if self.no_context:
             # reversed query for the first user message
-            for message in reversed(self.histories):
-                if message.message_type == ChatMessageType.USER:
-                    query_messages.append(message.to_message_json())
-                    break
+            message = pending or self._last_user_message()
+            if message is not None:
+                query_messages.append(message.to_message_json())
             return query_messages
-        for message in self.histories:
-            query_messages.append(message.to_message_json())
+        model = model or self.default_model()
+        budget = max(0, tokens.prompt_budget(model) - self._system_tokens(model))
+        if pending is not None:
+            budget = max(0, budget - pending.count_tokens(model))
+        start, _ = self._fit_history(model, budget)
+        for i in range(start, len(self.histories)):
+            query_messages.append(self.histories.message_json(i))
+            if self.histories.role(i) == ChatMessageType.USER:
+                self.dropped_turns -= 1
+        self.dropped_turns += self.conversation_count
+        if pending is not None:
+            query_messages.append(pending.to_message_json())
         return query_messages
 
     def add_message(self, message: ChatMessage):
-        if self.prompt and message.message_type == ChatMessageType.USER:
-            prompt_message = config.get_prompt_message(self.prompt)
-            if prompt_message:
-                message.message = f"{prompt_message}\n\n{message.message}"
+        count = message.count_tokens(self.default_model())
+        if self.total_tokens is not None:
+            self.total_tokens += count
         self.histories.append(message)
         if message.message_type == ChatMessageType.USER:
             self.conversation_count += 1
+        if self.store is not None:
+            self.store.append_message(self, message)
 
 
 class ChatSessionManager:
 
     def __init__(self):
+        # loaded sessions, least recently used first
         self.sessions : t.Dict[str, ChatSession] = {}
         self.current_session : ChatSession
+        self.last_render_stats : t.Dict[str, t.Any] = {}
+        self.store : t.Optional["SessionStore"] = None
+
+    def attach_store(self, store: "SessionStore"):
+        """Persist sessions in `store` from now on.
+
+        Sessions created before are dropped; saved sessions are only read
+        when switched to.
+        """
+        self.store = store
+        self.sessions = {}
+
+    def list_sessions(self) -> t.List["SessionMeta"]:
+        if self.store is None:
+            return []
+        return self.store.list_sessions()
+
+    def search(self, terms: t.Sequence[str], limit: int = 20) -> t.List["SearchHit"]:
+        if self.store is None:
+            return []
+        return self.store.search(terms, limit)
+
+    def new_session_name(self) -> str:
+        """First free `ChatNN` name among loaded and saved sessions."""
+        names = set(self.sessions)
+        names.update(meta.name for meta in self.list_sessions())
+        number = 1
+        while f"Chat{number:02d}" in names:
+            number += 1
+        return f"Chat{number:02d}"
 
     def get_session(self, session_name: str) -> ChatSession:
         if session_name not in self.sessions:
-            self.sessions[session_name] = ChatSession(
-                session_name, prompt=config.get_config()['CLI']['default_prompt'])
+            meta = self.store.find_session(session_name) if self.store else None
+            if meta is not None and meta.name in self.sessions:
+                session_name = meta.name
+            elif meta is not None:
+                self.sessions[meta.name] = self._load_session(meta)
+                session_name = meta.name
+            else:
+                self.sessions[session_name] = self._new_session(
+                    session_name, config.get_config()['CLI']['default_prompt'])
         return self.sessions[session_name]
 
     def switch(self, session_name: str) -> ChatSession:
         self.current_session = self.get_session(session_name)
+        # keep `sessions` in least recently used order
+        name = self.current_session.session_name
+        self.sessions[name] = self.sessions.pop(name)
+        self._evict_sessions()
         return self.current_session
 
     def rename(self, old_name: str, new_name: str):
+        if new_name != old_name and new_name in self.sessions:
+            raise CommandError(f"Session '{new_name}' already exists.")
         if old_name in self.sessions:
-            self.sessions[new_name] = self.sessions[old_name]
-            del self.sessions[old_name]
+            session = self.sessions.pop(old_name)
+            session.session_name = new_name
+            self.sessions[new_name] = session
+            self.save_session(session)
+
+    def save_session(self, session: ChatSession):
+        """Persist changed session settings (name, prompt, context)."""
+        if self.store is not None:
+            self.store.save_session(session)
 
     def create(
         self, session_name: str, auto_switch: bool=True,
@@ -101,66 +341,385 @@ class ChatSessionManager:
     ) -> ChatSession:
         if prompt is None:
             prompt = config.get_config()['CLI']['default_prompt']
-        new_session = ChatSession(session_name, prompt)
+        new_session = self._new_session(session_name, prompt)
         self.sessions[session_name] = new_session
         if auto_switch:
             self.switch(session_name)
         return new_session
 
-    def _new_chat_completion(self, stream: bool) -> openai.ChatCompletion:
-        try:
-            response = openai.ChatCompletion.create(
-                model=config.get_config().get('API', 'CHATGPT_MODEL'),
-                messages=self.current_session.generate_query_messages(),
+    def _new_session(self, session_name: str, prompt: str) -> ChatSession:
+        session = ChatSession(session_name, prompt)
+        session.store = self.store
+        return session
+
+    def _load_session(self, meta: "SessionMeta") -> ChatSession:
+        assert self.store is not None
+        session = ChatSession(meta.name, meta.prompt)
+        session.no_context = meta.no_context
+        session.session_id = meta.session_id
+        # tokens are counted when a query needs them, newest messages first
+        session.total_tokens = None
+        for role, content, timestamp in self.store.load_messages(meta.session_id):
+            message = ChatMessage(content, ChatMessageType(role), timestamp)
+            session.histories.append(message)
+            if message.message_type == ChatMessageType.USER:
+                session.conversation_count += 1
+        session.store = self.store
+        return session
+
+    def _evict_sessions(self):
+        """Drop the histories of least recently used saved sessions."""
+        if self.store is None:
+            return
+        max_loaded = config.get_config().getint('CLI', 'max_loaded_sessions')
+        for name in list(self.sessions):
+            if len(self.sessions) <= max_loaded:
+                break
+            session = self.sessions[name]
+            if session is self.current_session:
+                continue
+            if session.session_id is None and session.histories:
+                continue
+            if session.pending:
+                # a background answer is still to be added to it
+                continue
+            del self.sessions[name]
+
+    def _new_chat_completion(
+        self, stream: bool, session: t.Optional[ChatSession]=None,
+        model: t.Optional[str]=None, n: int=1
+    ) -> "openai.ChatCompletion":
+        from chatgpt_cli import ratelimit
+        openai = get_openai()
+        session = session or self.current_session
+        model = model or config.get_config().get('API', 'CHATGPT_MODEL')
+        messages = session.generate_query_messages(model)
+
+        def send():
+            return openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
                 temperature=int(config.get_config().get('API', 'TEMPERATURE')),
                 top_p=1,
-                n=1,
+                n=n,
                 presence_penalty=0,
                 frequency_penalty=0,
                 stream=stream,
             )
-            return response
+
+        def waiting(delay: float, attempt: int):
+            if delay < 1:
+                return
+            reason = f"retry {attempt}" if attempt else "rate limit"
+            term.err_console.print(f"[dim]Waiting {delay:.1f}s ({reason})[/dim]")
+
+        # the API estimates the tokens of a request from its characters too
+        cost = sum(len(message["content"]) for message in messages) // 4
+        try:
+            return ratelimit.get_rate_limiter().call(
+                send, cost, _is_transient_error, on_wait=waiting)
         except openai.error.RateLimitError as e:
             term.console.print(f"[bold red]Rate limit exceeded: {e}[/bold red]")
             raise CommandError("Rate limit exceeded", 2)
 
-    def _single_output(self, console: term.Console, response: openai.ChatCompletion) -> str:
+    def stream_choices(
+        self, session: ChatSession, model: str, n: int
+    ) -> "openai.ChatCompletion":
+        """A streamed request for `n` answers to the session's pending question.
+
+        The chunks interleave the answers, told apart by the choice index.
+        Used by `fanout`, nothing is added to the session.
+        """
+        return self._new_chat_completion(stream=True, session=session, model=model, n=n)
+
+    def _single_output(
+        self, console: "Console", response: "openai.ChatCompletion",
+        record: "RequestMetrics"
+    ) -> str:
+        from rich.markdown import Markdown
         message = response['choices'][0]['message']["content"]
+        start = time.perf_counter()
         console.print(Markdown(message))
+        record.render = time.perf_counter() - start
         return message
 
-    def _live_output(self, console: term.Console, response: openai.ChatCompletion) -> str:
-        output = []
-        with Live(console=console) as live:
-            for chunk in response:
-                delta_obj = chunk['choices'][0]['delta']
-                content = delta_obj.get("content")
-                if content is None:
-                    continue
-                output.append(content)
-                md = Markdown("".join(output))
-                live.update(md, refresh=True)
+    @staticmethod
+    def _stream_output(
+        response: "openai.ChatCompletion", record: "RequestMetrics", start: float,
+        sink: t.Callable[[t.List["Delta"]], None],
+        abort: t.Optional[t.Callable[[], None]] = None
+    ) -> str:
+        from chatgpt_cli import pipeline
+        output : t.List[str] = []
+
+        def collect(deltas: t.List["Delta"]):
+            output.extend(content for _, content in deltas)
+            sink(deltas)
+
+        stats = pipeline.StreamPipeline(response, collect, abort=abort).run_sync()
+        record.render = stats.render
+        if stats.chunks:
+            record.ttft = stats.first - start
+            record.streaming = stats.last - stats.first
+        record.chunks = stats.chunks
+        return "".join(output)
+
+    def _write_output(
+        self, response: "openai.ChatCompletion", record: "RequestMetrics",
+        writer: "RawWriter", abort: t.Optional[t.Callable[[], None]] = None
+    ) -> str:
+        """Write the answer to `writer` unrendered, as it arrives when streamed."""
+        if record.stream:
+            return self._stream_output(response, record, writer.start, writer.write, abort)
+        answer = response['choices'][0]['message']["content"]
+        writer.write([(time.perf_counter(), answer)])
+        return answer
+
+    def _live_output(
+        self, console: "Console", response: "openai.ChatCompletion",
+        record: "RequestMetrics", start: float,
+        abort: t.Optional[t.Callable[[], None]] = None
+    ) -> str:
+        from chatgpt_cli import render
+        refresh_rate = config.get_config().getfloat('CLI', 'refresh_rate')
+        with render.LiveMarkdown(console, refresh_rate=refresh_rate) as live:
+            answer = self._stream_output(
+                response, record, start,
+                lambda deltas: live.feed("".join(content for _, content in deltas)),
+                abort=abort)
+            closing = time.perf_counter()
+        record.render += time.perf_counter() - closing
+        self.last_render_stats = live.scheduler.stats
+        return answer
+
+    def _cache_key(
+        self, session: t.Optional[ChatSession]=None, model: t.Optional[str]=None
+    ) -> t.Optional[str]:
+        from chatgpt_cli import cache
+        conf = config.get_config()
+        temperature = int(conf.get('API', 'TEMPERATURE'))
+        if not cache.is_cacheable(temperature):
+            return None
+        model = model or conf.get('API', 'CHATGPT_MODEL')
+        return cache.make_key(
+            model,
+            (session or self.current_session).generate_query_messages(model),
+            temperature,
+        )
+
+    def _similar_scope(self, session: ChatSession) -> t.Optional[str]:
+        """What near-duplicate questions must share, None unless `session` is one-shot."""
+        from chatgpt_cli import cache, similar
+        if not similar.is_enabled():
+            return None
+        conf = config.get_config()
+        model = conf.get('API', 'CHATGPT_MODEL')
+        messages = session.generate_query_messages(model)
+        # an answer depends on the earlier turns too
+        if any(message["role"] != "system" for message in messages[:-1]):
+            return None
+        return cache.make_key(model, messages[:-1], int(conf.get('API', 'TEMPERATURE')))
+
+    def _near_duplicate(
+        self, session: ChatSession, question: str
+    ) -> t.Tuple[t.Optional[str], float]:
+        """The cached answer of a question like `question`, and their similarity."""
+        from chatgpt_cli import cache, similar
+        scope = self._similar_scope(session)
+        if scope is None:
+            return None, 0.0
+        threshold = config.get_config().getfloat('CACHE', 'similar_threshold')
+        for key, similarity in similar.get_similarity_index().lookup(scope, question, threshold):
+            # answers are evicted from the response cache on their own
+            answer = cache.get_response_cache().get(key)
+            if answer is not None:
+                return answer, similarity
+        return None, 0.0
+
+    def _remember_question(self, session: ChatSession, question: str, cache_key: str):
+        from chatgpt_cli import similar
+        scope = self._similar_scope(session)
+        if scope is not None:
+            similar.get_similarity_index().add(scope, question, cache_key)
+
+    def complete(
+        self, session: ChatSession, model: t.Optional[str]=None,
+        use_cache: bool=False, on_delta: t.Optional[t.Callable[[str], None]]=None
+    ) -> t.Tuple[str, t.Dict[str, int]]:
+        """Answer the session's pending question without rendering anything.
+
+        Returns the answer and the token usage reported by the API (empty for
+        cached and streamed answers).  With `on_delta` the answer is streamed
+        and passed to it as it arrives.  Safe to call from worker threads.
+        """
+        from chatgpt_cli import cache, metrics
+        model = model or session.default_model()
+        record = metrics.RequestMetrics(session.session_name, model,
+                                        stream=on_delta is not None)
+        start = time.perf_counter()
+        try:
+            cache_key = self._cache_key(session, model) if use_cache else None
+            cached = cache.get_response_cache().get(cache_key) if cache_key is not None else None
+            usage : t.Dict[str, int] = {}
+            if cached is not None:
+                record.cached = True
+                answer = cached
+                if on_delta is not None:
+                    on_delta(answer)
+            elif on_delta is not None:
+                response = self._new_chat_completion(stream=True, session=session, model=model)
+                record.wait = time.perf_counter() - start
+                answer = self._drain(response, record, start, on_delta)
+            else:
+                response = self._new_chat_completion(stream=False, session=session, model=model)
+                record.ttft = record.wait = record.streaming = time.perf_counter() - start
+                answer = response['choices'][0]['message']["content"]
+                usage = dict(response.get('usage') or {})
+                if cache_key is not None:
+                    cache.get_response_cache().put(cache_key, answer)
+            record.tokens = self._add_answer(session, answer)
+            return answer, usage
+        except Exception as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.total = time.perf_counter() - start
+            metrics.get_recorder().record(record)
+
+    @staticmethod
+    def _drain(
+        response: "openai.ChatCompletion", record: "RequestMetrics", start: float,
+        on_delta: t.Callable[[str], None]
+    ) -> str:
+        """Read a streamed answer in the calling thread."""
+        output : t.List[str] = []
+        first = last = start
+        for chunk in response:
+            content = chunk['choices'][0]['delta'].get("content")
+            if content is None:
+                continue
+            last = time.perf_counter()
+            if not output:
+                first = last
+            output.append(content)
+            on_delta(content)
+        record.ttft = first - start
+        record.streaming = last - first
+        record.chunks = len(output)
         return "".join(output)
 
-    def ask(self, question: str, stream: bool, console: term.Console) -> str:
-        self.current_session.add_message(ChatMessage(
+    @staticmethod
+    def _add_answer(session: ChatSession, answer: str) -> int:
+        """Append the answer to `session`, returning its tokens."""
+        message = ChatMessage(answer, ChatMessageType.ASSISTANT)
+        session.add_message(message)
+        return (message.token_count or 0) - tokens.MESSAGE_OVERHEAD
+
+    def _cached_answer(
+        self, session: ChatSession, question: str, cache_key: str, console: "Console"
+    ) -> t.Tuple[t.Optional[str], float]:
+        """The cached answer of `cache_key`, or of a question like `question`."""
+        from chatgpt_cli import cache
+        cached = cache.get_response_cache().get(cache_key)
+        if cached is not None:
+            return cached, 0.0
+        cached, similarity = self._near_duplicate(session, question)
+        if cached is not None:
+            console.print(f"[dim]Near-duplicate of a cached question (similarity "
+                          f"{similarity:.2f}), --refresh asks anyway.[/dim]")
+        return cached, similarity
+
+    @staticmethod
+    def _replay(answer: str, stream: bool) -> t.Any:
+        """A response carrying `answer`, to show it through the same renderer."""
+        if stream:
+            return iter([{"choices": [{"delta": {"content": answer}}]}])
+        return {"choices": [{"message": {"content": answer}}]}
+
+    def _request(
+        self, console: "Console", session: ChatSession, record: "RequestMetrics", start: float
+    ) -> t.Tuple["openai.ChatCompletion", t.Optional[t.Callable[[], None]]]:
+        """Send the request of `ask`, with the callable closing its connection."""
+        from chatgpt_cli import render, transport
+        transport.take_connect_time()
+        with render.make_progress_bar(console) as progress:
+            progress.add_task(":thinking_face: [green]Thinking ...", total=None)
+            response = self._new_chat_completion(stream=record.stream, session=session)
+        http_response = transport.take_last_response()
+        record.wait = time.perf_counter() - start
+        record.connect = transport.take_connect_time()
+        dropped = session.dropped_turns
+        if dropped:
+            console.print(f"[dim]Context: {dropped} earlier turn(s) dropped to fit "
+                          f"the model's context window.[/dim]")
+        return response, http_response.close if http_response is not None else None
+
+    def ask(  # pylint: disable=too-many-arguments,too-many-locals
+        self, question: str, stream: bool, console: "Console", *,
+        use_cache: bool=False, refresh_cache: bool=False,
+        output_format: str="markdown", out: t.Optional[t.TextIO]=None,
+        session: t.Optional[ChatSession]=None
+    ) -> str:
+        """Ask `question` in `session`, the current one by default, and show the answer.
+
+        `output_format` is one of `output.FORMATS`: the answer is rendered as
+        Markdown on `console`, or written to `out` (stdout by default) as it
+        arrives, with `console` only showing the progress.
+        """
+        from chatgpt_cli import cache, metrics
+        session = session or self.current_session
+        session.add_message(ChatMessage(
             message=question,
             message_type=ChatMessageType.USER,
         ))
-        response : openai.ChatCompletion
-        with term.make_progress_bar(console) as progress:
-            progress.add_task(":thinking_face: [green]Thinking ...", total=None)
-            response = self._new_chat_completion(stream=stream)
-            answer = ""
-        if not stream:
-            answer = self._single_output(console, response)
-        else:
-            answer = self._live_output(console, response)
-        self.current_session.add_message(ChatMessage(
-            message=answer,
-            message_type=ChatMessageType.ASSISTANT,
-        ))
-        return answer
+        cache_key = self._cache_key(session) if use_cache else None
+        cached : t.Optional[str] = None
+        similarity = 0.0
+        if cache_key is not None and not refresh_cache:
+            cached, similarity = self._cached_answer(session, question, cache_key, console)
+        record = metrics.RequestMetrics(session.session_name, session.default_model(),
+                                        stream, cached=cached is not None,
+                                        similarity=similarity)
+        start = time.perf_counter()
+        writer = None
+        usage : t.Dict[str, int] = {}
+        if output_format != "markdown":
+            from chatgpt_cli import output
+            writer = output.make_writer(output_format, out or sys.stdout, start)
+            usage["prompt_tokens"] = session.context_tokens(record.model)[0]
+        try:
+            response : t.Any
+            abort = None
+            if cached is not None:
+                # replay through the same renderer as a live answer
+                response = self._replay(cached, stream)
+            else:
+                response, abort = self._request(console, session, record, start)
+            if not stream:
+                record.ttft = record.streaming = record.wait
+                usage.update(response.get('usage') or {})
+            if writer is not None:
+                answer = self._write_output(response, record, writer, abort)
+            elif stream:
+                answer = self._live_output(console, response, record, start, abort)
+            else:
+                answer = self._single_output(console, response, record)
+            if cache_key is not None and cached is None:
+                cache.get_response_cache().put(cache_key, answer)
+                self._remember_question(session, question, cache_key)
+            record.tokens = self._add_answer(session, answer)
+            # streamed answers come without usage, count them
+            usage.setdefault("completion_tokens", record.tokens)
+            usage.setdefault("total_tokens", usage.get("prompt_tokens", 0) + record.tokens)
+            return answer
+        except Exception as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.total = time.perf_counter() - start
+            metrics.get_recorder().record(record)
+            if writer is not None:
+                writer.finish(record, usage)
 
 
 _session_manager : ChatSessionManager
@@ -171,9 +730,43 @@ def get_session_manager() -> ChatSessionManager:
     return _session_manager
 
 
+def _is_transient_error(e: Exception) -> bool:
+    """Whether a request failing with `e` may succeed when sent again."""
+    openai = get_openai()
+    if isinstance(e, openai.error.RateLimitError):
+        # a used up quota does not come back by waiting
+        return (e.error or {}).get("code") != "insufficient_quota"
+    if isinstance(e, (openai.error.APIConnectionError, openai.error.Timeout,
+                      openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+        return True
+    return isinstance(e, openai.error.APIError) and (e.http_status or 0) >= 500
+
+
+def get_openai():
+    """Import and configure openai on first use, it is slow to import."""
+    import openai
+    from chatgpt_cli import ratelimit, transport
+    conf = config.get_config()
+    openai.api_key = conf.get('API', 'OPENAI_API_KEY')
+    api_base = conf.get('API', 'OPENAI_API_BASE')
+    if api_base:
+        openai.api_base = api_base
+    # openai uses a session instance as is, keeping connections alive across requests
+    openai.requestssession = transport.get_session()
+    ratelimit.get_rate_limiter().attach(openai.requestssession)
+    return openai
+
+
+def prewarm_connection():
+    """Connect to the API host in the background, e.g. while the user types."""
+    if not config.get_config().getboolean('CLI', 'prewarm_connection'):
+        return
+    from chatgpt_cli import transport
+    transport.prewarm(lambda: get_openai().api_base)
+
+
 def init():
     global _session_manager
-    openai.api_key = config.get_config().get('API', 'OPENAI_API_KEY')
     _session_manager = ChatSessionManager()
     _session_manager.create('Chat01', auto_switch=True)
 
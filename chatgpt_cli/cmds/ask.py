@@ -2,14 +2,18 @@
 #
 # Copyright 2023, JayPei <jaypei97159@gmail.com>
 #
+# pylint: disable=import-outside-toplevel
 
 
 import sys
+import itertools
+import contextlib
 import typing as t
 
 import click
 
 from chatgpt_cli import chatapi
+from chatgpt_cli import config
 from chatgpt_cli import term
 from chatgpt_cli import error
 from chatgpt_cli.cmds.base import BaseCmd
@@ -25,6 +29,90 @@ class AskCommand(BaseCmd):
             is_flag=True,
             help="Disable streaming mode.",
         ),
+        click.Option(
+            ["--no-cache"],
+            is_flag=True,
+            help="Neither read nor write the response cache.",
+        ),
+        click.Option(
+            ["--refresh"],
+            is_flag=True,
+            help="Ignore a cached answer and cache the new one.",
+        ),
+        click.Option(
+            ["--format", "output_format"],
+            type=click.Choice(["markdown", "raw", "jsonl"]),
+            help="Render the answer as Markdown, write it as it arrives (raw), or "
+                 "write one JSON object per delta and a final usage one (jsonl). "
+                 "Defaults to markdown on a terminal and raw otherwise.",
+        ),
+        click.Option(
+            ["--models"],
+            help="Ask several models at once, comma separated, and show "
+                 "their answers side by side.",
+        ),
+        click.Option(
+            ["--n", "candidates"],
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Answers to ask of every model, shown side by side.",
+        ),
+        click.Option(
+            ["--prompt"],
+            help="Prompt to use instead of [CLI] default_prompt.",
+        ),
+        click.Option(
+            ["--input"],
+            type=click.Path(dir_okay=False, allow_dash=True),
+            help="Run the prompt over a long file, or - for stdin, in token-bounded "
+                 "chunks. A question of - does the same for stdin.",
+        ),
+        click.Option(
+            ["--chunk-tokens"],
+            type=click.IntRange(min=0),
+            default=0,
+            help="Maximum tokens of an --input chunk, 0 to fit the model.",
+        ),
+        click.Option(
+            ["--reduce"],
+            is_flag=True,
+            help="Merge the answers of the --input chunks into one.",
+        ),
+        click.Option(
+            ["--reduce-prompt"],
+            help="Prompt merging the --input answers, with --reduce.",
+        ),
+        click.Option(
+            ["--batch"],
+            type=click.Path(exists=True, dir_okay=False),
+            help="Answer every question of a JSONL or CSV file.",
+        ),
+        click.Option(
+            ["--output"],
+            type=click.Path(dir_okay=False),
+            help="JSONL results of --batch, resumed if it exists. "
+                 "Defaults to <batch>.out.jsonl. Answers of --input, "
+                 "defaults to stdout.",
+        ),
+        click.Option(
+            ["--concurrency"],
+            type=click.IntRange(min=1),
+            default=4,
+            show_default=True,
+            help="Concurrent requests of --batch and --input.",
+        ),
+        click.Option(
+            ["--no-daemon"],
+            is_flag=True,
+            help="Answer in this process even if `chatgpt-cli daemon` is running.",
+        ),
+        click.Option(
+            ["--metrics-log"],
+            type=click.Path(dir_okay=False),
+            help="Append per-request timings to this JSONL file. "
+                 "Defaults to [CLI] metrics_log.",
+        ),
         click.Argument(
             ["question"],
             nargs=-1,
@@ -32,27 +120,211 @@ class AskCommand(BaseCmd):
     ]
 
     def run(self, **kwargs) -> t.Any:
-        no_stream = kwargs.get("no_stream", False)
+        cache_options = {"use_cache": not kwargs.get("no_cache", False),
+                         "refresh_cache": kwargs.get("refresh", False)}
         question = kwargs.get("question", [])
-        stream_mode = not no_stream
+        prompt = kwargs.get("prompt") or config.get_config()['CLI']['default_prompt']
+        input_path = kwargs.get("input")
+        stream_mode = not kwargs.get("no_stream", False)
+        if tuple(question) == ("-",):
+            input_path = "-"
         question = " ".join(question)
+        metrics_log = kwargs.get("metrics_log") or config.get_config()['CLI']['metrics_log']
+        if metrics_log:
+            from chatgpt_cli import metrics
+            metrics.get_recorder().log_path = metrics_log
+        if kwargs.get("batch"):
+            self.run_batch_cmd(kwargs["batch"], kwargs.get("output"), prompt,
+                               kwargs.get("concurrency", 4),
+                               use_cache=cache_options["use_cache"])
+            return
+        if input_path:
+            self.run_input_cmd(input_path, kwargs.get("output"), prompt,
+                               reduce=kwargs.get("reduce", False),
+                               concurrency=kwargs.get("concurrency", 4),
+                               chunk_tokens=kwargs.get("chunk_tokens", 0),
+                               reduce_prompt=kwargs.get("reduce_prompt"),
+                               use_cache=cache_options["use_cache"])
+            return
         if question.strip() == "":
-            current_context = click.get_current_context()
-            click.echo(self.get_help(current_context))
+            click.echo(self.get_help(click.get_current_context()))
             sys.exit(1)
+        from chatgpt_cli import output
+        output_format = kwargs.get("output_format") or output.default_format(sys.stdout)
+        models = kwargs.get("models")
+        candidates = kwargs.get("candidates", 1)
+        # the daemon logs the metrics of its own config
+        if not (kwargs.get("no_daemon") or kwargs.get("metrics_log") or models) \
+                and candidates == 1 and self.run_remote_cmd(
+                    question, prompt, output_format=output_format, stream=stream_mode,
+                    **cache_options):
+            return
+        # keep stdout for the answer unless it is rendered
+        console = term.console if output_format == "markdown" else term.err_console
         try:
-            self.run_ask_cmd(question, stream_mode=stream_mode)
+            if models or candidates > 1:
+                self.run_fanout_cmd(question, prompt, console=console, models=models,
+                                    n=candidates, output_format=output_format)
+            else:
+                self.run_ask_cmd(question, prompt, console=console, stream=stream_mode,
+                                 output_format=output_format, **cache_options)
         except error.CommandError as e:
-            term.console.print(f"[bold red]Error: {e.message}[/bold red]")
+            console.print(f"[bold red]Error: {e.message}[/bold red]")
             sys.exit(e.exit_code)
         # control + c
         except KeyboardInterrupt:
-            term.console.print("\nBye!")
+            console.print("\nBye!")
             sys.exit(2)
         except:
-            term.console.print_exception()
+            console.print_exception()
+
+    def run_batch_cmd(self, input_path, output_path, prompt, concurrency, use_cache=True):
+        from chatgpt_cli import batch
+        output_path = output_path or batch.default_output_path(input_path)
+        runner = batch.BatchRunner(chatapi.get_session_manager(), concurrency=concurrency,
+                                   use_cache=use_cache, prompt=prompt)
+        try:
+            summary = runner.run(input_path, output_path)
+        except error.CommandError as e:
+            term.console.print(f"[bold red]Error: {e.message}[/bold red]")
+            sys.exit(e.exit_code)
+        except KeyboardInterrupt:
+            term.console.print(f"\nInterrupted, rerun to resume into {output_path}.")
+            sys.exit(2)
+        term.console.print(batch.format_summary(summary), highlight=False)
+        term.console.print(f"Results written to [bold blue]{output_path}[/bold blue]")
+
+    def run_input_cmd(self, input_path, output_path, prompt, reduce=False, **options):
+        """Answer the text of `input_path` chunk by chunk, `options` go to `MapReduce`."""
+        from chatgpt_cli import mapreduce
+        try:
+            runner = mapreduce.MapReduce(chatapi.get_session_manager(), prompt, **options)
+            with click.open_file(input_path, "r", encoding="utf-8") as stream, \
+                    click.open_file(output_path or "-", "w", encoding="utf-8") as out:
+                summary = runner.run(stream, out, reduce=reduce)
+        except error.CommandError as e:
+            # stdout carries the answers
+            click.echo(f"Error: {e.message}", err=True)
+            sys.exit(e.exit_code)
+        except KeyboardInterrupt:
+            sys.exit(2)
+        click.echo(mapreduce.format_summary(summary), err=True)
+
+    def run_remote_cmd(self, question, prompt, output_format="markdown", **options) -> bool:
+        """Ask through a running daemon, False if there is none.
+
+        `options` go to the daemon's ask request, `stream`, `use_cache` and
+        `refresh_cache`.  Only the markdown format touches the console, as
+        importing rich would take longer than the rest of the call.
+        """
+        from chatgpt_cli import daemon
+        sock = daemon.connect(daemon.socket_path())
+        if sock is None:
+            return False
+        message = {"type": "ask", "question": question, "prompt": prompt, **options}
+        try:
+            return self._show_remote(daemon.request(sock, message), output_format)
+        except error.CommandError as e:
+            if output_format == "markdown":
+                term.console.print(f"[bold red]Error: {e.message}[/bold red]")
+            else:
+                # stdout carries the answer
+                click.echo(f"Error: {e.message}", err=True)
+            sys.exit(e.exit_code)
+        except KeyboardInterrupt:
+            sys.exit(2)
+
+    def _show_remote(self, frames, output_format) -> bool:
+        try:
+            first = next(frames, None)
+        except OSError:
+            first = None
+        if first is None:
+            # it stopped meanwhile
+            return False
+        failure = None
+        done = None
+        newline = True
+        with contextlib.ExitStack() as stack:
+            live = None
+            if output_format == "markdown":
+                from chatgpt_cli import render
+                stack.callback(term.console.print, "\n")
+                live = stack.enter_context(render.LiveMarkdown(
+                    term.console, refresh_rate=config.get_config().getfloat('CLI', 'refresh_rate')))
+            try:
+                for frame in itertools.chain([first], frames):
+                    kind = frame.get("type")
+                    if kind == "error":
+                        failure = frame
+                        continue
+                    if kind == "done":
+                        done = frame
+                    self._write_frame(frame, output_format, live)
+                    if kind == "delta" and frame["content"]:
+                        newline = frame["content"].endswith("\n")
+            except OSError as e:
+                raise error.CommandError(f"Lost the daemon connection: {e}")
+            finally:
+                if output_format == "raw" and not newline:
+                    sys.stdout.write("\n")
+                    sys.stdout.flush()
+        if failure is not None:
+            raise error.CommandError(failure["message"], failure.get("exit_code", 1))
+        if done is None or done.get("error"):
+            raise error.CommandError(done["error"] if done else "The daemon sent no answer.")
+        return True
+
+    @staticmethod
+    def _write_frame(frame, output_format, live):
+        import json
+        if output_format == "jsonl":
+            sys.stdout.write(json.dumps(frame, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        elif frame.get("type") == "delta" and live is not None:
+            live.feed(frame["content"])
+        elif frame.get("type") == "delta" and frame["content"]:
+            sys.stdout.write(frame["content"])
+            sys.stdout.flush()
+
+    def run_fanout_cmd(self, question, prompt, console=None, **options):
+        """Ask several models at once, `options` are `models`, `n` and `output_format`."""
+        from chatgpt_cli import fanout, render
+        from chatgpt_cli.chatapi import ChatMessage, ChatMessageType
+        session_mgr = chatapi.get_session_manager()
+        console = console or term.console
+        session = session_mgr.current_session
+        if config.get_prompt_message(prompt) is None:
+            raise error.CommandError(f"Prompt '{prompt}' is not found.")
+        session.prompt = prompt
+        session.add_message(ChatMessage(question, ChatMessageType.USER))
+        fan_out = fanout.FanOut(
+            session_mgr, session,
+            fanout.parse_models(options.get("models"),
+                                config.get_config().get('API', 'CHATGPT_MODEL')),
+            options.get("n", 1))
+        output_format = options.get("output_format", "markdown")
+        if output_format == "markdown":
+            fanout.show(console, fan_out, config.get_config().getfloat('CLI', 'refresh_rate'))
+        else:
+            with render.make_progress_bar(console) as progress:
+                progress.add_task(
+                    f":thinking_face: [green]Asking {len(fan_out.candidates)} candidates ...",
+                    total=None)
+                fan_out.run()
+            fanout.write(sys.stdout, fan_out.candidates, output_format)
+        if all(candidate.record.error for candidate in fan_out.candidates):
+            raise error.CommandError("Every candidate failed.")
 
-    def run_ask_cmd(self, question, stream_mode=True):
+    def run_ask_cmd(self, question, prompt=None, console=None, **options):
+        """Ask in the current session, `options` go to `ChatSessionManager.ask`."""
         session_mgr = chatapi.get_session_manager()
-        session_mgr.ask(question, stream=stream_mode, console=term.console)
-        term.console.print("\n")
+        console = console or term.console
+        if prompt is not None:
+            if config.get_prompt_message(prompt) is None:
+                raise error.CommandError(f"Prompt '{prompt}' is not found.")
+            session_mgr.current_session.prompt = prompt
+        options.setdefault("stream", True)
+        session_mgr.ask(question, console=console, **options)
+        if options.get("output_format", "markdown") == "markdown":
+            console.print("\n")
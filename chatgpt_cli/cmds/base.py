@@ -55,6 +55,26 @@ class BaseMultiCmd(Group):
                 self.add_command(subcmd)
 
 
+class LazyCmdGroup(Group):
+    """Group whose subcommands are imported when they are looked up.
+
+    `lazy_cmds` maps a subcommand name to its command class name, which is
+    resolved by `load_cmd`.
+    """
+
+    def __init__(self, *args, lazy_cmds: t.Optional[t.Dict[str, str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_cmds : t.Dict[str, str] = dict(lazy_cmds or {})
+
+    def list_commands(self, ctx: Context) -> t.List[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_cmds))
+
+    def get_command(self, ctx: Context, cmd_name: str) -> t.Optional[Command]:
+        if cmd_name not in self.commands and cmd_name in self.lazy_cmds:
+            self.add_command(load_cmd(self.lazy_cmds[cmd_name]), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
 def load_cmd(cmd_name: str) -> BaseCmd:
     # remove "Command" suffix
     if not cmd_name.endswith("Command"):
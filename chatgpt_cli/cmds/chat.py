@@ -2,29 +2,32 @@
 #
 # Copyright 2023, JayPei <jaypei97159@gmail.com>
 #
+# pylint: disable=import-outside-toplevel
 
 
 import sys
+import datetime
 import typing as t
 
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.formatted_text import AnyFormattedText
-from prompt_toolkit.completion import Completer, Completion, FuzzyCompleter
 
 from chatgpt_cli import chatapi
+from chatgpt_cli import jobs
 from chatgpt_cli import term
 from chatgpt_cli import error
 from chatgpt_cli import config
 from chatgpt_cli.cmds.base import BaseCmd
+from chatgpt_cli.completion import CompletionIndex
 from chatgpt_cli.term import split_command_line, multiline_input_with_editor
 
 
-CHAT_BANNER_LOGO = fr"""
+CHAT_BANNER_LOGO = r"""
    ________          __  __________  ______
   / ____/ /_  ____ _/ /_/ ____/ __ \/_  __/
  / /   / __ \/ __ `/ __/ / __/ /_/ / / /   
 / /___/ / / / /_/ / /_/ /_/ / ____/ / /    
-\____/_/ /_/\__,_/\__/\____/_/     /_/     Version {config.VERSION}
+\____/_/ /_/\__,_/\__/\____/_/     /_/     Version {version}
 """.lstrip("\n")
 CHAT_BANNER_INTRO = """\
 Welcome to ChatGPT-CLI, the command-line tool for ChatGPT!
@@ -39,7 +42,18 @@ class ChatCommand(BaseCmd):
     name = "chat"
     help = "Start a chat session in interactive mode."
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # filled in by `run` from the prompt history
+        self.completions = CompletionIndex()
+        self.key_bindings = self.make_key_bindings()
+
     def run(self, **kwargs) -> t.Any:
+        from chatgpt_cli import store
+        session_manager = chatapi.get_session_manager()
+        session_manager.attach_store(store.get_session_store())
+        session_manager.create(session_manager.new_session_name())
+        self.completions = make_completion_index()
         self.print_chat_banner()
         try:
             self.run_chat_loop()
@@ -50,41 +64,79 @@ class ChatCommand(BaseCmd):
             sys.exit(e.exit_code)
         except:    # pylint: disable=broad-exception-caught, bare-except
             term.console.print_exception()
+        finally:
+            self.jobs.shutdown()
+
+    @property
+    def jobs(self) -> jobs.JobManager:
+        return jobs.get_job_manager()
 
     def print_chat_banner(self):
-        term.console.print(CHAT_BANNER_LOGO.format(version=config.VERSION),
+        term.console.print(CHAT_BANNER_LOGO.format(version=config.get_version()),
                            style="bold", highlight=False)
         term.console.print(CHAT_BANNER_INTRO)
 
+    @staticmethod
+    def make_key_bindings() -> KeyBindings:
+        kb = KeyBindings()
+
+        @kb.add("f10")
+        def _(event):
+            event.app.current_buffer.text = multiline_input_with_editor(
+                event.app.current_buffer.text)
+
+        return kb
+
+    def announce_jobs(self):
+        for job in self.jobs.take_finished():
+            name = job.session.session_name
+            if job.error is None:
+                term.console.print(
+                    f"[dim]\\[bg #{job.job_id}] answer ready in '{name}'"
+                    f" after {job.elapsed:.1f}s, /switch {name} to read it.[/dim]",
+                    highlight=False)
+            else:
+                term.console.print(
+                    f"[bold red]\\[bg #{job.job_id}] '{name}' failed: {job.error}[/bold red]",
+                    highlight=False)
+
     def get_question(self):
         session_manager = chatapi.get_session_manager()
         while True:
+            self.announce_jobs()
             current_session = session_manager.current_session
             session_name = current_session.session_name
             conversation_count = str(current_session.conversation_count + 1)
             if current_session.no_context:
                 conversation_count = "*"
+            used_tokens, available_tokens = current_session.context_tokens()
             prompt_message :AnyFormattedText = [
                 ('class:prompt_name',  f'({current_session.prompt}) '),
                 ('class:session', f"{session_name} "),
                 ('class:conversation_count', f'{conversation_count} '),
+                ('class:tokens', f'[{used_tokens}/{available_tokens}] '),
                 ('class:prompt_sep',  '> '),
             ]
 
-            kb = KeyBindings()
-
-            @kb.add("f10")
-            def _(event):
-                event.app.current_buffer.text = multiline_input_with_editor(
-                    event.app.current_buffer.text)
-
+            # sessions are created, loaded and renamed by p-commands
+            self.completions.add_argument("/switch", session_name)
+            chatapi.prewarm_connection()
+            # the status line is redrawn while background requests run
+            busy = bool(self.jobs.active())
             question = term.prompt.prompt(
-                prompt_message, completer=FuzzyCompleter(CommandCompleter()),
-                key_bindings=kb)
+                prompt_message, completer=self.completions,
+                key_bindings=self.key_bindings,
+                bottom_toolbar=self.jobs.status if busy else None,
+                refresh_interval=0.5 if busy else 0)
             return question
 
     def ask_openai(self, question):
         session_mgr = chatapi.get_session_manager()
+        if session_mgr.current_session.pending:
+            # keep the turns of the session in order
+            term.console.print("[dim]Waiting for the background answer of this session...[/dim]")
+            self.jobs.wait(session_mgr.current_session)
+            self.announce_jobs()
         session_mgr.ask(question, stream=True, console=term.console)
         term.console.print("\n")
 
@@ -94,12 +146,17 @@ class ChatCommand(BaseCmd):
                 question = self.get_question()
                 if question == "":
                     continue
-                question_pcmd = split_command_line(question)
+                words = question.split(None, 1)
                 for cmd in PCOMMANDS:
-                    if question_pcmd[0] == cmd["match"]:
-                        cmd["cls"]().run(question_pcmd[1:])  # type: ignore
+                    if question.startswith("/") and words[0] == cmd["match"]:
+                        pcmd = cmd["cls"]()  # type: ignore
+                        if pcmd.raw_args:
+                            pcmd.run(words[1].strip() if len(words) > 1 else "")
+                        else:
+                            pcmd.run(split_command_line(question)[1:])
                         break
                 else:
+                    self.completions.add_question(question)
                     self.ask_openai(question)
             except EOFError:
                 raise error.CommandExit()
@@ -109,8 +166,13 @@ class ChatCommand(BaseCmd):
 
 class PCommandBase:
 
-    def complete(self, cmd, args) -> t.Iterator[Completion]:
-        return iter([])
+    # run with the rest of the line as it was typed instead of split
+    raw_args = False
+
+    @classmethod
+    def arguments(cls) -> t.Iterable[str]:
+        """Values completed as the first argument."""
+        return []
 
     def run(self, args):
         raise NotImplementedError()
@@ -119,18 +181,19 @@ class PCommandBase:
 class HistoryPCommand(PCommandBase):
 
     def run(self, args):
-        session_manager = chatapi.get_session_manager()
-        current_session = session_manager.current_session
-        for message in current_session.histories:
-            term.console.print(message.to_message_json())
+        from chatgpt_cli import pager
+        if args and not args[0].isdigit():
+            term.console.print("Usage: /hist [turn]")
+            return
+        current_session = chatapi.get_session_manager().current_session
+        pager.show_history(current_session.histories, int(args[0]) if args else None)
 
 
 class ContextPCommand(PCommandBase):
 
-    def complete(self, cmd, args) -> t.Iterator[Completion]:
-        if len(args) == 0:
-            yield Completion("on", start_position=-len(args))
-            yield Completion("off", start_position=-len(args))
+    @classmethod
+    def arguments(cls) -> t.Iterable[str]:
+        return ["on", "off"]
 
     def run(self, args):
         session_manager = chatapi.get_session_manager()
@@ -143,13 +206,15 @@ class ContextPCommand(PCommandBase):
             current_session.no_context = True
         else:
             term.console.print("Invalid argument.")
+            return
+        session_manager.save_session(current_session)
 
 
 class PromptPCommand(PCommandBase):
 
-    def complete(self, cmd, args) -> t.Iterator[Completion]:
-        for prompt_name in config.prompts():
-            yield Completion(prompt_name, start_position=-len(args))
+    @classmethod
+    def arguments(cls) -> t.Iterable[str]:
+        return config.prompts()
 
     def run(self, args):
         session_manager = chatapi.get_session_manager()
@@ -162,6 +227,8 @@ class PromptPCommand(PCommandBase):
             term.console.print(f"Prompt '{prompt_name}' is not found.")
             return
         current_session.prompt = prompt_name
+        session_manager.save_session(current_session)
+
 
 class TitlePCommand(PCommandBase):
 
@@ -172,7 +239,199 @@ class TitlePCommand(PCommandBase):
                 f"Current title is '{session_manager.current_session.session_name}'.")
             return
         title_name = args[0]
-        session_manager.current_session.session_name = title_name
+        try:
+            session_manager.rename(session_manager.current_session.session_name, title_name)
+        except error.CommandError as e:
+            term.console.print(f"[bold red]Error: {e.message}[/bold red]")
+
+
+class SessionsPCommand(PCommandBase):
+
+    def run(self, args):
+        session_manager = chatapi.get_session_manager()
+        limit = int(args[0]) if args and args[0].isdigit() else 20
+        current = session_manager.current_session
+        metas = session_manager.list_sessions()
+        for meta in metas[:limit]:
+            marker = "*" if meta.session_id == current.session_id else " "
+            updated = datetime.datetime.fromtimestamp(meta.updated).strftime("%Y-%m-%d %H:%M")
+            term.console.print(
+                f"{marker} #{meta.session_id:<5} [bold]{meta.name:16}[/bold] "
+                f"{meta.prompt:16} {meta.message_count:5} msgs  {updated}",
+                highlight=False)
+        if len(metas) > limit:
+            term.console.print(f"... {len(metas) - limit} more, /sessions <count> to list them.")
+        if current.session_id is None:
+            term.console.print(f"* (unsaved) [bold]{current.session_name}[/bold]", highlight=False)
+
+
+class SwitchPCommand(PCommandBase):
+
+    @classmethod
+    def arguments(cls) -> t.Iterable[str]:
+        return [meta.name for meta in chatapi.get_session_manager().list_sessions()]
+
+    def run(self, args):
+        session_manager = chatapi.get_session_manager()
+        if len(args) < 1:
+            term.console.print("Usage: /switch <session-name|#id>")
+            return
+        session = session_manager.switch(args[0])
+        term.console.print(
+            f"Switched to '{session.session_name}' ({len(session.histories)} messages).")
+
+
+class SearchPCommand(PCommandBase):
+
+    def run(self, args):
+        from rich.text import Text
+        from chatgpt_cli.store import MATCH_END, MATCH_START
+        if len(args) < 1:
+            term.console.print("Usage: /search <terms> (term* matches a prefix)")
+            return
+        hits = chatapi.get_session_manager().search(args)
+        if not hits:
+            term.console.print("No messages found.")
+            return
+        for hit in hits:
+            when = datetime.datetime.fromtimestamp(hit.timestamp).strftime("%Y-%m-%d %H:%M")
+            line = Text(f"#{hit.session_id:<5} ")
+            line.append(f"{hit.session_name:16}", style="bold")
+            line.append(f" {when} {hit.role:9} ")
+            snippet = " ".join(hit.snippet.split())
+            for i, part in enumerate(snippet.replace(MATCH_END, MATCH_START).split(MATCH_START)):
+                line.append(part, style="bold yellow" if i % 2 else None)
+            term.console.print(line, no_wrap=True, overflow="ellipsis")
+        term.console.print("[dim]/switch #<id> to open a session.[/dim]")
+
+
+class BgPCommand(PCommandBase):
+
+    raw_args = True
+
+    def run(self, args):
+        if not args:
+            term.console.print("Usage: /bg <question>")
+            return
+        session = chatapi.get_session_manager().current_session
+        pending = session.pending
+        job = jobs.get_job_manager().submit(session, args)
+        after = f", added after {pending} pending answers" if pending else ""
+        term.console.print(
+            f"[dim]\\[bg #{job.job_id}] asking in '{session.session_name}'{after}, "
+            f"/jobs to follow it.[/dim]", highlight=False)
+
+
+class ComparePCommand(PCommandBase):
+
+    raw_args = True
+
+    def run(self, args):
+        from chatgpt_cli import fanout
+        n = 1
+        words = args.split(None, 2)
+        if len(words) == 3 and words[0] == "-n" and words[1].isdigit():
+            n, args = int(words[1]), words[2]
+        words = args.split(None, 1)
+        if len(words) < 2 or n < 1:
+            term.console.print("Usage: /compare [-n <count>] <model[,model...]> <question>")
+            return
+        session_mgr = chatapi.get_session_manager()
+        session = session_mgr.current_session
+        if session.pending:
+            jobs.get_job_manager().wait(session)
+        session.add_message(chatapi.ChatMessage(words[1], chatapi.ChatMessageType.USER))
+        fan_out = fanout.FanOut(session_mgr, session,
+                                fanout.parse_models(words[0], session.default_model()), n)
+        candidates = fanout.show(term.console, fan_out,
+                                 config.get_config().getfloat('CLI', 'refresh_rate'),
+                                 numbered=True)
+        answered = [number for number, candidate in enumerate(candidates, 1)
+                    if candidate.record.error is None and candidate.parts]
+        if not answered:
+            term.console.print("[bold red]Every candidate failed.[/bold red]")
+            return
+        number = answered[0]
+        if len(answered) > 1:
+            number = self.choose(answered)
+        candidate = candidates[number - 1]
+        session.add_message(chatapi.ChatMessage(candidate.text, chatapi.ChatMessageType.ASSISTANT))
+        term.console.print(f"[dim]Kept \\[{number}] {candidate.label} in the history.[/dim]",
+                           highlight=False)
+
+    @staticmethod
+    def choose(numbers: t.List[int]) -> int:
+        while True:
+            try:
+                answer = term.prompt_no_hist.prompt(
+                    f"Keep which answer? [{numbers[0]}-{numbers[-1]}, Enter for {numbers[0]}] ")
+            except (EOFError, KeyboardInterrupt):
+                return numbers[0]
+            if not answer.strip():
+                return numbers[0]
+            if answer.strip().isdigit() and int(answer) in numbers:
+                return int(answer)
+
+
+class JobsPCommand(PCommandBase):
+
+    def run(self, args):
+        job_list = jobs.get_job_manager().jobs()
+        if not job_list:
+            term.console.print("No background requests.")
+            return
+        for job in job_list:
+            question = " ".join(job.question.message.split())
+            if len(question) > 40:
+                question = question[:39] + "…"
+            term.console.print(
+                f"#{job.job_id:<4} {job.state.value:8} [bold]{job.session.session_name:16}[/bold] "
+                f"{job.elapsed:6.1f}s {job.received:7} chars  {question}",
+                highlight=False)
+            if job.error is not None:
+                term.console.print(f"      [red]{job.error}[/red]", highlight=False)
+
+
+class StatsPCommand(PCommandBase):
+
+    GROUPS : t.Dict[str, t.Callable[[t.Any], str]] = {
+        "session": lambda record: record.session,
+        "model": lambda record: record.model,
+    }
+
+    @classmethod
+    def arguments(cls) -> t.Iterable[str]:
+        return list(cls.GROUPS) + ["clear"]
+
+    def run(self, args):
+        from rich.table import Table
+        from chatgpt_cli import metrics
+        recorder = metrics.get_recorder()
+        if args and args[0] == "clear":
+            recorder.clear()
+            term.console.print("Request statistics cleared.")
+            return
+        if not recorder.records():
+            term.console.print("No requests yet.")
+            return
+        groups = [args[0]] if args and args[0] in self.GROUPS else list(self.GROUPS)
+        for group in groups:
+            table = Table(title=f"Requests by {group}", title_justify="left",
+                          caption="milliseconds, p50 unless noted", caption_justify="left")
+            table.add_column(group, no_wrap=True)
+            for column in ("reqs", "hits", "errs", "conn", "ttft p50/95",
+                           "total p50/95", "render", "tok/s"):
+                table.add_column(column, justify="right")
+            for name, row in recorder.summarize(self.GROUPS[group]).items():
+                ms = {column: f"{row[column] * 1000:.0f}" for column, metric, _ in
+                      metrics.SUMMARY_COLUMNS if metric != "tokens_per_s"}
+                table.add_row(
+                    name, str(int(row["requests"])), str(int(row["cached"])),
+                    str(int(row["errors"])), ms["connect p50"],
+                    f"{ms['ttft p50']}/{ms['ttft p95']}",
+                    f"{ms['total p50']}/{ms['total p95']}",
+                    ms["render p50"], f"{row['tokens/s p50']:.0f}")
+            term.console.print(table)
 
 
 class ExitPCommand(PCommandBase):
@@ -190,38 +449,34 @@ class HelpPCommand(PCommandBase):
 
 # pylint: disable=line-too-long
 PCOMMANDS = [
-    { "match": "/hist", "desc": "Show history", "cls": HistoryPCommand },
+    { "match": "/hist", "desc": "Page through the history. Ex. /hist [turn]", "cls": HistoryPCommand },
     { "match": "/context", "desc": "Turn on/off context. Ex. /context <on|off>", "cls": ContextPCommand },
     { "match": "/prompt", "desc": "Change prompt. Ex. /prompt <prompt-name>", "cls": PromptPCommand },
     { "match": "/title", "desc": "Change title. Ex. /title <title-name>", "cls": TitlePCommand },
+    { "match": "/sessions", "desc": "List saved sessions. Ex. /sessions [count]", "cls": SessionsPCommand },
+    { "match": "/switch", "desc": "Switch session, created if missing. Ex. /switch <name|#id>", "cls": SwitchPCommand },
+    { "match": "/search", "desc": "Search all messages. Ex. /search <terms>", "cls": SearchPCommand },
+    { "match": "/bg", "desc": "Ask in the background. Ex. /bg <question>", "cls": BgPCommand },
+    { "match": "/compare", "desc": "Ask several models at once. Ex. /compare [-n 2] <model,model> <question>", "cls": ComparePCommand },
+    { "match": "/jobs", "desc": "List background requests", "cls": JobsPCommand },
+    { "match": "/stats", "desc": "Request latency percentiles. Ex. /stats [session|model|clear]", "cls": StatsPCommand },
     { "match": "/exit", "desc": "Exit the program", "cls": ExitPCommand },
     { "match": "/quit", "desc": "Exit the program", "cls": ExitPCommand },
     { "match": "/help", "desc": "Show help", "cls": HelpPCommand },
 ]
 
 
-class CommandCompleter(Completer):
-
-    def get_completions(self, document, complete_event) -> t.Iterator[Completion]:
-        if not document.text.startswith("/"):
-            return
-        pargs = split_command_line(document.text)
-        if len(pargs) == 0:
-            return
-        input_cmd: str = pargs[0]
-        input_args: t.List[str] = pargs[1:]
-        matched_cls : t.Optional[t.Type[PCommandBase]] = None
-        for cmd in PCOMMANDS:
-            match: str = cmd.get("match")  # type: ignore
-            if input_cmd == match:
-                matched_cls: t.Type[PCommandBase] = cmd.get("cls")  # type: ignore
+def make_completion_index() -> CompletionIndex:
+    index = CompletionIndex()
+    for pcmd in PCOMMANDS:
+        index.add_command(pcmd["match"], pcmd["cls"].arguments())  # type: ignore
+    recent : t.List[str] = []
+    # newest first
+    for question in term.prompt.history.load_history_strings():
+        if not question.startswith("/"):
+            recent.append(question)
+            if len(recent) >= index.max_questions:
                 break
-            if match.startswith(input_cmd):
-                yield Completion(
-                    match,
-                    start_position=-len(input_cmd),
-                )
-        if matched_cls is None:
-            return
-        pcommand = matched_cls()
-        yield from pcommand.complete(input_cmd, input_args)
+    for question in reversed(recent):
+        index.add_question(question)
+    return index
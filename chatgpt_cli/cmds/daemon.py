@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+# pylint: disable=import-outside-toplevel
+
+
+import sys
+import typing as t
+
+import click
+
+from chatgpt_cli import term
+from chatgpt_cli import error
+from chatgpt_cli.cmds.base import BaseCmd
+
+
+class DaemonCommand(BaseCmd):
+
+    name = "daemon"
+    help = "Answer `ask` from this process, kept warm, until stopped."
+    opts = [
+        click.Option(
+            ["--stop"],
+            is_flag=True,
+            help="Stop the running daemon.",
+        ),
+        click.Option(
+            ["--status"],
+            is_flag=True,
+            help="Tell whether a daemon is running.",
+        ),
+    ]
+
+    def run(self, **kwargs) -> t.Any:
+        from chatgpt_cli import daemon
+        if not daemon.is_supported():
+            term.console.print("[bold red]Error: Unix sockets are not supported here.[/bold red]")
+            sys.exit(1)
+        path = daemon.socket_path()
+        if kwargs.get("stop") or kwargs.get("status"):
+            sock = daemon.connect(path)
+            if sock is None:
+                term.console.print("No daemon is running.")
+                sys.exit(1)
+            reply = next(daemon.request(sock, {"type": "stop" if kwargs.get("stop") else "ping"}),
+                         None)
+            if reply is None:
+                term.console.print("[bold red]Error: The daemon did not answer.[/bold red]")
+                sys.exit(1)
+            state = "stopping" if kwargs.get("stop") else "running"
+            term.console.print(f"Daemon {reply['pid']} {state} on {path}.", highlight=False)
+            return
+        try:
+            server = daemon.DaemonServer(path)
+        except error.CommandError as e:
+            term.console.print(f"[bold red]Error: {e.message}[/bold red]")
+            sys.exit(e.exit_code)
+        with server:
+            server.warm_up()
+            term.console.print(f"Listening on [bold blue]{path}[/bold blue], "
+                               f"Ctrl-C or `chatgpt-cli daemon --stop` to stop.")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        term.console.print("Bye!")
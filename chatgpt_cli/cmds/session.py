@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+# pylint: disable=import-outside-toplevel
+
+
+import sys
+import datetime
+import contextlib
+import typing as t
+
+import click
+
+from chatgpt_cli import term
+from chatgpt_cli import error
+from chatgpt_cli.cmds.base import BaseCmd, BaseMultiCmd
+
+if t.TYPE_CHECKING:
+    from chatgpt_cli.archive import ArchivedSession, ArchiveReader, ArchiveWriter
+    from chatgpt_cli.chatapi import ChatMessage
+    from chatgpt_cli.store import SessionMeta, SessionStore
+
+
+class SessionCommand(BaseMultiCmd):
+
+    name = "session"
+    help = "Export and import saved chat sessions."
+
+    def __init__(self, *args, **kwargs):
+        self.subcommands = [
+            SessionExportCommand(),
+            SessionImportCommand(),
+            SessionListCommand(),
+        ]
+        super().__init__(*args, **kwargs)
+
+
+def _open(path: str, mode: str) -> t.ContextManager[t.BinaryIO]:
+    if path == "-":
+        stream = sys.stdout.buffer if "w" in mode else sys.stdin.buffer
+        return contextlib.nullcontext(stream)
+    return t.cast(t.BinaryIO, open(path, mode))  # pylint: disable=consider-using-with
+
+
+def _fail(e: t.Union[error.CommandError, OSError]) -> t.NoReturn:
+    if isinstance(e, OSError):
+        where = f": {e.filename}" if e.filename else ""
+        e = error.CommandError(f"{e.strerror or e}{where}")
+    term.err_console.print(f"[bold red]Error: {e.message}[/bold red]")
+    sys.exit(e.exit_code)
+
+
+class SessionExportCommand(BaseCmd):
+
+    name = "export"
+    help = "Write saved sessions, all of them by default, to an archive."
+    opts = [
+        click.Option(
+            ["--codec"],
+            type=click.Choice(["gzip", "zstd"]),
+            default="gzip",
+            show_default=True,
+            help="Compression of the archive blocks, zstd needs the zstandard package.",
+        ),
+        click.Argument(
+            ["output"],
+            type=click.Path(dir_okay=False, allow_dash=True),
+        ),
+        click.Argument(
+            ["sessions"],
+            nargs=-1,
+        ),
+    ]
+
+    def run(self, **kwargs) -> t.Any:
+        from chatgpt_cli import archive, store
+        session_store = store.get_session_store()
+        metas = session_store.list_sessions()[::-1]
+        if kwargs["sessions"]:
+            metas = []
+            for name in kwargs["sessions"]:
+                meta = session_store.find_session(name)
+                if meta is None:
+                    _fail(error.CommandError(f"Session '{name}' is not found."))
+                metas.append(meta)
+        try:
+            with _open(kwargs["output"], "wb") as out:
+                writer = archive.ArchiveWriter(out, codec=kwargs["codec"])
+                self._write(writer, session_store, metas)
+        except (error.CommandError, OSError) as e:
+            _fail(e)
+        messages = sum(entry.message_count for entry in writer.sessions)
+        term.err_console.print(f"Exported {len(writer.sessions)} sessions, {messages} messages.")
+
+    @staticmethod
+    def _write(
+        writer: "ArchiveWriter", session_store: "SessionStore", metas: t.Iterable["SessionMeta"]
+    ):
+        from chatgpt_cli.chatapi import ChatMessage, ChatMessageType
+        for meta in metas:
+            writer.add_session(meta.name, meta.prompt, meta.no_context,
+                               meta.created, meta.updated)
+            for role, content, timestamp in session_store.iter_messages(meta.session_id):
+                writer.add_message(ChatMessage(content, ChatMessageType(role), timestamp))
+        writer.close()
+
+
+class SessionImportCommand(BaseCmd):
+
+    name = "import"
+    help = "Save the sessions of an archive, as new sessions."
+    opts = [
+        click.Option(
+            ["--session", "names"],
+            multiple=True,
+            help="Import only this session, read through the index "
+                 "of a seekable archive. Repeatable.",
+        ),
+        click.Argument(
+            ["input"],
+            type=click.Path(dir_okay=False, allow_dash=True, exists=True),
+        ),
+    ]
+
+    def run(self, **kwargs) -> t.Any:
+        from chatgpt_cli import archive, store
+        session_store = store.get_session_store()
+        names = set(kwargs["names"])
+        imported = []
+        try:
+            with _open(kwargs["input"], "rb") as inp:
+                if names and not inp.seekable():
+                    raise error.CommandError("--session reads the archive index, "
+                                             "it needs a file, not a pipe.")
+                reader = archive.ArchiveReader(inp)
+                if names:
+                    for entry in self._find(reader, names):
+                        imported.append(self._save(session_store, entry,
+                                                   reader.iter_messages(entry)))
+                else:
+                    for entry, messages in reader.sessions():
+                        imported.append(self._save(session_store, entry, messages))
+        except (error.CommandError, OSError) as e:
+            _fail(e)
+        for name, session_id in imported:
+            term.console.print(f"Imported [bold]{name}[/bold] as #{session_id}.",
+                               highlight=False)
+
+    @staticmethod
+    def _find(reader: "ArchiveReader", names: t.Set[str]) -> t.List["ArchivedSession"]:
+        entries = [entry for entry in reader.index() if entry.name in names]
+        missing = names - {entry.name for entry in entries}
+        if missing:
+            raise error.CommandError(f"Not in the archive: {', '.join(sorted(missing))}.")
+        return entries
+
+    @staticmethod
+    def _save(
+        session_store: "SessionStore", entry: "ArchivedSession",
+        messages: t.Iterable["ChatMessage"]
+    ) -> t.Tuple[str, int]:
+        return entry.name, session_store.import_session(
+            entry.name, entry.prompt, entry.no_context, created=entry.created,
+            updated=entry.updated, messages=messages)
+
+
+class SessionListCommand(BaseCmd):
+
+    name = "list"
+    help = "List the sessions of an archive."
+    opts = [
+        click.Argument(
+            ["input"],
+            type=click.Path(dir_okay=False, exists=True),
+        ),
+    ]
+
+    def run(self, **kwargs) -> t.Any:
+        from chatgpt_cli import archive
+        try:
+            with open(kwargs["input"], "rb") as inp:
+                entries = archive.ArchiveReader(inp).index()
+        except (error.CommandError, OSError) as e:
+            _fail(e)
+        for entry in entries:
+            updated = datetime.datetime.fromtimestamp(entry.updated).strftime("%Y-%m-%d %H:%M")
+            term.console.print(
+                f"[bold]{entry.name:16}[/bold] {entry.prompt:16} "
+                f"{entry.message_count:5} msgs  {updated}", highlight=False)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import collections
+import typing as t
+
+from prompt_toolkit.completion import CompleteEvent, Completer, Completion, FuzzyCompleter
+from prompt_toolkit.document import Document
+
+
+# longest p-command line worth completing, and recent questions offered
+_MAX_COMMAND_LENGTH = 1024
+_MAX_QUESTIONS = 1000
+# questions are shown cut to this length in the completion menu
+_DISPLAY_LENGTH = 60
+
+
+class _Node:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self, terminal: bool = False):
+        # first character of an edge -> (edge label, child)
+        self.children : t.Dict[str, t.Tuple[str, "_Node"]] = {}
+        self.terminal = terminal
+
+
+class RadixTrie:
+    """Set of strings in a compressed prefix trie.
+
+    Edges carry whole substrings, so the trie has at most two nodes per word
+    however long the words are.  `max_length` lets a lookup give up on a
+    prefix longer than any word without reading it.
+    """
+
+    def __init__(self, words: t.Iterable[str] = ()):
+        self._root = _Node()
+        self._size = 0
+        self.max_length = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, word: object) -> bool:
+        if not isinstance(word, str):
+            return False
+        node = self._find(word)
+        return node is not None and node[1] == "" and node[0].terminal
+
+    def add(self, word: str):
+        node, rest = self._root, word
+        while rest:
+            entry = node.children.get(rest[0])
+            if entry is None:
+                node.children[rest[0]] = (rest, _Node(terminal=True))
+                self._added(word)
+                return
+            label, child = entry
+            common = _common_prefix(label, rest)
+            if common < len(label):
+                # split the edge at the end of the common part
+                middle = _Node()
+                middle.children[label[common]] = (label[common:], child)
+                node.children[rest[0]] = (label[:common], middle)
+                child = middle
+            node, rest = child, rest[common:]
+        if not node.terminal:
+            node.terminal = True
+            self._added(word)
+
+    def _added(self, word: str):
+        self._size += 1
+        self.max_length = max(self.max_length, len(word))
+
+    def discard(self, word: str):
+        if self._discard(self._root, word):
+            self._size -= 1
+
+    def _discard(self, node: _Node, rest: str) -> bool:
+        if not rest:
+            if not node.terminal:
+                return False
+            node.terminal = False
+            return True
+        entry = node.children.get(rest[0])
+        if entry is None or not rest.startswith(entry[0]):
+            return False
+        label, child = entry
+        if not self._discard(child, rest[len(label):]):
+            return False
+        # drop the emptied child, or merge it with its only edge
+        if not child.terminal and not child.children:
+            del node.children[rest[0]]
+        elif not child.terminal and len(child.children) == 1:
+            (child_label, grandchild), = child.children.values()
+            node.children[rest[0]] = (label + child_label, grandchild)
+        return True
+
+    def _find(self, prefix: str) -> t.Optional[t.Tuple[_Node, str]]:
+        """The node under which the words starting with `prefix` are, and the
+        part of its edge label beyond `prefix`."""
+        node, rest = self._root, prefix
+        while rest:
+            entry = node.children.get(rest[0])
+            if entry is None:
+                return None
+            label, child = entry
+            if len(rest) <= len(label):
+                return (child, label[len(rest):]) if label.startswith(rest) else None
+            if not rest.startswith(label):
+                return None
+            node, rest = child, rest[len(label):]
+        return node, ""
+
+    def iter_prefix(self, prefix: str, limit: t.Optional[int] = None) -> t.Iterator[str]:
+        """Words starting with `prefix`, in sorted order."""
+        if len(prefix) > self.max_length:
+            return
+        found = self._find(prefix)
+        if found is None:
+            return
+        node, tail = found
+        count = 0
+        stack = [(prefix + tail, node)]
+        while stack:
+            word, node = stack.pop()
+            if node.terminal:
+                yield word
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+            for key in sorted(node.children, reverse=True):
+                label, child = node.children[key]
+                stack.append((word + label, child))
+
+
+def _common_prefix(a: str, b: str) -> int:
+    i = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        i += 1
+    return i
+
+
+class _CommandCompleter(Completer):
+
+    def __init__(self, index: "CompletionIndex"):
+        self.index = index
+
+    def get_completions(self, document: Document,
+                        complete_event: CompleteEvent) -> t.Iterator[Completion]:
+        command, sep, argument = document.text_before_cursor.partition(" ")
+        if not sep:
+            for name in self.index.commands.iter_prefix(command):
+                yield Completion(name, start_position=-len(command))
+            return
+        values = self.index.arguments.get(command)
+        argument = argument.lstrip()
+        if values is None or " " in argument:
+            return
+        for value in values.iter_prefix(argument):
+            yield Completion(value, start_position=-len(argument))
+
+
+class CompletionIndex(Completer):
+    """Completions of the chat prompt, built once and kept up to date.
+
+    A line starting with "/" completes p-commands and their first argument,
+    fuzzily when nothing starts with what was typed.  Any other line
+    completes to one of the recent questions it starts; it isn't read at all
+    when it's longer than all of them, so a large paste costs nothing.
+    """
+
+    def __init__(self, max_questions: int = _MAX_QUESTIONS):
+        self.commands = RadixTrie()
+        self.arguments : t.Dict[str, RadixTrie] = {}
+        self.questions = RadixTrie()
+        self.max_questions = max_questions
+        self._recent : "collections.OrderedDict[str, None]" = collections.OrderedDict()
+        self._commands = _CommandCompleter(self)
+        self._fuzzy_commands = FuzzyCompleter(self._commands)
+
+    def add_command(self, name: str, arguments: t.Iterable[str] = ()):
+        self.commands.add(name)
+        for argument in arguments:
+            self.add_argument(name, argument)
+
+    def add_argument(self, command: str, value: str):
+        self.arguments.setdefault(command, RadixTrie()).add(value)
+
+    def add_question(self, question: str):
+        question = question.strip()
+        if not question or question.startswith("/"):
+            return
+        if question in self._recent:
+            self._recent.move_to_end(question)
+            return
+        self._recent[question] = None
+        self.questions.add(question)
+        while len(self._recent) > self.max_questions:
+            oldest, _ = self._recent.popitem(last=False)
+            self.questions.discard(oldest)
+
+    def get_completions(self, document: Document,
+                        complete_event: CompleteEvent) -> t.Iterator[Completion]:
+        text = document.text
+        if text.startswith("/"):
+            if len(text) <= _MAX_COMMAND_LENGTH and "\n" not in text:
+                # the trie finds prefix matches directly, fuzzy matching has
+                # to go through all the candidates
+                found = list(self._commands.get_completions(document, complete_event))
+                yield from found or self._fuzzy_commands.get_completions(
+                    document, complete_event)
+            return
+        if len(text) > self.questions.max_length or not document.is_cursor_at_the_end \
+                or not text.strip():
+            return
+        for question in self.questions.iter_prefix(text, limit=20):
+            if question != text:
+                display = question if len(question) <= _DISPLAY_LENGTH \
+                    else question[:_DISPLAY_LENGTH - 3] + "..."
+                yield Completion(question, start_position=-len(text), display=display)
@@ -9,10 +9,7 @@ import os
 import configparser
 import typing as t
 
-import pkg_resources
-
 from chatgpt_cli import term
-from chatgpt_cli import chatapi
 
 
 _NO_KEY_MESSAGE = """Please input your "OpenAI API key".
@@ -21,7 +18,27 @@ You can get it from https://beta.openai.com/account/api-keys"""
 _CONFIG : configparser.ConfigParser
 _CONFIG_FILE_NAME = 'config.toml'
 _PROMPTS : t.Dict[str, str] = {}
-VERSION = pkg_resources.get_distribution("chatgpt_cli").version
+_VERSION : t.Optional[str] = None
+
+
+def get_version() -> str:
+    global _VERSION
+    if _VERSION is None:
+        try:
+            from importlib import metadata  # pylint: disable=import-outside-toplevel
+            _VERSION = metadata.version("chatgpt-cli")
+        except ImportError:
+            # python 3.7 has no importlib.metadata
+            import pkg_resources  # pylint: disable=import-outside-toplevel
+            _VERSION = pkg_resources.get_distribution("chatgpt-cli").version
+    return _VERSION
+
+
+def __getattr__(name: str) -> t.Any:
+    # `VERSION` used to be resolved at import time
+    if name == "VERSION":
+        return get_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_prompt_message(name: str) -> t.Optional[str]:
@@ -57,11 +74,50 @@ def init_opts():
     conf['CLI'] = {
         'default_prompt': 'assist',
         'default_enable_context': 'false',
+        # max repaints per second of streamed answers, 0 repaints every delta
+        'refresh_rate': '20',
+        # saved chat sessions kept in memory, the others are read on /switch
+        'max_loaded_sessions': '8',
+        # questions of /bg answered at the same time, the others wait
+        'max_background_requests': '2',
+        # connect to the API while a question is typed, saving a TLS handshake
+        'prewarm_connection': 'true',
+        # JSONL file `ask` appends per-request timings to, empty disables it
+        'metrics_log': '',
+        # prompt history entries kept, longer entries are not saved
+        'history_size': '10000',
+        'history_max_chars': '16384',
     }
     conf['API'] = {
         'OPENAI_API_KEY': '',
+        # empty uses https://api.openai.com/v1
+        'OPENAI_API_BASE': '',
         'CHATGPT_MODEL': 'gpt-3.5-turbo',
-        'TEMPERATURE': '0'
+        'TEMPERATURE': '0',
+        # 0 uses the known context window of CHATGPT_MODEL
+        'CONTEXT_WINDOW': '0',
+        # tokens of the context window kept free for the answer
+        'REPLY_TOKEN_RESERVE': '1024',
+        # requests and tokens per minute shared by every chatgpt-cli process,
+        # 0 keeps to the limits the API reports
+        'RPM_LIMIT': '0',
+        'TPM_LIMIT': '0',
+        # retries of a request failing with a 429, a 5xx or a network error
+        'MAX_RETRIES': '4',
+    }
+    conf['CACHE'] = {
+        # response cache of `ask`, only temperature 0 is cached by default
+        'enable': 'true',
+        'nondeterministic': 'false',
+        'max_size_mb': '64',
+        # seconds, 0 keeps entries until evicted by size
+        'ttl': '604800',
+        # also answer a one-shot question from the cache when it is this
+        # similar (Jaccard over its normalized text) to a cached one
+        'similar': 'false',
+        'similar_threshold': '0.8',
+        # questions indexed for it, about 400 bytes each, 0 keeps them all
+        'similar_max_entries': '100000',
     }
     # pylint: disable=line-too-long
     conf['PROMPT'] = {
@@ -83,6 +139,7 @@ def load_config():
 
 def create_config():
     global _CONFIG_FILE_NAME
+    from chatgpt_cli import chatapi  # pylint: disable=import-outside-toplevel
     conf = get_config()
     config_dir = get_config_dir()
     config_file = os.path.join(config_dir, _CONFIG_FILE_NAME)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Serve `ask` from a long-lived process over a Unix socket.
+
+The daemon keeps the config, the imported API client, its pooled
+connections and the response cache warm; `ask` forwards its question and
+reads the answer back instead of paying for all of that on every call.
+
+The protocol is JSON lines.  The client sends one request object, the
+daemon answers with the lines of `output.JsonlWriter` (``delta`` objects
+then a ``done`` one), or one ``{"type": "error", ...}`` object when the
+request is refused or fails before it is answered.
+"""
+
+
+import io
+import os
+import json
+import socket
+import itertools
+import threading
+import socketserver
+import typing as t
+
+from chatgpt_cli import config
+from chatgpt_cli.error import CommandError
+
+
+_SOCKET_FILE_NAME = "daemon.sock"
+
+
+def is_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def socket_path(config_dir: t.Optional[str] = None) -> str:
+    return os.path.join(config_dir or config.get_config_dir(), _SOCKET_FILE_NAME)
+
+
+def connect(path: str) -> t.Optional[socket.socket]:
+    """A connection to the daemon listening on `path`, None if there is none."""
+    if not is_supported() or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # pylint: disable=no-member
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def request(sock: socket.socket, message: t.Dict[str, t.Any]) -> t.Iterator[t.Dict[str, t.Any]]:
+    """Send `message` and yield the objects the daemon answers with."""
+    with sock:
+        sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as reader:
+            for line in reader:
+                yield json.loads(line)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    server : "DaemonServer"
+
+    def handle(self):
+        out = io.TextIOWrapper(t.cast(t.BinaryIO, self.wfile), encoding="utf-8", newline="\n")
+        try:
+            message = json.loads(self.rfile.readline() or "null")
+            if not isinstance(message, dict):
+                raise CommandError("Invalid request.")
+            self.server.dispatch(message, out)
+        except CommandError as e:
+            self._error(out, e.message, e.exit_code)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self._error(out, f"{type(e).__name__}: {e}", 1)
+        finally:
+            try:
+                out.flush()
+            except OSError:
+                pass
+            out.detach()
+
+    @staticmethod
+    def _error(out: t.TextIO, message: str, exit_code: int):
+        try:
+            out.write(json.dumps({"type": "error", "message": message,
+                                  "exit_code": exit_code}, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers `ask` requests, each in its own thread and throwaway session."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        stale = connect(path)
+        if stale is not None:
+            stale.close()
+            raise CommandError(f"A daemon is already listening on {path}.")
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self._requests = itertools.count(1)
+        super().__init__(path, _Handler)
+
+    def server_bind(self):
+        # the socket answers with the user's API key, keep it to the user
+        umask = os.umask(0o077)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def dispatch(self, message: t.Dict[str, t.Any], out: t.TextIO):
+        kind = message.get("type")
+        if kind == "ask":
+            self.ask(message, out)
+        elif kind == "ping":
+            out.write(json.dumps({"type": "pong", "pid": os.getpid()}) + "\n")
+        elif kind == "stop":
+            out.write(json.dumps({"type": "stopping", "pid": os.getpid()}) + "\n")
+            # shutdown waits for serve_forever, which waits for this handler
+            threading.Thread(target=self.shutdown, daemon=True).start()
+        else:
+            raise CommandError(f"Unknown request type {kind!r}.")
+
+    def ask(self, message: t.Dict[str, t.Any], out: t.TextIO):
+        from rich.console import Console  # pylint: disable=import-outside-toplevel
+        from chatgpt_cli import chatapi  # pylint: disable=import-outside-toplevel
+        prompt = message.get("prompt") or config.get_config()['CLI']['default_prompt']
+        if config.get_prompt_message(prompt) is None:
+            raise CommandError(f"Prompt '{prompt}' is not found.")
+        question = message.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise CommandError("No question.")
+        session = chatapi.ChatSession(f"daemon-{next(self._requests)}", prompt)
+        chatapi.get_session_manager().ask(
+            question, stream=bool(message.get("stream", True)),
+            console=Console(file=io.StringIO(), quiet=True),
+            use_cache=bool(message.get("use_cache", True)),
+            refresh_cache=bool(message.get("refresh_cache", False)),
+            output_format="jsonl", out=out, session=session)
+
+    def warm_up(self):
+        """Pay for the imports and the first connection before any request."""
+        from chatgpt_cli import cache, chatapi, pipeline  # pylint: disable=unused-import,import-outside-toplevel
+        chatapi.get_openai()
+        chatapi.prewarm_connection()
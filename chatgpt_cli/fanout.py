@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import json
+import time
+import threading
+import typing as t
+from concurrent import futures
+
+import attrs
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
+
+from chatgpt_cli import metrics, tokens, transport
+from chatgpt_cli.chatapi import ChatSession, ChatSessionManager
+
+if t.TYPE_CHECKING:
+    from rich.console import Console, RenderableType
+
+
+# candidates side by side, more wrap to the next row
+_MAX_COLUMNS = 3
+
+
+@attrs.define(eq=False)
+class Candidate:
+    """One answer of a fan-out, the `index`th choice of its model's request."""
+    model : str
+    index : int
+    label : str
+    record : metrics.RequestMetrics
+    parts : t.List[str] = attrs.field(factory=list)
+    done : bool = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class FanOut:
+    """Ask the pending question of a session to several models at once.
+
+    Every model gets one streamed request for `n` choices, all requests run
+    concurrently and every choice becomes a `Candidate` with its own time to
+    first token and total latency.  Nothing is added to the session, the
+    caller keeps the candidate it wants.
+    """
+
+    def __init__(self, session_mgr: ChatSessionManager, session: ChatSession,
+                 models: t.Sequence[str], n: int = 1):
+        self.session_mgr = session_mgr
+        self.session = session
+        self.models = list(dict.fromkeys(models))
+        self.n = max(1, n)
+        self.candidates : t.List[Candidate] = []
+        self._lock = threading.Lock()
+        # the responses being read, to close them on abort; None once aborted
+        self._responses : t.Optional[t.List[t.Any]] = []
+        for model in self.models:
+            for index in range(self.n):
+                label = model if self.n == 1 else f"{model} #{index + 1}"
+                record = metrics.RequestMetrics(session.session_name, model, stream=True)
+                self.candidates.append(Candidate(model, index, label, record))
+
+    def run(self, on_tick: t.Optional[t.Callable[[], None]] = None,
+            interval: float = 0.05) -> t.List[Candidate]:
+        """Wait for every candidate, calling `on_tick` every `interval` meanwhile.
+
+        On Ctrl-C the connections are closed and the requests not waited for.
+        """
+        pool = futures.ThreadPoolExecutor(  # pylint: disable=consider-using-with
+            max_workers=len(self.models), thread_name_prefix="fan-out")
+        try:
+            pending = {pool.submit(self._request, model) for model in self.models}
+            while pending:
+                _, pending = futures.wait(pending, timeout=interval)
+                if on_tick is not None:
+                    on_tick()
+        except BaseException:
+            self._abort()
+            pool.shutdown(wait=False)
+            raise
+        pool.shutdown()
+        return self.candidates
+
+    def _opened(self, response: t.Any):
+        """Keep the response just opened, closing it at once if aborted."""
+        http_response = transport.take_last_response()
+        if http_response is not None:
+            response = http_response
+        with self._lock:
+            if self._responses is not None:
+                self._responses.append(response)
+                return
+        _close(response)
+
+    def _abort(self):
+        with self._lock:
+            responses, self._responses = self._responses or [], None
+        for response in responses:
+            _close(response)
+
+    def _request(self, model: str):
+        candidates = {c.index: c for c in self.candidates if c.model == model}
+        start = time.perf_counter()
+        first : t.Dict[int, float] = {}
+        last : t.Dict[int, float] = {}
+        transport.take_connect_time()
+        try:
+            response = self.session_mgr.stream_choices(self.session, model, self.n)
+            self._opened(response)
+            self._connected(candidates.values(), time.perf_counter() - start)
+            for chunk in response:
+                now = time.perf_counter()
+                for choice in chunk['choices']:
+                    chosen = candidates.get(choice.get('index', 0))
+                    if chosen is None:
+                        continue
+                    content = choice['delta'].get("content")
+                    if content:
+                        first.setdefault(chosen.index, now)
+                        last[chosen.index] = now
+                        chosen.parts.append(content)
+                        chosen.record.chunks += 1
+                    if choice.get('finish_reason') is not None:
+                        self._finish(chosen, start, first, last)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            for candidate in candidates.values():
+                if not candidate.done:
+                    candidate.record.error = f"{type(e).__name__}: {e}"
+        finally:
+            for candidate in candidates.values():
+                self._finish(candidate, start, first, last)
+
+    @staticmethod
+    def _connected(candidates: t.Iterable[Candidate], wait: float):
+        connect = transport.take_connect_time()
+        for candidate in candidates:
+            candidate.record.wait = wait
+            candidate.record.connect = connect
+
+    @staticmethod
+    def _finish(candidate: Candidate, start: float,
+                first: t.Dict[int, float], last: t.Dict[int, float]):
+        if candidate.done:
+            return
+        record = candidate.record
+        end = time.perf_counter()
+        if candidate.index in first:
+            record.ttft = first[candidate.index] - start
+            record.streaming = last[candidate.index] - first[candidate.index]
+        record.total = end - start
+        if candidate.parts:
+            record.tokens = _count_tokens(candidate)
+        candidate.done = True
+        metrics.get_recorder().record(record)
+
+
+def _close(response: t.Any):
+    close = getattr(response, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:  # pylint: disable=broad-exception-caught
+        # e.g. a generator still running in its thread
+        pass
+
+
+def _count_tokens(candidate: Candidate) -> int:
+    return tokens.count_tokens(candidate.text, candidate.model)
+
+
+def parse_models(value: t.Optional[str], default: str) -> t.List[str]:
+    """Comma separated model names, `default` when empty."""
+    models = [model.strip() for model in (value or "").split(",") if model.strip()]
+    return models or [default]
+
+
+def _caption(candidate: Candidate) -> str:
+    record = candidate.record
+    if record.error is not None:
+        return record.error
+    if not candidate.parts:
+        return "waiting" if not candidate.done else "empty"
+    caption = f"ttft {record.ttft:.2f}s"
+    if candidate.done:
+        caption += f"  total {record.total:.2f}s  {record.tokens} tokens"
+    return caption
+
+
+def _panel(candidate: Candidate, height: t.Optional[int], title: str) -> "RenderableType":
+    body : "RenderableType"
+    if height is None:
+        body = Markdown(candidate.text)
+    else:
+        # the tail, as the answer grows past the screen
+        body = Text("\n".join(candidate.text.split("\n")[-height:]))
+    return Panel(body, title=title, title_align="left",
+                 subtitle=Text(_caption(candidate)), subtitle_align="right",
+                 border_style="red" if candidate.record.error else "blue")
+
+
+def render_candidates(candidates: t.Sequence[Candidate], height: t.Optional[int] = None,
+                      numbered: bool = False) -> "RenderableType":
+    """Candidates in columns, each only showing its last `height` lines."""
+    rows = -(-len(candidates) // _MAX_COLUMNS)
+    # rows as even as possible, 4 candidates are 2 by 2
+    columns = -(-len(candidates) // rows)
+    grid = Table.grid(expand=True, padding=(0, 1))
+    for _ in range(columns):
+        grid.add_column(ratio=1)
+    panels = [_panel(candidate, height,
+                     f"[{number}] {candidate.label}" if numbered else candidate.label)
+              for number, candidate in enumerate(candidates, 1)]
+    for row in range(0, len(panels), columns):
+        grid.add_row(*panels[row:row + columns])
+    return grid
+
+
+def show(console: "Console", fan_out: FanOut, refresh_rate: float = 20,
+         numbered: bool = False) -> t.List[Candidate]:
+    """Run `fan_out`, streaming the candidates side by side on `console`."""
+    rows = -(-len(fan_out.candidates) // _MAX_COLUMNS)
+    # panel borders and caption take two lines
+    height = max(3, (console.size.height - 1) // rows - 2)
+    interval = 1.0 / refresh_rate if refresh_rate > 0 else 0.05
+    with Live(console=console, auto_refresh=False, transient=True) as live:
+        candidates = fan_out.run(
+            lambda: live.update(render_candidates(fan_out.candidates, height), refresh=True),
+            interval)
+    console.print(render_candidates(candidates, numbered=numbered))
+    return candidates
+
+
+def write(out: t.TextIO, candidates: t.Sequence[Candidate], fmt: str):
+    """The answers of a fan-out for `ask --format raw|jsonl`."""
+    for candidate in candidates:
+        record = candidate.record
+        if fmt == "jsonl":
+            out.write(json.dumps({
+                "type": "candidate",
+                "model": candidate.model,
+                "index": candidate.index,
+                "content": candidate.text,
+                "tokens": record.tokens,
+                "timing": {name: round(getattr(record, name), 6)
+                           for name in ("connect", "wait", "ttft", "streaming", "total")},
+                "error": record.error,
+            }, ensure_ascii=False) + "\n")
+        else:
+            out.write(f"==> {candidate.label} <==\n")
+            text = candidate.text if record.error is None else f"Error: {record.error}"
+            out.write(text if text.endswith("\n") else text + "\n")
+    out.flush()
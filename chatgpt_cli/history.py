@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import typing as t
+
+from prompt_toolkit.history import FileHistory, History
+
+
+_PAGE_SIZE = 500
+# compact once the table is this much over `max_entries`
+_COMPACT_SLACK = 0.1
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class BoundedHistory(History):
+    """Prompt history in SQLite, keeping the latest `max_entries` distinct entries.
+
+    Entering an entry again moves it to the front instead of adding a copy.
+    Entries longer than `max_chars`, typically pasted documents, are only
+    kept for the running prompt.  Entries are loaded newest first a page at
+    a time, so the prompt is usable before an old history is read.
+    """
+
+    def __init__(self, path: str, max_entries: int, max_chars: int,
+                 legacy_file: t.Optional[str] = None):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                digest TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS history_last_used ON history (last_used, id)")
+        self._db.commit()
+        # (last_used, id) of the oldest entry loaded so far
+        self._cursor : t.Optional[t.Tuple[float, int]] = None
+        self._appended = 0
+        if legacy_file is not None:
+            self._import(legacy_file)
+        # `max_entries` may have been lowered
+        self.compact()
+
+    def close(self):
+        self._db.close()
+
+    def _import(self, legacy_file: str):
+        """Copy the latest entries of a `FileHistory` file, once."""
+        with self._lock:
+            if self._db.execute("PRAGMA user_version").fetchone()[0] >= 1:
+                return
+            if os.path.exists(legacy_file):
+                entries = []
+                seen = set()
+                for text in FileHistory(legacy_file).load_history_strings():
+                    if len(text) <= self.max_chars and text not in seen:
+                        seen.add(text)
+                        entries.append(text)
+                        if len(entries) >= self.max_entries:
+                            break
+                # newest first, give them decreasing times
+                now = time.time()
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO history (digest, text, last_used) "
+                        "VALUES (?, ?, ?)",
+                        [(_digest(text), text, now - i * 1e-3)
+                         for i, text in enumerate(entries)])
+            with self._db:
+                self._db.execute("PRAGMA user_version = 1")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def _load_page(self) -> t.List[str]:
+        """The next `_PAGE_SIZE` entries older than the ones loaded."""
+        with self._lock:
+            if self._cursor is None:
+                rows = self._db.execute(
+                    "SELECT text, last_used, id FROM history "
+                    "ORDER BY last_used DESC, id DESC LIMIT ?", (_PAGE_SIZE,)).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT text, last_used, id FROM history WHERE (last_used, id) < (?, ?) "
+                    "ORDER BY last_used DESC, id DESC LIMIT ?",
+                    self._cursor + (_PAGE_SIZE,)).fetchall()
+        if rows:
+            self._cursor = (rows[-1][1], rows[-1][2])
+        if len(rows) < _PAGE_SIZE:
+            self._loaded = True
+        page = [row[0] for row in rows]
+        self._loaded_strings.extend(page)
+        return page
+
+    def load_history_strings(self) -> t.Iterable[str]:
+        """Every entry, newest first, read a page at a time."""
+        offset = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT text FROM history ORDER BY last_used DESC, id DESC "
+                    "LIMIT ? OFFSET ?", (_PAGE_SIZE, offset)).fetchall()
+            yield from (row[0] for row in rows)
+            if len(rows) < _PAGE_SIZE:
+                return
+            offset += _PAGE_SIZE
+
+    async def load(self) -> t.AsyncGenerator[str, None]:
+        # called for every prompt: what is loaded already, then the next
+        # pages, letting the prompt run between them
+        for text in list(self._loaded_strings):
+            yield text
+        while not self._loaded:
+            for text in self._load_page():
+                yield text
+            await asyncio.sleep(0)
+
+    def append_string(self, string: str) -> None:
+        if string in self._loaded_strings:
+            self._loaded_strings.remove(string)
+        self._loaded_strings.insert(0, string)
+        self.store_string(string)
+
+    def store_string(self, string: str) -> None:
+        if not string.strip() or len(string) > self.max_chars:
+            return
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO history (digest, text, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT (digest) DO UPDATE SET last_used = excluded.last_used",
+                (_digest(string), string, time.time()))
+            self._appended += 1
+            if self._appended >= max(1, int(self.max_entries * _COMPACT_SLACK)):
+                self._appended = 0
+                self._compact()
+
+    def compact(self):
+        with self._lock, self._db:
+            self._compact()
+
+    def _compact(self):
+        """Drop all but the latest `max_entries` entries."""
+        self._db.execute(
+            "DELETE FROM history WHERE id IN (SELECT id FROM history "
+            "ORDER BY last_used DESC, id DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
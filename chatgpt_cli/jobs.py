@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import enum
+import time
+import threading
+import typing as t
+from concurrent import futures
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import attrs
+
+from chatgpt_cli import chatapi, config
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession, ChatSessionManager
+
+
+class JobState(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@attrs.define(eq=False)
+class Job:  # pylint: disable=too-many-instance-attributes
+    """A question answered in the background into its session."""
+    job_id : int
+    session : ChatSession
+    question : ChatMessage
+    # the messages to send, taken when the question is asked
+    query : t.List[t.Any]
+    # the job of the same session submitted before, added first
+    previous : t.Optional["Job"] = None
+    state : JobState = JobState.QUEUED
+    # characters of the answer received so far
+    received : int = 0
+    error : t.Optional[str] = None
+    submitted : float = attrs.field(factory=time.monotonic)
+    finished : float = 0.0
+    announced : bool = False
+    future : t.Optional["Future[None]"] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in (JobState.QUEUED, JobState.RUNNING)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.submitted
+
+
+class _QuerySession(ChatSession):
+    """Asks the query of a job, the answer is added to the job's session."""
+
+    def __init__(self, job: Job):
+        super().__init__(job.session.session_name, job.session.prompt)
+        self.query = job.query
+
+    def generate_query_messages(
+        self, model: t.Optional[str]=None, pending: t.Optional[ChatMessage]=None
+    ) -> t.List:
+        return list(self.query)
+
+
+class JobManager:
+    """Answers questions in the background, at most `max_in_flight` at a time.
+
+    The query is taken when the question is asked, and the question is added
+    to its session with its answer.  Answers of the same session may arrive
+    in any order, each is added after the ones asked before it, so the turns
+    stay in order.  `ChatSession.pending` counts the answers still to come,
+    so the session isn't evicted meanwhile, and `wait` lets a foreground
+    question go after them.
+    """
+
+    def __init__(self, session_mgr: ChatSessionManager, max_in_flight: int):
+        self.session_mgr = session_mgr
+        self.max_in_flight = max(1, max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                            thread_name_prefix="bg-request")
+        self._lock = threading.Lock()
+        self._jobs : t.List[Job] = []
+
+    def submit(self, session: ChatSession, question: str) -> Job:
+        message = ChatMessage(question, ChatMessageType.USER)
+        query = session.generate_query_messages(pending=message)
+        with self._lock:
+            previous = [job for job in self._jobs if job.session is session]
+            job = Job(len(self._jobs) + 1, session, message, query,
+                      previous[-1] if previous else None)
+            self._jobs.append(job)
+            session.pending += 1
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        job.state = JobState.RUNNING
+
+        def on_delta(text: str):
+            job.received += len(text)
+
+        try:
+            try:
+                query_session = _QuerySession(job)
+                self.session_mgr.complete(query_session, on_delta=on_delta)
+            finally:
+                if job.previous is not None and job.previous.future is not None:
+                    # taken from the queue first, so it is running or done
+                    futures.wait([job.previous.future])
+                job.session.add_message(job.question)
+            job.session.add_message(query_session.histories[-1])
+            job.state = JobState.DONE
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            job.error = f"{type(e).__name__}: {e}"
+            job.state = JobState.FAILED
+        finally:
+            job.finished = time.monotonic()
+            with self._lock:
+                job.session.pending -= 1
+
+    def jobs(self) -> t.List[Job]:
+        with self._lock:
+            return list(self._jobs)
+
+    def active(self) -> t.List[Job]:
+        return [job for job in self.jobs() if job.active]
+
+    def take_finished(self) -> t.List[Job]:
+        """Jobs finished since the last call."""
+        finished = []
+        for job in self.jobs():
+            if not job.active and not job.announced:
+                job.announced = True
+                finished.append(job)
+        return finished
+
+    def wait(self, session: ChatSession):
+        """Block until the background answers of `session` are added."""
+        for job in self.jobs():
+            if job.session is session and job.future is not None:
+                job.future.exception()
+
+    def status(self) -> str:
+        jobs = self.jobs()
+        counts = {state: sum(job.state == state for job in jobs) for state in JobState}
+        parts = []
+        if counts[JobState.RUNNING]:
+            running = [job for job in jobs if job.state == JobState.RUNNING]
+            parts.append(f"{counts[JobState.RUNNING]} running ("
+                         + ", ".join(f"{job.session.session_name} {job.received} chars"
+                                     for job in running) + ")")
+        for state in (JobState.QUEUED, JobState.DONE, JobState.FAILED):
+            if counts[state]:
+                parts.append(f"{counts[state]} {state.value}")
+        return "background: " + ", ".join(parts) if parts else ""
+
+    def shutdown(self):
+        """Drop the queued jobs; running ones finish and are saved."""
+        for job in self.jobs():
+            if job.future is not None and job.future.cancel():
+                job.state = JobState.FAILED
+                job.error = "cancelled"
+                with self._lock:
+                    job.session.pending -= 1
+        self._executor.shutdown(wait=False)
+
+
+_job_manager : t.Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(
+            chatapi.get_session_manager(),
+            config.get_config().getint('CLI', 'max_background_requests'))
+    return _job_manager
@@ -9,10 +9,16 @@ import click
 from chatgpt_cli import term
 from chatgpt_cli import config
 from chatgpt_cli import chatapi
-from chatgpt_cli.cmds.base import load_cmd
+from chatgpt_cli.cmds.base import LazyCmdGroup
 
 
-@click.group()
+@click.group(cls=LazyCmdGroup, lazy_cmds={
+    "chat": "ChatCommand",
+    "ask": "AskCommand",
+    "config": "ConfigCommand",
+    "daemon": "DaemonCommand",
+    "session": "SessionCommand",
+})
 def cli():
     ...
 
@@ -21,7 +27,4 @@ def main():
     term.init()
     config.init()
     chatapi.init()
-    cli.add_command(load_cmd("ChatCommand"))
-    cli.add_command(load_cmd("AskCommand"))
-    cli.add_command(load_cmd("ConfigCommand"))
     cli()
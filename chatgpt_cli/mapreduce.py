@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import re
+import json
+import time
+import tempfile
+import itertools
+import threading
+import typing as t
+
+from chatgpt_cli import config, tokens
+from chatgpt_cli.batch import ordered_map
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession, ChatSessionManager
+from chatgpt_cli.error import CommandError
+
+
+REDUCE_PROMPT = (
+    "The following are answers for consecutive parts of one document, separated by "
+    "lines of '---'. Merge them into a single answer for the whole document, keeping "
+    "their format and dropping repetitions."
+)
+
+_READ_SIZE = 64 * 1024
+# English averages 4 characters per token, CJK about one
+_CHARS_PER_TOKEN = 4
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_END = re.compile(r"[.!?;。！？；](?:\s+|$)")
+_ANSWER_SEPARATOR = "\n\n---\n\n"
+
+
+class MapReduceSummary(t.NamedTuple):
+    chunks: int
+    requests: int
+    elapsed: float
+
+
+def _cut_position(text: str, limit: int) -> int:
+    """Where to cut `text` to at most `limit` chars, at a sentence end if possible."""
+    if len(text) <= limit:
+        return len(text)
+    head = text[:limit]
+    ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    if ends and ends[-1] >= limit // 2:
+        return ends[-1]
+    space = head.rfind(" ")
+    if space >= limit // 2:
+        return space + 1
+    return limit
+
+
+def iter_paragraphs(stream: t.IO[str], max_chars: int) -> t.Iterator[str]:
+    """Paragraphs of `stream`, longer ones cut into pieces of at most `max_chars`.
+
+    Reads in blocks, so memory is bounded by `max_chars` and the block size
+    however long the input or its lines are.
+    """
+    buffer = ""
+    while True:
+        block = stream.read(_READ_SIZE)
+        if block:
+            buffer += block
+            parts = _PARAGRAPH_BREAK.split(buffer)
+            buffer = parts.pop()
+        else:
+            parts, buffer = [buffer], ""
+        for part in parts:
+            while part.strip():
+                cut = _cut_position(part, max_chars)
+                yield part[:cut].strip()
+                part = part[cut:]
+        while len(buffer) > max_chars:
+            cut = _cut_position(buffer, max_chars)
+            yield buffer[:cut].strip()
+            buffer = buffer[cut:]
+        if not block:
+            return
+
+
+def _fit(piece: str, max_tokens: int, model: str) -> t.Iterator[t.Tuple[str, int]]:
+    """Cut `piece` until every part has at most `max_tokens` tokens."""
+    if not piece:
+        return
+    count = tokens.count_tokens(piece, model)
+    if count <= max_tokens or len(piece) <= 1:
+        yield piece, count
+        return
+    cut = _cut_position(piece, max(1, len(piece) * max_tokens // count))
+    yield from _fit(piece[:cut].strip(), max_tokens, model)
+    yield from _fit(piece[cut:].strip(), max_tokens, model)
+
+
+def split_chunks(stream: t.IO[str], max_tokens: int, model: str) -> t.Iterator[str]:
+    """Pack the paragraphs of `stream` into chunks of at most `max_tokens` tokens."""
+    chunk : t.List[str] = []
+    chunk_tokens = 0
+    for paragraph in iter_paragraphs(stream, max_tokens * _CHARS_PER_TOKEN):
+        for piece, count in _fit(paragraph, max_tokens, model):
+            if chunk and chunk_tokens + count > max_tokens:
+                yield "\n\n".join(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(piece)
+            chunk_tokens += count
+    if chunk:
+        yield "\n\n".join(chunk)
+
+
+class _InstructedSession(ChatSession):
+    """A one-shot session sending `instruction` as its system message.
+
+    The instruction is not a named prompt, e.g. the default reduce prompt.
+    Like a prompt it is part of every query, and so of the cache key.
+    """
+
+    def __init__(self, session_name: str, instruction: str):
+        super().__init__(session_name, "")
+        self.no_context = True
+        self.instruction = ChatMessage(instruction, ChatMessageType.SYSTEM)
+
+    def system_message(self) -> t.Optional[ChatMessage]:
+        return self.instruction
+
+
+class MapReduce:  # pylint: disable=too-many-instance-attributes
+    """Run a prompt over token-bounded chunks of a long text.
+
+    Chunks are answered concurrently and the answers come out in input
+    order.  `reduce` merges them with more requests, pairing up answers
+    until one is left, with the intermediate answers spilled to disk.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, session_mgr: ChatSessionManager, prompt: str, *,
+        model: t.Optional[str] = None, chunk_tokens: int = 0,
+        concurrency: int = 4, use_cache: bool = True,
+        reduce_prompt: t.Optional[str] = None
+    ):
+        self.session_mgr = session_mgr
+        self.prompt = prompt
+        self.model = model or config.get_config().get('API', 'CHATGPT_MODEL')
+        self.concurrency = max(1, concurrency)
+        self.use_cache = use_cache
+        self.reduce_prompt = REDUCE_PROMPT
+        if reduce_prompt is not None:
+            self.reduce_prompt = self._prompt_text(reduce_prompt)
+        budget = tokens.prompt_budget(self.model)
+        prompt_tokens = tokens.count_tokens(self._prompt_text(prompt), self.model)
+        reserve = config.get_config().getint('API', 'REPLY_TOKEN_RESERVE')
+        # an answer, e.g. a translation, can be as long as its chunk
+        self.chunk_tokens = chunk_tokens or max(1, min(reserve, budget - prompt_tokens))
+        self.group_tokens = max(1, budget - tokens.count_tokens(self.reduce_prompt, self.model))
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prompt_text(name: str) -> str:
+        text = config.get_prompt_message(name)
+        if text is None:
+            raise CommandError(f"Prompt '{name}' is not found.")
+        return text
+
+    def _complete(self, name: str, instruction: str, content: str) -> str:
+        session = _InstructedSession(name, instruction)
+        session.add_message(ChatMessage(content, ChatMessageType.USER))
+        answer, _ = self.session_mgr.complete(session, model=self.model,
+                                              use_cache=self.use_cache)
+        with self._lock:
+            self.requests += 1
+        return answer
+
+    def _map_chunk(self, chunk: str) -> str:
+        return self._complete("map", self._prompt_text(self.prompt), chunk)
+
+    def _reduce_group(self, answers: t.List[str]) -> str:
+        if len(answers) == 1:
+            return answers[0]
+        return self._complete("reduce", self.reduce_prompt, _ANSWER_SEPARATOR.join(answers))
+
+    def map(self, stream: t.IO[str]) -> t.Iterator[str]:
+        chunks = split_chunks(stream, self.chunk_tokens, self.model)
+        return ordered_map(self._map_chunk, chunks, self.concurrency)
+
+    def _groups(self, answers: t.Iterable[str]) -> t.Iterator[t.List[str]]:
+        """Token-bounded groups of answers, of at least two to make progress."""
+        group : t.List[str] = []
+        group_tokens = 0
+        for answer in answers:
+            count = tokens.count_tokens(answer, self.model)
+            if len(group) >= 2 and group_tokens + count > self.group_tokens:
+                yield group
+                group, group_tokens = [], 0
+            group.append(answer)
+            group_tokens += count
+        if group:
+            yield group
+
+    def reduce(self, answers: t.Iterable[str]) -> str:
+        level : t.Iterable[str] = answers
+        spill : t.Optional[t.IO[str]] = None
+        try:
+            while True:
+                groups = self._groups(level)
+                first = next(groups, None)
+                if first is None:
+                    return ""
+                if len(first) == 1:
+                    # groups have two answers or more, unless there is only one
+                    return first[0]
+                next_spill = tempfile.TemporaryFile("w+", encoding="utf-8")
+                try:
+                    for merged in ordered_map(self._reduce_group,
+                                              itertools.chain([first], groups),
+                                              self.concurrency):
+                        next_spill.write(json.dumps(merged, ensure_ascii=False) + "\n")
+                except BaseException:
+                    next_spill.close()
+                    raise
+                if spill is not None:
+                    spill.close()
+                spill = next_spill
+                spill.seek(0)
+                level = (json.loads(line) for line in spill)
+        finally:
+            if spill is not None:
+                spill.close()
+
+    def run(self, stream: t.IO[str], out: t.IO[str], reduce: bool = False) -> MapReduceSummary:
+        start = time.perf_counter()
+        chunks = 0
+        answers = self.map(stream)
+        if reduce:
+            def counted() -> t.Iterator[str]:
+                nonlocal chunks
+                for answer in answers:
+                    chunks += 1
+                    yield answer
+            out.write(self.reduce(counted()))
+        else:
+            for answer in answers:
+                if chunks:
+                    out.write("\n\n")
+                out.write(answer)
+                out.flush()
+                chunks += 1
+        out.write("\n")
+        out.flush()
+        return MapReduceSummary(chunks, self.requests, time.perf_counter() - start)
+
+
+def format_summary(summary: MapReduceSummary) -> str:
+    return (f"{summary.chunks} chunks, {summary.requests} requests "
+            f"in {summary.elapsed:.1f}s")
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import json
+import math
+import time
+import threading
+import collections
+import typing as t
+
+import attrs
+
+
+_MAX_RECORDS = 1000
+
+
+def percentile(values: t.Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, `q` in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+@attrs.define
+class RequestMetrics:  # pylint: disable=too-many-instance-attributes
+    """Timings of one chat request, in seconds from the request start."""
+    session : str
+    model : str
+    stream : bool
+    # wall clock time the request started
+    started : float = attrs.field(factory=time.time)
+    cached : bool = False
+    # similarity to the cached question of a near-duplicate hit, 0 otherwise
+    similarity : float = 0.0
+    # opening new connections (TCP and TLS), 0 when a pooled one was reused
+    connect : float = 0.0
+    # until the response headers arrived
+    wait : float = 0.0
+    # until the first content arrived, and from there to the last one
+    ttft : float = 0.0
+    streaming : float = 0.0
+    total : float = 0.0
+    # spent in the Markdown renderer
+    render : float = 0.0
+    chunks : int = 0
+    tokens : int = 0
+    error : t.Optional[str] = None
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.tokens / self.streaming if self.streaming > 0 else 0.0
+
+    def to_json(self) -> t.Dict[str, t.Any]:
+        data = attrs.asdict(self)
+        data["tokens_per_s"] = round(self.tokens_per_s, 2)
+        return data
+
+
+# columns of `MetricsRecorder.summarize`: (name, metric, percentile)
+SUMMARY_COLUMNS : t.List[t.Tuple[str, str, float]] = [
+    ("connect p50", "connect", 50),
+    ("ttft p50", "ttft", 50),
+    ("ttft p95", "ttft", 95),
+    ("total p50", "total", 50),
+    ("total p95", "total", 95),
+    ("render p50", "render", 50),
+    ("tokens/s p50", "tokens_per_s", 50),
+]
+
+
+class MetricsRecorder:
+    """Keeps the latest request metrics, optionally appending them to a JSONL log."""
+
+    def __init__(self, max_records: int = _MAX_RECORDS, log_path: t.Optional[str] = None):
+        self._records : t.Deque[RequestMetrics] = collections.deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self.log_path = log_path
+
+    def record(self, metrics: RequestMetrics):
+        with self._lock:
+            self._records.append(metrics)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(metrics.to_json(), ensure_ascii=False) + "\n")
+
+    def records(self) -> t.List[RequestMetrics]:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def summarize(
+        self, key: t.Callable[[RequestMetrics], str]
+    ) -> t.Dict[str, t.Dict[str, float]]:
+        """Percentiles of `SUMMARY_COLUMNS` of the answered requests grouped by `key`.
+
+        Cached answers and failed requests are only counted.
+        """
+        groups : t.Dict[str, t.List[RequestMetrics]] = {}
+        for metrics in self.records():
+            groups.setdefault(key(metrics), []).append(metrics)
+        summary = {}
+        for name, group in groups.items():
+            answered = [m for m in group if not m.cached and m.error is None]
+            row = {
+                "requests": float(len(group)),
+                "cached": float(sum(m.cached for m in group)),
+                "errors": float(sum(m.error is not None for m in group)),
+            }
+            for column, metric, q in SUMMARY_COLUMNS:
+                row[column] = percentile([getattr(m, metric) for m in answered], q)
+            summary[name] = row
+        return summary
+
+
+_recorder : t.Optional[MetricsRecorder] = None
+
+
+def get_recorder() -> MetricsRecorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = MetricsRecorder()
+    return _recorder
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import json
+import typing as t
+
+if t.TYPE_CHECKING:
+    from chatgpt_cli.metrics import RequestMetrics
+    from chatgpt_cli.pipeline import Delta
+
+
+# `ask --format`, "markdown" renders with rich, the others write plain text
+FORMATS = ("markdown", "raw", "jsonl")
+
+
+def default_format(stream: t.TextIO) -> str:
+    """Markdown for a terminal, raw deltas when piped or redirected."""
+    isatty = getattr(stream, "isatty", None)
+    return "markdown" if isatty is not None and isatty() else "raw"
+
+
+class RawWriter:
+    """Writes the answer as it arrives, without any rendering."""
+
+    def __init__(self, out: t.TextIO, start: float):
+        self.out = out
+        self.start = start
+        self._ends_with_newline = True
+
+    def write(self, deltas: t.List["Delta"]):
+        text = "".join(content for _, content in deltas)
+        if text:
+            self.out.write(text)
+            self.out.flush()
+            self._ends_with_newline = text.endswith("\n")
+
+    def finish(self, record: "RequestMetrics", usage: t.Dict[str, int]):
+        if not self._ends_with_newline:
+            self.out.write("\n")
+        self.out.flush()
+
+
+class JsonlWriter(RawWriter):
+    """One JSON object per delta, then one with the token usage and timings.
+
+    Deltas are ``{"type": "delta", "t": ..., "content": ...}`` with `t` the
+    seconds since the request started.  The last line has ``"type": "done"``,
+    and an ``"error"`` when the request failed.
+    """
+
+    def write(self, deltas: t.List["Delta"]):
+        self.out.write("".join(
+            json.dumps({"type": "delta", "t": round(stamp - self.start, 6),
+                        "content": content}, ensure_ascii=False) + "\n"
+            for stamp, content in deltas
+        ))
+        self.out.flush()
+
+    def finish(self, record: "RequestMetrics", usage: t.Dict[str, int]):
+        timing = {name: round(getattr(record, name), 6)
+                  for name in ("connect", "wait", "ttft", "streaming", "total")}
+        self.out.write(json.dumps({
+            "type": "done",
+            "session": record.session,
+            "model": record.model,
+            "started": record.started,
+            "cached": record.cached,
+            "similarity": record.similarity,
+            "chunks": record.chunks,
+            "usage": usage,
+            "timing": timing,
+            "error": record.error,
+        }, ensure_ascii=False) + "\n")
+        self.out.flush()
+
+
+def make_writer(fmt: str, out: t.TextIO, start: float) -> RawWriter:
+    if fmt == "jsonl":
+        return JsonlWriter(out, start)
+    return RawWriter(out, start)
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import bisect
+import datetime
+import collections
+import typing as t
+
+from prompt_toolkit.application import Application
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.formatted_text import ANSI
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
+from prompt_toolkit.layout import HSplit, Layout, Window
+from prompt_toolkit.layout.controls import FormattedTextControl
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.rule import Rule
+from rich.text import Text
+
+from chatgpt_cli import term
+from chatgpt_cli.chatapi import ChatMessageType, MessageHistory
+
+if t.TYPE_CHECKING:
+    from prompt_toolkit.input import Input
+    from prompt_toolkit.output import Output
+    # the color systems `rich.console.Console` takes
+    ColorSystem = t.Literal["auto", "standard", "256", "truecolor", "windows"]
+
+
+_ROLE_STYLES = {
+    ChatMessageType.SYSTEM: "dim",
+    ChatMessageType.USER: "bold #5fd700",
+    ChatMessageType.ASSISTANT: "bold #5f5fff",
+}
+_HELP = ("j/k line  space/b page  [/] turn  g/G top/bottom  "
+         ":N turn N  /text search  n/N next/prev  q quit")
+
+
+class HistoryView:  # pylint: disable=too-many-instance-attributes
+    """A screen of the messages of a `MessageHistory`, rendered on demand.
+
+    Only the messages reaching the screen are rendered, each to a block of
+    terminal lines kept in an LRU cache keyed by width, so scrolling and
+    jumping cost the size of the screen, not the length of the history.
+    The position is the message at the top of the screen and the lines of
+    it scrolled past.
+    """
+
+    def __init__(
+        self, histories: MessageHistory, width: int,
+        color_system: t.Optional["ColorSystem"] = "truecolor", cache_size: int = 512
+    ):
+        self.histories = histories
+        self.width = width
+        self.color_system = color_system
+        self.cache_size = cache_size
+        self.top = 0
+        self.offset = 0
+        self._blocks : t.OrderedDict[t.Tuple[int, int], t.List[str]] = collections.OrderedDict()
+        # index of the user message of every turn
+        self._turns : t.List[int] = []
+        self._scanned = 0
+
+    def _scan_turns(self):
+        # a background answer may add messages while the history is viewed
+        count = len(self.histories)
+        self._turns.extend(self.histories.indexes(ChatMessageType.USER, self._scanned, count))
+        self._scanned = count
+
+    def turn_of(self, index: int) -> int:
+        """Turn number of the message at `index`, 0 before the first question."""
+        self._scan_turns()
+        return bisect.bisect_right(self._turns, index)
+
+    @property
+    def turn_count(self) -> int:
+        self._scan_turns()
+        return len(self._turns)
+
+    def _render(self, index: int) -> t.List[str]:
+        out = io.StringIO()
+        console = Console(file=out, width=self.width, force_terminal=True,
+                          color_system=self.color_system, highlight=False)
+        message = self.histories[index]
+        role = message.message_type
+        when = datetime.datetime.fromtimestamp(message.timestamp).strftime("%Y-%m-%d %H:%M")
+        turn = self.turn_of(index)
+        title = f"{role.value} #{turn} {when}" if turn else f"{role.value} {when}"
+        console.print(Rule(title, align="left", style=_ROLE_STYLES[role]))
+        if role == ChatMessageType.ASSISTANT:
+            console.print(Markdown(message.message))
+        else:
+            console.print(Text(message.message, style=_ROLE_STYLES[role] if
+                               role == ChatMessageType.SYSTEM else ""))
+        console.print()
+        return out.getvalue().split("\n")[:-1]
+
+    def block(self, index: int) -> t.List[str]:
+        """Lines of the message at `index` at the current width."""
+        key = (index, self.width)
+        lines = self._blocks.get(key)
+        if lines is None:
+            lines = self._render(index)
+            self._blocks[key] = lines
+            if len(self._blocks) > self.cache_size:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(key)
+        return lines
+
+    def lines(self, height: int) -> t.List[str]:
+        """The lines of the screen, `height` at most."""
+        screen : t.List[str] = []
+        index, skip = self.top, self.offset
+        while len(screen) < height and index < len(self.histories):
+            screen.extend(self.block(index)[skip:skip + height - len(screen)])
+            index += 1
+            skip = 0
+        return screen
+
+    def _bottom(self, height: int) -> t.Tuple[int, int]:
+        """The position showing the last `height` lines."""
+        need = height
+        for index in range(len(self.histories) - 1, -1, -1):
+            size = len(self.block(index))
+            if size >= need:
+                return index, size - need
+            need -= size
+        return 0, 0
+
+    def resize(self, width: int, height: int):
+        # the cache keeps the blocks of other widths
+        self.width = width
+        self._clamp(height)
+
+    def _clamp(self, height: int):
+        bottom = self._bottom(height)
+        if (self.top, self.offset) > bottom:
+            self.top, self.offset = bottom
+
+    def scroll(self, delta: int, height: int):
+        """Move `delta` lines down, up when negative."""
+        if not self.histories:
+            return
+        if delta >= 0:
+            while delta > 0 and self.top < len(self.histories) - 1:
+                left = len(self.block(self.top)) - self.offset
+                if delta < left:
+                    self.offset += delta
+                    break
+                delta -= left
+                self.top += 1
+                self.offset = 0
+            self._clamp(height)
+            return
+        delta = -delta
+        while delta > 0:
+            if self.offset >= delta:
+                self.offset -= delta
+                break
+            delta -= self.offset
+            if self.top == 0:
+                self.offset = 0
+                break
+            self.top -= 1
+            self.offset = len(self.block(self.top))
+
+    def goto(self, index: int, height: int):
+        """Show the message at `index` at the top."""
+        self.top = max(0, min(index, len(self.histories) - 1))
+        self.offset = 0
+        self._clamp(height)
+
+    def goto_end(self, height: int):
+        self.top, self.offset = self._bottom(height)
+
+    def goto_turn(self, turn: int, height: int) -> bool:
+        self._scan_turns()
+        if not 1 <= turn <= len(self._turns):
+            return False
+        self.goto(self._turns[turn - 1], height)
+        return True
+
+    def next_turn(self, step: int, height: int):
+        """Jump to the next question, to the previous one when `step` is negative."""
+        self._scan_turns()
+        if step > 0:
+            position = bisect.bisect_right(self._turns, self.top)
+        else:
+            # the question of the top message when it is scrolled
+            top = self.top if self.offset else self.top - 1
+            position = bisect.bisect_right(self._turns, top) - 1
+        if 0 <= position < len(self._turns):
+            self.goto(self._turns[position], height)
+
+    def search(self, text: str, height: int, forward: bool = True) -> bool:
+        """Show the next message containing `text`, wrapping around, ignoring case."""
+        count = len(self.histories)
+        needle = text.casefold()
+        if not needle or not count:
+            return False
+        step = 1 if forward else -1
+        for distance in range(1, count + 1):
+            index = (self.top + step * distance) % count
+            if needle in self.histories.text(index).casefold():
+                self.goto(index, height)
+                return True
+        return False
+
+
+class HistoryPager:
+    """Full screen viewer of a `HistoryView`, keys like `less`."""
+
+    def __init__(self, view: HistoryView):
+        self.view = view
+        # typed after ":" or "/", None when not typing
+        self.input : t.Optional[str] = None
+        self.input_kind = ""
+        self.search_text = ""
+        self.message = ""
+        self.app : t.Optional[Application] = None
+
+    @property
+    def height(self) -> int:
+        assert self.app is not None
+        return max(1, self.app.output.get_size().rows - 1)
+
+    def _screen(self):
+        assert self.app is not None
+        size = self.app.output.get_size()
+        if size.columns != self.view.width:
+            self.view.resize(size.columns, self.height)
+        return ANSI("\n".join(self.view.lines(self.height)))
+
+    def _status(self):
+        if self.input is not None:
+            return f"{self.input_kind}{self.input}"
+        count = len(self.view.histories)
+        if not count:
+            return "No messages.  q quit"
+        position = (f" message {self.view.top + 1}/{count}"
+                    f"  turn {self.view.turn_of(self.view.top)}/{self.view.turn_count} ")
+        return position + " " + (self.message or _HELP)
+
+    def _submit(self):
+        text, self.input = self.input or "", None
+        if self.input_kind == ":":
+            if not text.strip().isdigit() or \
+                    not self.view.goto_turn(int(text), self.height):
+                self.message = f"No turn {text.strip()}."
+        elif text:
+            self.search_text = text
+            self._search(True)
+
+    def _search(self, forward: bool):
+        if not self.search_text:
+            self.message = "/text to search."
+        elif not self.view.search(self.search_text, self.height, forward):
+            self.message = f"Not found: {self.search_text}"
+
+    def _key_bindings(self) -> KeyBindings:
+        kb = KeyBindings()
+        typing = Condition(lambda: self.input is not None)
+        viewing = ~typing
+
+        def bind(*keys: str, action: t.Callable[[], t.Any]):
+            @kb.add(*keys, filter=viewing)
+            def _(event):
+                self.message = ""
+                action()
+
+        view = self.view
+        for keys, action in [
+            (("j",), lambda: view.scroll(1, self.height)),
+            (("down",), lambda: view.scroll(1, self.height)),
+            (("enter",), lambda: view.scroll(1, self.height)),
+            (("k",), lambda: view.scroll(-1, self.height)),
+            (("up",), lambda: view.scroll(-1, self.height)),
+            (("space",), lambda: view.scroll(self.height, self.height)),
+            (("pagedown",), lambda: view.scroll(self.height, self.height)),
+            (("c-f",), lambda: view.scroll(self.height, self.height)),
+            (("b",), lambda: view.scroll(-self.height, self.height)),
+            (("pageup",), lambda: view.scroll(-self.height, self.height)),
+            (("c-b",), lambda: view.scroll(-self.height, self.height)),
+            (("]",), lambda: view.next_turn(1, self.height)),
+            (("[",), lambda: view.next_turn(-1, self.height)),
+            (("g",), lambda: view.goto(0, self.height)),
+            (("home",), lambda: view.goto(0, self.height)),
+            (("G",), lambda: view.goto_end(self.height)),
+            (("end",), lambda: view.goto_end(self.height)),
+            (("n",), lambda: self._search(True)),
+            (("N",), lambda: self._search(False)),
+        ]:
+            bind(*keys, action=action)
+
+        @kb.add(":", filter=viewing)
+        @kb.add("/", filter=viewing)
+        def _(event):
+            self.input, self.input_kind = "", event.data
+
+        @kb.add("q", filter=viewing)
+        @kb.add("escape", filter=viewing, eager=True)
+        @kb.add("c-c")
+        def _(event):
+            event.app.exit()
+
+        @kb.add(Keys.Any, filter=typing)
+        def _(event):
+            self.input = (self.input or "") + event.data
+
+        @kb.add("backspace", filter=typing)
+        def _(event):
+            if self.input:
+                self.input = self.input[:-1]
+            else:
+                self.input = None
+
+        @kb.add("escape", filter=typing, eager=True)
+        def _(event):
+            self.input = None
+
+        @kb.add("enter", filter=typing)
+        def _(event):
+            self._submit()
+
+        return kb
+
+    def make_app(
+        self, input: t.Optional["Input"] = None,  # pylint: disable=redefined-builtin
+        output: t.Optional["Output"] = None
+    ) -> Application:
+        layout = Layout(HSplit([
+            Window(FormattedTextControl(self._screen), wrap_lines=False),
+            Window(FormattedTextControl(self._status), height=1, style="reverse"),
+        ]))
+        self.app = Application(layout=layout, key_bindings=self._key_bindings(), full_screen=True,
+                               input=input, output=output)
+        return self.app
+
+
+def show_history(histories: MessageHistory, turn: t.Optional[int] = None):
+    """Page through `histories` on the terminal, print it when not one."""
+    console = term.console
+    view = HistoryView(histories, console.width,
+                       color_system=t.cast("t.Optional[ColorSystem]", console.color_system))
+    if not console.is_terminal:
+        for index in range(len(histories)):
+            console.file.write("\n".join(view.block(index)) + "\n")
+        return
+    pager = HistoryPager(view)
+    app = pager.make_app()
+    if turn is None:
+        view.goto_end(pager.height)
+    elif not view.goto_turn(turn, pager.height):
+        pager.message = f"No turn {turn}."
+    app.run()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import time
+import asyncio
+import threading
+import typing as t
+
+
+_QUEUE_SIZE = 4096
+_DONE = object()
+
+# (perf_counter() time it was read, content)
+Delta = t.Tuple[float, str]
+
+
+class StreamStats(t.NamedTuple):
+    # perf_counter() times the first and the last delta were read
+    first: float
+    last: float
+    chunks: int
+    # seconds spent in the sink
+    render: float
+
+
+class StreamPipeline:
+    """Read a streamed answer in one thread and render it in an asyncio task.
+
+    The reader only waits when `max_queue` deltas are pending, so a slow
+    terminal never leaves chunks sitting in the socket.  The render task
+    hands all the pending deltas to `sink` at once.  Cancelling the task, or
+    Ctrl-C, stops both sides: `abort` is called to close the connection the
+    reader may be blocked on.
+    """
+
+    def __init__(self, response: t.Iterable[t.Any], sink: t.Callable[[t.List[Delta]], None],
+                 abort: t.Optional[t.Callable[[], None]] = None,
+                 max_queue: int = _QUEUE_SIZE):
+        self.response = response
+        self.sink = sink
+        self.abort = abort
+        self.max_queue = max_queue
+
+    async def run(self) -> StreamStats:
+        loop = asyncio.get_running_loop()
+        queue : "asyncio.Queue[t.Any]" = asyncio.Queue()
+        slots = threading.BoundedSemaphore(self.max_queue)
+        cancelled = threading.Event()
+        # a daemon thread rather than the loop's executor, which would wait
+        # for a reader blocked on the network when the loop shuts down
+        reader = threading.Thread(target=self._read, args=(loop, queue, slots, cancelled),
+                                  daemon=True, name="stream-reader")
+        reader.start()
+        try:
+            return await self._render(queue, slots)
+        finally:
+            if reader.is_alive():
+                cancelled.set()
+                if self.abort is not None:
+                    self.abort()
+
+    def run_sync(self) -> StreamStats:
+        return asyncio.run(self.run())
+
+    def _read(self, loop: asyncio.AbstractEventLoop, queue: "asyncio.Queue[t.Any]",
+              slots: threading.BoundedSemaphore, cancelled: threading.Event):
+
+        def put(item: t.Any):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # the loop is closed, nobody is listening anymore
+                cancelled.set()
+
+        try:
+            for chunk in self.response:
+                content = chunk['choices'][0]['delta'].get("content")
+                if content is None:
+                    continue
+                while not slots.acquire(timeout=0.1):
+                    if cancelled.is_set():
+                        return
+                if cancelled.is_set():
+                    return
+                put((time.perf_counter(), content))
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            if not cancelled.is_set():
+                put(e)
+        finally:
+            if not cancelled.is_set():
+                put(_DONE)
+
+    async def _render(self, queue: "asyncio.Queue[t.Any]",
+                      slots: threading.BoundedSemaphore) -> StreamStats:
+        first = last = 0.0
+        chunks = 0
+        render = 0.0
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            deltas : t.List[Delta] = []
+            done = False
+            error = None
+            for item in items:
+                if item is _DONE:
+                    done = True
+                    continue
+                if isinstance(item, BaseException):
+                    # render what came before it first
+                    error = item
+                    continue
+                slots.release()
+                last = item[0]
+                if not chunks:
+                    first = last
+                chunks += 1
+                deltas.append(item)
+            if deltas:
+                start = time.perf_counter()
+                self.sink(deltas)
+                render += time.perf_counter() - start
+            if error is not None:
+                raise error
+            if done:
+                return StreamStats(first, last, chunks, render)
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+"""Keep API requests under the requests and tokens per minute limits.
+
+Two token buckets, requests and tokens, refill at the configured rates or
+at the limits the API reports in its ``x-ratelimit-*`` headers.  Every
+request takes its share before it is sent, waiting when a bucket is empty.
+The buckets live in a small JSON file of the config dir, read and written
+under an exclusive lock, so concurrent processes share one budget.
+
+Transient errors, 429s included, are retried with jittered exponential
+backoff, a 429 also holds back the requests of every process until its
+``retry-after``.
+"""
+
+
+import os
+import re
+import json
+import time
+import random
+import threading
+import typing as t
+
+import attrs
+
+from chatgpt_cli import config
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process sharing, e.g. on Windows
+    fcntl = None  # type: ignore
+
+if t.TYPE_CHECKING:
+    import requests
+
+
+_STATE_FILE_NAME = "ratelimit.json"
+# backoff before retry n is drawn from [d / 2, d], d = min(_BACKOFF_MAX, _BACKOFF_BASE * 2^n)
+_BACKOFF_BASE = 1.0
+_BACKOFF_MAX = 60.0
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+T = t.TypeVar("T")
+
+
+def parse_duration(text: str) -> t.Optional[float]:
+    """Seconds of an API duration like ``1s``, ``6m0s`` or ``120ms``."""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(text)
+    if not parts or "".join(value + unit for value, unit in parts) != text:
+        return None
+    return sum(float(value) * _DURATION_UNITS[unit] for value, unit in parts)
+
+
+def backoff(attempt: int, rnd: t.Optional[random.Random] = None) -> float:
+    """Jittered delay before retry `attempt` (0 based)."""
+    delay = min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt)
+    return (rnd or random).uniform(delay / 2, delay)
+
+
+def retry_after(headers: t.Mapping[str, str]) -> t.Optional[float]:
+    """Seconds the API asks to wait before retrying, None if it does not say."""
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value is None:
+            continue
+        seconds = parse_duration(value)
+        if seconds is not None:
+            return seconds / 1000 if name == "retry-after-ms" else seconds
+    waits = [wait for wait in (parse_duration(headers.get(name) or "") for name in
+                               ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"))
+             if wait is not None and wait > 0]
+    return max(waits) if waits else None
+
+
+@attrs.define
+class _State:
+    # bucket levels at `updated`, wall clock time shared by the processes
+    requests : float = 0.0
+    tokens : float = 0.0
+    updated : float = 0.0
+    # no request is sent before this time, set by a 429
+    blocked_until : float = 0.0
+    # limits reported by the API, 0 while unknown
+    rpm : int = 0
+    tpm : int = 0
+
+
+class RateLimiter:
+    """Requests and tokens per minute budget, shared through the file `path`.
+
+    `rpm` and `tpm` are the configured limits, 0 uses the ones the API
+    reports; a configured limit above the reported one is lowered to it.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, path: str, *, rpm: int = 0, tpm: int = 0, max_retries: int = 4,
+        clock: t.Callable[[], float] = time.time,
+        sleep: t.Callable[[float], None] = time.sleep
+    ):
+        self.path = path
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        # flock only excludes other processes, not the threads of this one
+        self._lock = threading.Lock()
+
+    def _limits(self, state: _State) -> t.Tuple[int, int]:
+        def pick(configured: int, reported: int) -> int:
+            if configured and reported:
+                return min(configured, reported)
+            return configured or reported
+        return pick(self.rpm, state.rpm), pick(self.tpm, state.tpm)
+
+    def _refill(self, state: _State, now: float):
+        rpm, tpm = self._limits(state)
+        elapsed = max(0.0, now - state.updated)
+        # a bucket without a known limit stays as it is, full at first
+        if rpm:
+            state.requests = min(float(rpm), state.requests + elapsed * rpm / 60)
+        if tpm:
+            state.tokens = min(float(tpm), state.tokens + elapsed * tpm / 60)
+        state.updated = now
+
+    def _update(self, change: t.Callable[[_State, float], T]) -> T:
+        """Run `change` on the refilled state and save it, under the lock."""
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = _State(**json.loads(f.read()))
+            except (ValueError, TypeError):
+                # new or damaged, start with full buckets
+                state = _State(requests=float("inf"), tokens=float("inf"))
+            now = self._clock()
+            self._refill(state, now)
+            result = change(state, now)
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(attrs.asdict(state)))
+            return result
+
+    def reserve(self, cost: int) -> float:
+        """Take a request and `cost` tokens, or the seconds to wait before trying again."""
+        def take(state: _State, now: float) -> float:
+            if now < state.blocked_until:
+                return state.blocked_until - now
+            rpm, tpm = self._limits(state)
+            # a request larger than the whole budget still goes through, alone
+            tokens = min(cost, tpm)
+            waits = [0.0]
+            if rpm and state.requests < 1:
+                waits.append((1 - state.requests) * 60 / rpm)
+            if tpm and state.tokens < tokens:
+                waits.append((tokens - state.tokens) * 60 / tpm)
+            if max(waits) > 0:
+                return max(waits)
+            if rpm:
+                state.requests -= 1
+            if tpm:
+                state.tokens -= tokens
+            return 0.0
+        return self._update(take)
+
+    def acquire(self, cost: int, on_wait: t.Optional[t.Callable[[float], None]] = None) -> float:
+        """Wait until a request of `cost` tokens fits the budget, returns the seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self.reserve(cost)
+            if delay <= 0:
+                return waited
+            if on_wait is not None:
+                on_wait(delay)
+            self._sleep(delay)
+            waited += delay
+
+    def block(self, seconds: float):
+        """Hold back every request, of every process, for `seconds`."""
+        def hold(state: _State, now: float):
+            state.blocked_until = max(state.blocked_until, now + seconds)
+        self._update(hold)
+
+    def observe(self, response: "requests.Response", *args, **kwargs):
+        """Response hook, adjusts the budget to the API's rate limit headers."""
+        headers = response.headers
+        if response.status_code == 429:
+            try:
+                self.block(retry_after(headers) or backoff(0))
+            except OSError:
+                # the caller gets the API's error, not the bookkeeping's
+                pass
+        if "x-ratelimit-limit-requests" not in headers and \
+                "x-ratelimit-limit-tokens" not in headers:
+            return
+
+        def header_int(name: str) -> t.Optional[int]:
+            try:
+                return int(headers[name])
+            except (KeyError, ValueError):
+                return None
+
+        def adjust(state: _State, now: float):
+            rpm = header_int("x-ratelimit-limit-requests")
+            tpm = header_int("x-ratelimit-limit-tokens")
+            if rpm and rpm != state.rpm:
+                # first seen, or changed: the level was kept against another limit
+                state.requests = min(state.requests, float(rpm))
+                state.rpm = rpm
+            if tpm and tpm != state.tpm:
+                state.tokens = min(state.tokens, float(tpm))
+                state.tpm = tpm
+            # requests of other clients count too, never trust the local view more
+            remaining = header_int("x-ratelimit-remaining-requests")
+            if remaining is not None:
+                state.requests = min(state.requests, float(remaining))
+            remaining = header_int("x-ratelimit-remaining-tokens")
+            if remaining is not None:
+                state.tokens = min(state.tokens, float(remaining))
+        try:
+            self._update(adjust)
+        except OSError:
+            # the answer is there, whatever happens to the bookkeeping
+            pass
+
+    def attach(self, session: "requests.Session"):
+        """Let `session` report its responses to `observe`, once."""
+        if self.observe not in session.hooks["response"]:
+            session.hooks["response"].append(self.observe)
+
+    def call(
+        self, send: t.Callable[[], T], cost: int,
+        is_transient: t.Callable[[Exception], bool],
+        on_wait: t.Optional[t.Callable[[float, int], None]] = None
+    ) -> T:
+        """`send` once the budget allows, retried up to `max_retries` times on transient errors.
+
+        `on_wait` gets the seconds about to be waited and the number of the
+        retry, 0 while waiting for the budget before the first attempt.
+        """
+        attempt = 0
+
+        def waiting(delay: float):
+            if on_wait is not None:
+                on_wait(delay, attempt)
+
+        while True:
+            self.acquire(cost, waiting)
+            try:
+                return send()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+                attempt += 1
+                delay = max(backoff(attempt - 1),
+                            retry_after(getattr(e, "headers", None) or {}) or 0.0)
+                waiting(delay)
+                self._sleep(delay)
+
+
+_rate_limiter : t.Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            conf = config.get_config()
+            path = os.path.join(config.get_config_dir(try_create=True), _STATE_FILE_NAME)
+            _rate_limiter = RateLimiter(
+                path, rpm=conf.getint('API', 'RPM_LIMIT'), tpm=conf.getint('API', 'TPM_LIMIT'),
+                max_retries=conf.getint('API', 'MAX_RETRIES'))
+        return _rate_limiter
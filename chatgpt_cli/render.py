@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import re
+import time
+import threading
+import typing as t
+from datetime import timedelta
+
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.progress import Progress, Task, ProgressColumn
+from rich.segment import Segment, Segments
+from rich.text import Text
+
+
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_ITEM_RE = re.compile(r"^ {0,3}(?:[-+*]|\d{1,9}[.)])(?:\s|$)")
+_HEADING_RE = re.compile(r"^ {0,3}#{1,6}(?:\s|$)")
+_RULE_RE = re.compile(r"^ {0,3}([-*_])(?: *\1){2,} *$")
+
+
+class TimeElapsedColumn(ProgressColumn):
+    """Renders time elapsed."""
+
+    def render(self, task: "Task") -> Text:
+        """Show time elapsed."""
+        elapsed = task.finished_time if task.finished else task.elapsed
+        if elapsed is None:
+            return Text("-:--:--", style="progress.elapsed")
+        delta = timedelta(seconds=int(elapsed))
+        return Text(str(delta), style="progress.elapsed")
+
+
+def make_progress_bar(client_console: Console) -> Progress:
+    return Progress(
+        *Progress.get_default_columns(),
+        TimeElapsedColumn(),
+        console=client_console,
+        transient=True,
+    )
+
+
+class MarkdownStream:
+    """Split streamed Markdown into finished top-level blocks and an open tail.
+
+    Finished blocks (paragraphs, headings, closed code fences, lists) are
+    returned once from `feed`; only `tail` changes while a block is open.
+    """
+
+    def __init__(self):
+        self._lines : t.List[str] = []
+        self._partial : str = ""
+        self._fence : t.Optional[str] = None
+        self._is_list : bool = False
+        self._trailing_blanks : int = 0
+        self._finished : t.List[str] = []
+
+    @property
+    def tail(self) -> str:
+        lines = self._lines[:len(self._lines) - self._trailing_blanks]
+        if self._partial:
+            lines = lines + [self._partial]
+        return "\n".join(lines)
+
+    def feed(self, text: str) -> t.List[str]:
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._push_line(line)
+        return self._take_finished()
+
+    def flush(self) -> t.List[str]:
+        if self._partial:
+            self._push_line(self._partial)
+            self._partial = ""
+        self._finish()
+        return self._take_finished()
+
+    def _take_finished(self) -> t.List[str]:
+        finished, self._finished = self._finished, []
+        return finished
+
+    def _finish(self):
+        lines = self._lines[:len(self._lines) - self._trailing_blanks]
+        if lines:
+            self._finished.append("\n".join(lines))
+        self._lines = []
+        self._fence = None
+        self._is_list = False
+        self._trailing_blanks = 0
+
+    def _start(self, line: str):
+        self._lines.append(line)
+        if _HEADING_RE.match(line) or _RULE_RE.match(line):
+            self._finish()
+            return
+        self._is_list = bool(_LIST_ITEM_RE.match(line))
+        fence = _FENCE_RE.match(line)
+        if fence:
+            self._fence = fence.group(1)
+
+    def _push_line(self, line: str):
+        if self._fence is not None:
+            self._push_fenced(line, self._fence)
+        elif line.strip() == "":
+            self._push_blank(line)
+        elif not self._lines:
+            self._start(line)
+        elif self._is_list:
+            self._push_list_line(line)
+        elif _FENCE_RE.match(line) or _HEADING_RE.match(line) or _LIST_ITEM_RE.match(line):
+            self._finish()
+            self._start(line)
+        else:
+            self._lines.append(line)
+
+    def _push_fenced(self, line: str, fence: str):
+        self._lines.append(line)
+        if line.strip().startswith(fence) and not line.strip().strip(fence[0]):
+            if not self._is_list:
+                self._finish()
+            else:
+                self._fence = None
+
+    def _push_blank(self, line: str):
+        if not self._lines:
+            return
+        if not self._is_list:
+            self._finish()
+            return
+        self._lines.append(line)
+        self._trailing_blanks += 1
+
+    def _push_list_line(self, line: str):
+        indented = line.startswith((" ", "\t"))
+        if indented or _LIST_ITEM_RE.match(line):
+            self._lines.append(line)
+            self._trailing_blanks = 0
+            fence = _FENCE_RE.match(line.lstrip())
+            if indented and fence:
+                self._fence = fence.group(1)
+            return
+        if self._trailing_blanks == 0 and not _FENCE_RE.match(line) \
+                and not _HEADING_RE.match(line):
+            # lazy continuation of the last list item
+            self._lines.append(line)
+            return
+        self._finish()
+        self._start(line)
+
+
+class RefreshScheduler:  # pylint: disable=too-many-instance-attributes
+    """Coalesce repaint requests to at most `max_fps` frames per second.
+
+    Requests arriving before the next frame is due are merged into it and a
+    timer paints them once the frame interval has passed.  When a repaint
+    takes more than half of the frame budget, the interval stretches (down
+    to `min_fps`) and relaxes back once terminal writes are fast again.
+    A `max_fps` of 0 paints on every request.
+    """
+
+    def __init__(
+        self, paint: t.Callable[[], None], max_fps: float,
+        min_fps: float = 2.0, clock: t.Callable[[], float] = time.monotonic
+    ):
+        self._paint = paint
+        self._clock = clock
+        self._base_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self._max_interval = max(self._base_interval, 1.0 / min_fps) if max_fps > 0 else 0.0
+        self.interval = self._base_interval
+        self._last_paint : t.Optional[float] = None
+        self._dirty_since : t.Optional[float] = None
+        self._timer : t.Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self.frames = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    @property
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {
+            "frames": self.frames,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "interval": self.interval,
+        }
+
+    def request(self):
+        with self._lock:
+            now = self._clock()
+            if self._last_paint is None or now - self._last_paint >= self.interval:
+                self._paint_now(now)
+                return
+            self.coalesced += 1
+            if self._dirty_since is None:
+                self._dirty_since = now
+            if self._timer is None:
+                self._timer = threading.Timer(
+                    self._last_paint + self.interval - now, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Paint the final frame, whether or not anything is pending."""
+        with self._lock:
+            self._cancel_timer()
+            self._paint_now(self._clock())
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self._dirty_since is not None:
+                self._paint_now(self._clock())
+
+    def _paint_now(self, now: float):
+        self._cancel_timer()
+        if self._dirty_since is not None and self._base_interval:
+            # frames the nominal rate would have shown while content waited
+            waited = int((now - self._dirty_since) / self._base_interval)
+            self.dropped += max(0, waited - 1)
+        self._dirty_since = None
+        self._paint()
+        self.frames += 1
+        self._last_paint = self._clock()
+        elapsed = self._last_paint - now
+        # the first frame pays for one-off parser setup, don't adapt to it
+        if not self._base_interval or self.frames == 1:
+            return
+        if elapsed * 2 > self.interval:
+            self.interval = min(self._max_interval, elapsed * 2)
+        elif elapsed * 4 < self.interval:
+            self.interval = max(self._base_interval, self.interval * 0.75)
+
+
+class LiveMarkdown:
+    """Render a streamed Markdown answer without re-rendering finished blocks.
+
+    Finished blocks are printed above the live region once, the live region
+    only holds the still-open tail block.  Repaints go through a
+    `RefreshScheduler`, so bursts of deltas share one terminal write.
+    """
+
+    def __init__(self, console: Console, refresh_rate: float = 0):
+        self.console = console
+        self.stream = MarkdownStream()
+        self.scheduler = RefreshScheduler(self._paint, refresh_rate)
+        self._live = Live(console=console, auto_refresh=False)
+        self._lock = threading.Lock()
+        self._pending_blocks : t.List[str] = []
+        self._separate = False
+
+    def __enter__(self) -> "LiveMarkdown":
+        self._live.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                with self._lock:
+                    self._pending_blocks.extend(self.stream.flush())
+            self.scheduler.flush()
+        finally:
+            self._live.__exit__(exc_type, exc_val, exc_tb)
+
+    def feed(self, text: str):
+        with self._lock:
+            self._pending_blocks.extend(self.stream.feed(text))
+        self.scheduler.request()
+
+    def _paint(self):
+        with self._lock:
+            blocks, self._pending_blocks = self._pending_blocks, []
+            tail = self.stream.tail
+        self._print_blocks(blocks)
+        self._live.update(Markdown(tail) if tail else Text(""), refresh=True)
+
+    def _print_blocks(self, blocks: t.List[str]):
+        console = self._live.console
+        for block in blocks:
+            segments = list(console.render(Markdown(block)))
+            # Same spacing as rendering the whole answer at once: rich puts a
+            # blank line after every top-level element except rules, and some
+            # elements (lists, tables) already start with one.
+            if self._separate and segments and segments[0].text != "\n":
+                segments.insert(0, Segment.line())
+            console.print(Segments(segments))
+            self._separate = not _RULE_RE.match(block)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import re
+import sqlite3
+import zlib
+import hashlib
+import threading
+import unicodedata
+import typing as t
+
+from chatgpt_cli import config
+
+
+_SIMILAR_FILE_NAME = 'similar.db'
+# characters per shingle
+_SHINGLE = 4
+# MinHash values per question, banded for LSH: two questions become
+# candidates when all the values of one band match, which happens with
+# probability 1 - (1 - J^_ROWS)^_BANDS for a Jaccard similarity J, 0.96 at
+# 0.8 and 0.003 at 0.2
+_BANDS = 8
+_ROWS = 5
+_BINS = _BANDS * _ROWS
+_EMPTY = 1 << 64
+# spreads the crc32 of a shingle over 64 bits, see `signature`
+_GOLDEN = 0x9E3779B97F4A7C15
+# added to the value an empty bin borrows from its neighbour, per step
+_ROTATION = _EMPTY // _BINS + 1
+# candidates sharing the most bands whose similarity is computed
+_CANDIDATES = 8
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+|_")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Casefolded words of `text`, without punctuation, single spaced."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", text)).strip()
+
+
+def shingles(normalized: str) -> t.Set[str]:
+    if len(normalized) <= _SHINGLE:
+        return {normalized}
+    return {normalized[i:i + _SHINGLE] for i in range(len(normalized) - _SHINGLE + 1)}
+
+
+def jaccard(a: t.Set[str], b: t.Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def signature(shingle_set: t.Set[str]) -> t.List[int]:
+    """One-permutation MinHash of `shingle_set`, `_BINS` values.
+
+    Every shingle is hashed once into one of the bins, which keeps the
+    minimum; empty bins take the value of the next filled one, rotated by
+    the distance (densification), so that short questions still have
+    comparable values in every bin.  Shingles are hashed with crc32, a
+    bijection on 4 bytes, and a Fibonacci multiplication: a third of the
+    time of a cryptographic hash.
+    """
+    bins = [_EMPTY] * _BINS
+    width = _EMPTY // _BINS
+    for shingle in shingle_set:
+        value = (zlib.crc32(shingle.encode("utf-8")) * _GOLDEN) & (_EMPTY - 1)
+        bin_index, value = divmod(value, width)
+        bin_index %= _BINS
+        if value < bins[bin_index]:
+            bins[bin_index] = value
+    if all(value == _EMPTY for value in bins):
+        return bins
+    dense = list(bins)
+    for i, value in enumerate(bins):
+        distance = 1
+        while value == _EMPTY:
+            value = bins[(i + distance) % _BINS]
+            if value != _EMPTY:
+                value += distance * _ROTATION
+            distance += 1
+        dense[i] = value
+    return dense
+
+
+def buckets(scope: str, sig: t.List[int]) -> t.List[int]:
+    """The LSH bucket of every band of `sig`, within `scope`."""
+    prefix = scope.encode("utf-8") + b"\0"
+    return [
+        _hash64(prefix + bytes([band]) + b"".join(
+            value.to_bytes(9, "big") for value in sig[band * _ROWS:(band + 1) * _ROWS])) >> 1
+        for band in range(_BANDS)
+    ]
+
+
+class SimilarityIndex:
+    """Questions whose answers are cached, found again by Jaccard similarity.
+
+    Questions are normalized (case, punctuation and whitespace) and split
+    into character shingles; a MinHash LSH index over them finds the few
+    candidates worth comparing, in one indexed query whatever the number of
+    questions.  `scope` keeps questions of different prompts and models
+    apart.  Entries point to `cache.ResponseCache` keys, the answers stay
+    there.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                key TEXT NOT NULL
+            )""")
+        # the bucket of band b of question q is row q * _BANDS + b, so that
+        # dropping the oldest questions drops a range of rows
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                id INTEGER PRIMARY KEY,
+                bucket INTEGER NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+    def add(self, scope: str, question: str, key: str):
+        self.add_many(scope, [(question, key)])
+
+    def add_many(self, scope: str, entries: t.Iterable[t.Tuple[str, str]]):
+        """Add `(question, key)` pairs in one transaction."""
+        rows = []
+        for question, key in entries:
+            normalized = normalize(question)
+            rows.append((normalized, key, buckets(scope, signature(shingles(normalized)))))
+        if not rows:
+            return
+        with self._lock, self._db:
+            last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM questions").fetchone()[0]
+            self._db.executemany(
+                "INSERT INTO questions (id, scope, normalized, key) VALUES (?, ?, ?, ?)",
+                [(last_id + i, scope, normalized, key)
+                 for i, (normalized, key, _) in enumerate(rows, 1)])
+            self._db.executemany(
+                "INSERT INTO buckets (id, bucket) VALUES (?, ?)",
+                [((last_id + i) * _BANDS + band, bucket)
+                 for i, (_, _, row_buckets) in enumerate(rows, 1)
+                 for band, bucket in enumerate(row_buckets)])
+            oldest = last_id + len(rows) - self.max_entries
+            if self.max_entries and oldest > 0:
+                self._db.execute("DELETE FROM questions WHERE id <= ?", (oldest,))
+                self._db.execute("DELETE FROM buckets WHERE id < ?", ((oldest + 1) * _BANDS,))
+
+    def lookup(self, scope: str, question: str,
+               threshold: float) -> t.List[t.Tuple[str, float]]:
+        """Keys of the questions at least `threshold` similar, most similar first."""
+        normalized = normalize(question)
+        shingle_set = shingles(normalized)
+        rows = buckets(scope, signature(shingle_set))
+        with self._lock:
+            candidates = self._db.execute(
+                f"SELECT q.normalized, q.key FROM questions q JOIN ("
+                f"  SELECT id / {_BANDS} AS question_id, COUNT(*) AS bands FROM buckets"
+                f"  WHERE bucket IN ({', '.join('?' * len(rows))})"
+                f"  GROUP BY question_id ORDER BY bands DESC, question_id DESC LIMIT ?"
+                f") c ON q.id = c.question_id WHERE q.scope = ?",
+                rows + [_CANDIDATES, scope]).fetchall()
+        hits = []
+        for candidate, key in candidates:
+            similarity = 1.0 if candidate == normalized else jaccard(
+                shingle_set, shingles(candidate))
+            if similarity >= threshold:
+                hits.append((key, similarity))
+        hits.sort(key=lambda hit: -hit[1])
+        return hits
+
+
+_similarity_index : t.Optional[SimilarityIndex] = None
+_similarity_index_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    conf = config.get_config()
+    return conf.getboolean('CACHE', 'enable') and conf.getboolean('CACHE', 'similar')
+
+
+def get_similarity_index() -> SimilarityIndex:
+    global _similarity_index
+    with _similarity_index_lock:
+        if _similarity_index is None:
+            path = os.path.join(config.get_config_dir(try_create=True), _SIMILAR_FILE_NAME)
+            _similarity_index = SimilarityIndex(
+                path, max_entries=config.get_config().getint('CACHE', 'similar_max_entries'))
+        return _similarity_index
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import re
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+import typing as t
+
+from chatgpt_cli import config
+
+if t.TYPE_CHECKING:
+    from chatgpt_cli.chatapi import ChatMessage, ChatSession
+
+
+_STORE_FILE_NAME = 'sessions.db'
+_SCHEMA_VERSION = 2
+_WRITE_BATCH = 256
+_META_COLUMNS = "id, name, prompt, no_context, created, updated, message_count"
+_SEARCH_LIMIT = 20
+# matches ranked by a search, the most recent ones, so that the time of a
+# search for a word found in most messages stays bounded
+_SEARCH_CANDIDATES = 5000
+# tokens of context around the matches of a search hit
+_SNIPPET_TOKENS = 12
+# around the matched terms in `SearchHit.snippet`
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+_FTS_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+        content, content='messages', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END""",
+)
+
+
+class SessionMeta(t.NamedTuple):
+    session_id: int
+    name: str
+    prompt: str
+    no_context: bool
+    created: float
+    updated: float
+    message_count: int
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "SessionMeta":
+        return cls(row[0], row[1], row[2], bool(row[3]), row[4], row[5], row[6])
+
+
+class SearchHit(t.NamedTuple):
+    session_id: int
+    session_name: str
+    role: str
+    timestamp: int
+    # the matched part of the message, terms between MATCH_START and MATCH_END
+    snippet: str
+
+
+def fts_query(terms: t.Sequence[str]) -> str:
+    """FTS5 query matching messages with all `terms`, `term*` as a prefix.
+
+    Terms are quoted, so FTS5 operators and punctuation in them are searched
+    for rather than interpreted.
+    """
+    parts = []
+    for term in terms:
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if term:
+            quoted = term.replace('"', '""')
+            parts.append(f'"{quoted}"' + ("*" if prefix else ""))
+    return " ".join(parts)
+
+
+def _like_snippet(content: str, words: t.Sequence[str]) -> str:
+    """Like the FTS5 snippet: text around the first match, `words` marked."""
+    pattern = re.compile("|".join(re.escape(word) for word in
+                                  sorted(words, key=len, reverse=True)), re.IGNORECASE)
+    # FTS5 counts tokens, a token is about 6 characters of text
+    size = _SNIPPET_TOKENS * 6
+    first = pattern.search(content)
+    start = max(0, min(first.start() - size // 3 if first else 0, len(content) - size))
+    end = start + size
+    snippet = pattern.sub(lambda match: f"{MATCH_START}{match.group(0)}{MATCH_END}",
+                          content[start:end])
+    return ("..." if start else "") + snippet + ("..." if end < len(content) else "")
+
+
+class SessionStore:
+    """Append-only SQLite store of chat sessions.
+
+    Writes are queued and applied by a background thread in batches, so the
+    prompt never waits on disk.  Reads flush the queue first.  Messages are
+    indexed for `search` by FTS5 triggers as they are inserted, when the
+    SQLite build has FTS5.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                no_context INTEGER NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                session_id INTEGER NOT NULL REFERENCES sessions (id),
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+        """)
+        self._db.commit()
+        self._migrate()
+        self._queue : "queue.Queue[t.Optional[t.Tuple[str, tuple]]]" = queue.Queue()
+        self._error : t.Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True,
+                                        name="session-store-writer")
+        self._writer.start()
+
+    def _migrate(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._strip_prompt_prefixes()
+            if version < 2:
+                self._create_search_index()
+            self._db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self._db.commit()
+        except BaseException:
+            self._db.rollback()
+            raise
+
+    def _strip_prompt_prefixes(self):
+        """Version 1: the prompt is no longer stored in user messages.
+
+        Older versions saved every user message as "<prompt>\n\n<question>".
+        The prompt may have been switched mid-session, so the longest of the
+        configured prompts that prefixes a message is removed.
+        """
+        prefixes = sorted(
+            {f"{config.get_prompt_message(name)}\n\n" for name in config.prompts()},
+            key=len, reverse=True)
+        rows = self._db.execute(
+            "SELECT id, content FROM messages WHERE role = 'user'").fetchall()
+        for message_id, content in rows:
+            for prefix in prefixes:
+                if content.startswith(prefix):
+                    self._db.execute("UPDATE messages SET content = ? WHERE id = ?",
+                                     (content[len(prefix):], message_id))
+                    break
+
+    def _create_search_index(self):
+        """Version 2: full-text index of the messages."""
+        try:
+            for statement in _FTS_SCHEMA:
+                self._db.execute(statement)
+        except sqlite3.OperationalError as e:
+            if "fts5" not in str(e):
+                raise
+            # built without FTS5, `search` scans the messages instead
+            return
+        self._db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+    @property
+    def has_search_index(self) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+
+    def search(self, terms: t.Sequence[str], limit: int = _SEARCH_LIMIT) -> t.List[SearchHit]:
+        """Messages containing all `terms`, best matches first.
+
+        Only the latest `_SEARCH_CANDIDATES` matches are ranked.
+        """
+        query = fts_query(terms)
+        if not query:
+            return []
+        self.flush()
+        if not self.has_search_index:
+            return self._scan(terms, limit)
+        with self._lock:
+            # walking the matches newest first stops early, ranking can't
+            oldest = self._db.execute(
+                "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? "
+                "ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (query, _SEARCH_CANDIDATES - 1)).fetchone()
+            rows = self._db.execute(
+                "SELECT m.session_id, s.name, m.role, m.timestamp, "
+                f"  snippet(messages_fts, 0, ?, ?, '...', {_SNIPPET_TOKENS}) "
+                "FROM messages_fts "
+                "JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN sessions s ON s.id = m.session_id "
+                "WHERE messages_fts MATCH ? AND messages_fts.rowid >= ? "
+                "ORDER BY rank LIMIT ?",
+                (MATCH_START, MATCH_END, query, oldest[0] if oldest else 0, limit)).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def _scan(self, terms: t.Sequence[str], limit: int) -> t.List[SearchHit]:
+        words = [term.rstrip("*") for term in terms if term.rstrip("*")]
+        where = " AND ".join("m.content LIKE ?" for _ in words)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT m.session_id, s.name, m.role, m.timestamp, m.content "
+                "FROM messages m JOIN sessions s ON s.id = m.session_id "
+                f"WHERE {where} ORDER BY m.id DESC LIMIT ?",
+                [f"%{word}%" for word in words] + [limit]).fetchall()
+        return [SearchHit(session_id=session_id, session_name=name, role=role,
+                          timestamp=timestamp, snippet=_like_snippet(content, words))
+                for session_id, name, role, timestamp, content in rows]
+
+    def list_sessions(self) -> t.List[SessionMeta]:
+        """Metadata of every saved session, most recently updated first."""
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_META_COLUMNS} FROM sessions ORDER BY updated DESC, id DESC").fetchall()
+        return [SessionMeta.from_row(row) for row in rows]
+
+    def find_session(self, name: str) -> t.Optional[SessionMeta]:
+        """The latest session called `name`, or with id `#<id>`."""
+        where = "name = ?"
+        param : t.Any = name
+        if name.startswith("#") and name[1:].isdigit():
+            where, param = "id = ?", int(name[1:])
+        self.flush()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {_META_COLUMNS} FROM sessions WHERE {where} "
+                "ORDER BY updated DESC LIMIT 1", (param,)).fetchone()
+        return SessionMeta.from_row(row) if row else None
+
+    def load_messages(self, session_id: int) -> t.List[t.Tuple[str, str, int]]:
+        """(role, content, timestamp) of a session's messages, oldest first."""
+        self.flush()
+        with self._lock:
+            return self._db.execute(
+                "SELECT role, content, timestamp FROM messages "
+                "WHERE session_id = ? ORDER BY id", (session_id,)).fetchall()
+
+    def iter_messages(
+        self, session_id: int, batch: int = 1000
+    ) -> t.Iterator[t.Tuple[str, str, int]]:
+        """Like `load_messages`, `batch` messages in memory at a time."""
+        self.flush()
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, role, content, timestamp FROM messages "
+                    "WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (session_id, last_id, batch)).fetchall()
+            for row in rows:
+                yield row[1:]
+            if len(rows) < batch:
+                return
+            last_id = rows[-1][0]
+
+    def import_session(  # pylint: disable=too-many-arguments
+        self, name: str, prompt: str, no_context: bool, *, created: float, updated: float,
+        messages: t.Iterable["ChatMessage"], batch: int = 1000
+    ) -> int:
+        """Save a session with its times and messages, `batch` messages at a time.
+
+        Synchronous, unlike the writes of the chat; returns the new session id.
+        The session is removed again if reading `messages` fails.
+        """
+        self.flush()
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO sessions (name, prompt, no_context, created, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, prompt, int(no_context), created or now, updated or now))
+        session_id = cursor.lastrowid
+        assert session_id is not None
+        rows : t.List[tuple] = []
+
+        def insert():
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT INTO messages (session_id, role, content, timestamp) "
+                    "VALUES (?, ?, ?, ?)", rows)
+                self._db.execute("UPDATE sessions SET message_count = message_count + ? "
+                                 "WHERE id = ?", (len(rows), session_id))
+            rows.clear()
+
+        try:
+            for message in messages:
+                rows.append((session_id, message.message_type.value, message.message,
+                             message.timestamp))
+                if len(rows) >= batch:
+                    insert()
+            if rows:
+                insert()
+        except BaseException:
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            raise
+        return session_id
+
+    def append_message(self, session: "ChatSession", message: "ChatMessage"):
+        now = time.time()
+        if session.session_id is None:
+            self._create_session(session, now)
+        self._put(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            (session.session_id, message.message_type.value, message.message, message.timestamp))
+        self._put(
+            "UPDATE sessions SET message_count = message_count + 1, updated = ? WHERE id = ?",
+            (now, session.session_id))
+
+    def save_session(self, session: "ChatSession"):
+        """Persist name, prompt and context changes of a saved session."""
+        if session.session_id is None:
+            return
+        self._put(
+            "UPDATE sessions SET name = ?, prompt = ?, no_context = ?, updated = ? WHERE id = ?",
+            (session.session_name, session.prompt, int(session.no_context), time.time(),
+             session.session_id))
+
+    def _create_session(self, session: "ChatSession", now: float):
+        # once per session and synchronous, so that concurrent chatgpt-cli
+        # processes get distinct ids from SQLite
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO sessions (name, prompt, no_context, created, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session.session_name, session.prompt, int(session.no_context), now, now))
+            session.session_id = cursor.lastrowid
+
+    def _put(self, sql: str, params: tuple):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((sql, params))
+
+    def flush(self):
+        """Wait until every queued write is committed."""
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        if not self._writer.is_alive():
+            return
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._db.close()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < _WRITE_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            writes = [w for w in batch if w is not None]
+            try:
+                if writes and self._error is None:
+                    with self._lock, self._db:
+                        for sql, params in writes:
+                            self._db.execute(sql, params)
+            except sqlite3.Error as e:
+                self._error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(writes) != len(batch):
+                return
+
+
+_session_store : t.Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        path = os.path.join(config.get_config_dir(try_create=True), _STORE_FILE_NAME)
+        _session_store = SessionStore(path)
+        atexit.register(_session_store.close)
+    return _session_store
@@ -2,6 +2,7 @@
 #
 # Copyright 2023, JayPei <jaypei97159@gmail.com>
 #
+# pylint: disable=import-outside-toplevel
 
 
 import os
@@ -9,21 +10,17 @@ import shlex
 import typing as t
 import tempfile
 import subprocess
-from datetime import timedelta
-
-from rich.console import Console
-from rich.text import Text
-from rich.progress import Progress, Task, ProgressColumn
-from rich.emoji import EMOJI
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.styles import Style
 
 from chatgpt_cli import config
 
+if t.TYPE_CHECKING:
+    from rich.console import Console
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.styles import Style
+
 
 # Reference: https://rich.readthedocs.io/en/stable/appendix/colors.html#appendix-colors
-prompt_style = Style.from_dict({
+PROMPT_STYLE = {
     # default text
     '': '#d7af00',
     'input_key': '#d7af00',
@@ -31,46 +28,83 @@ prompt_style = Style.from_dict({
     'conversation_count': '#5fd700 bold',
     'prompt_sep': '#008700 bold',
     'prompt_name': '#00cbcb bold',
-})
+    'tokens': '#808080',
+}
+
 
+# console and the prompt sessions are created on first access (see
+# `__getattr__`), so a command that never prompts doesn't import prompt_toolkit
+console: "Console"
+# status and errors of commands writing their results to stdout
+err_console: "Console"
+prompt: "PromptSession"
+prompt_no_hist: "PromptSession"
 
-console: Console
-prompt: PromptSession
-prompt_no_hist: PromptSession
+_PROMPT_HIST_FILE_NAME = "cli_history.db"
+# the FileHistory of older versions, imported once
+_LEGACY_HIST_FILE_NAME = "cli_history"
+
+_config_dir : t.Optional[str] = None
 
 
 def init():
-    global console, prompt, prompt_no_hist
-    config_dir = config.get_config_dir(try_create=True)
-    prompt_hist_file = os.path.join(config_dir, "cli_history")
-    prompt = PromptSession(history=FileHistory(prompt_hist_file), style=prompt_style)
-    prompt_no_hist = PromptSession(style=prompt_style)
-    console = Console()
+    global _config_dir
+    _config_dir = config.get_config_dir(try_create=True)
 
 
-def get_emoji(name):
-    return EMOJI.get(name, name)
+def get_prompt_style() -> "Style":
+    from prompt_toolkit.styles import Style
+    return Style.from_dict(PROMPT_STYLE)
+
+
+def _new_console() -> "Console":
+    from rich.console import Console
+    return Console()
+
 
+def _new_err_console() -> "Console":
+    from rich.console import Console
+    return Console(stderr=True)
 
-class TimeElapsedColumn(ProgressColumn):
-    """Renders time elapsed."""
 
-    def render(self, task: "Task") -> Text:
-        """Show time elapsed."""
-        elapsed = task.finished_time if task.finished else task.elapsed
-        if elapsed is None:
-            return Text("-:--:--", style="progress.elapsed")
-        delta = timedelta(seconds=int(elapsed))
-        return Text(str(delta), style="progress.elapsed")
+def _new_prompt() -> "PromptSession":
+    from prompt_toolkit import PromptSession
+    from chatgpt_cli.history import BoundedHistory
+    conf = config.get_config()
+    config_dir = _config_dir or config.get_config_dir(try_create=True)
+    history = BoundedHistory(
+        os.path.join(config_dir, _PROMPT_HIST_FILE_NAME),
+        max_entries=conf.getint('CLI', 'history_size'),
+        max_chars=conf.getint('CLI', 'history_max_chars'),
+        legacy_file=os.path.join(config_dir, _LEGACY_HIST_FILE_NAME))
+    return PromptSession(history=history, style=get_prompt_style())
 
 
-def make_progress_bar(client_console: Console) -> Progress:
-    return Progress(
-        *Progress.get_default_columns(),
-        TimeElapsedColumn(),
-        console=client_console,
-        transient=True,
-    )
+def _new_prompt_no_hist() -> "PromptSession":
+    from prompt_toolkit import PromptSession
+    return PromptSession(style=get_prompt_style())
+
+
+_LAZY_GLOBALS : t.Dict[str, t.Callable[[], t.Any]] = {
+    "console": _new_console,
+    "err_console": _new_err_console,
+    "prompt": _new_prompt,
+    "prompt_no_hist": _new_prompt_no_hist,
+}
+
+
+def __getattr__(name: str) -> t.Any:
+    factory = _LAZY_GLOBALS.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = factory()
+    globals()[name] = value
+    return value
+
+
+def get_emoji(name):
+    from rich.emoji import EMOJI
+    return EMOJI.get(name, name)
 
 
 def split_command_line(cmdline: str) -> t.List[str]:
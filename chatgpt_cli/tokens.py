@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import functools
+import typing as t
+
+from chatgpt_cli import config
+
+
+# tokens the chat format adds around every message, and to prime the reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+_CONTEXT_WINDOWS = [
+    # (model prefix, context window), longest prefix first
+    ("gpt-3.5-turbo-16k", 16384),
+    ("gpt-3.5-turbo", 4096),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+]
+_DEFAULT_CONTEXT_WINDOW = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str) -> t.Any:
+    """tiktoken encoding of `model`, None when tiktoken is not usable."""
+    try:
+        import tiktoken  # type: ignore # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # pylint: disable=broad-exception-caught
+        # the encoding files are downloaded on first use, offline it fails
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # roughly 4 bytes of English per token, and about a token per CJK char
+        return (len(text.encode("utf-8")) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def context_window(model: str) -> int:
+    configured = config.get_config().getint('API', 'CONTEXT_WINDOW')
+    if configured > 0:
+        return configured
+    for prefix, window in _CONTEXT_WINDOWS:
+        if model.startswith(prefix):
+            return window
+    return _DEFAULT_CONTEXT_WINDOW
+
+
+def prompt_budget(model: str) -> int:
+    """Tokens available to the query messages of `model`."""
+    reserve = config.get_config().getint('API', 'REPLY_TOKEN_RESERVE')
+    return max(0, context_window(model) - reserve - REPLY_OVERHEAD)
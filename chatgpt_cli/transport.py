@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import time
+import threading
+import typing as t
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# connections idle for longer than this may have been closed by the server,
+# so a pre-warm opens a new one
+KEEPALIVE_SECONDS = 60.0
+_POOL_SIZE = 16
+
+
+_connect_time = threading.local()
+
+
+def take_connect_time() -> float:
+    """Seconds this thread spent opening connections since the last call."""
+    elapsed = getattr(_connect_time, "total", 0.0)
+    _connect_time.total = 0.0
+    return elapsed
+
+
+def _add_connect_time(elapsed: float):
+    _connect_time.total = getattr(_connect_time, "total", 0.0) + elapsed
+
+
+_last_response = threading.local()
+
+
+def take_last_response() -> t.Optional[requests.Response]:
+    """The latest response this thread got from a pooled session.
+
+    Lets a caller close a stream openai only exposes as an iterator.
+    """
+    response = getattr(_last_response, "response", None)
+    _last_response.response = None
+    return response
+
+
+class _TimedHTTPConnection(HTTPConnection):
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(time.perf_counter() - start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        # includes the TLS handshake
+        start = time.perf_counter()
+        try:
+            # pylint infers urllib3's DummyConnection, the fallback without ssl
+            super().connect()  # pylint: disable=no-member
+        finally:
+            _add_connect_time(time.perf_counter() - start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class PooledSession(requests.Session):
+    """Keep-alive HTTP session shared by every request of the process.
+
+    openai recycles its session every few minutes by closing it, which would
+    drop the warm connections, so `close` is a no-op and `shutdown` really
+    closes the pool.
+    """
+
+    def __init__(self, pool_size: int = _POOL_SIZE):
+        super().__init__()
+        adapter = _TimedAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.last_used : float = 0.0
+        self.hooks["response"].append(self._touch)
+
+    def _touch(self, response: requests.Response, *args, **kwargs):
+        self.last_used = time.monotonic()
+        _last_response.response = response
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+        self.last_used = 0.0
+
+
+_session : t.Optional[PooledSession] = None
+_session_lock = threading.Lock()
+_prewarm_thread : t.Optional[threading.Thread] = None
+
+
+def get_session() -> PooledSession:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession()
+        return _session
+
+
+def is_warm() -> bool:
+    return time.monotonic() - get_session().last_used < KEEPALIVE_SECONDS
+
+
+def prewarm(get_api_base: t.Callable[[], str]) -> t.Optional[threading.Thread]:
+    """Open a connection to the API host in the background.
+
+    `get_api_base` runs in the background thread too, so it may do the slow
+    openai import.  Nothing happens if a connection was used recently or a
+    pre-warm is still running.
+    """
+    global _prewarm_thread
+    if is_warm() or (_prewarm_thread is not None and _prewarm_thread.is_alive()):
+        return None
+
+    def warm():
+        try:
+            # any answer will do, the connection goes back into the pool
+            get_session().head(get_api_base(), timeout=10)
+        except Exception:  # pylint: disable=broad-exception-caught
+            pass
+
+    _prewarm_thread = threading.Thread(target=warm, daemon=True, name="prewarm")
+    _prewarm_thread.start()
+    return _prewarm_thread
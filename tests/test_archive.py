@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+from rich.console import Console
+
+from chatgpt_cli import archive
+from chatgpt_cli.archive import ArchiveReader, ArchiveWriter
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession
+from chatgpt_cli.cmds.session import SessionCommand
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.error import CommandError
+from chatgpt_cli.store import SessionStore
+
+
+def make_session(name, turns):
+    session = ChatSession(name, "assist")
+    session.no_context = turns % 2 == 0
+    for turn in range(turns):
+        session.add_message(ChatMessage(f"{name} question {turn} ✓", ChatMessageType.USER,
+                                        1680000000 + turn))
+        session.add_message(ChatMessage(f"```\n{name} answer {turn}\n```",
+                                        ChatMessageType.ASSISTANT, 1680000000 + turn))
+    return session
+
+
+class CountingReader(io.BytesIO):
+    """Counts the bytes read, without seek when not `seekable`."""
+
+    def __init__(self, data, seekable=True):
+        super().__init__(data)
+        self.bytes_read = 0
+        self._seekable = seekable
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seekable(self):
+        return self._seekable
+
+    def seek(self, *args):
+        if not self._seekable:
+            raise io.UnsupportedOperation("seek")
+        return super().seek(*args)
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.sessions = [make_session(f"s{i}", turns) for i, turns in enumerate([3, 0, 200, 5])]
+
+    def write(self, codec="gzip", block_size=512):
+        out = io.BytesIO()
+        with ArchiveWriter(out, codec=codec, block_size=block_size) as writer:
+            for session in self.sessions:
+                writer.write_session(session)
+        return out.getvalue()
+
+    def assertSameSession(self, loaded, session):
+        self.assertEqual((loaded.session_name, loaded.prompt, loaded.no_context),
+                         (session.session_name, session.prompt, session.no_context))
+        self.assertEqual(list(loaded.histories), list(session.histories))
+        self.assertEqual(loaded.conversation_count, session.conversation_count)
+
+    def test_round_trip(self):
+        data = self.write()
+        reader = ArchiveReader(io.BytesIO(data))
+        index = reader.index()
+        self.assertEqual([entry.message_count for entry in index], [6, 0, 400, 10])
+        for entry, session in zip(reversed(index), reversed(self.sessions)):
+            self.assertSameSession(reader.load_session(entry), session)
+
+    def test_reads_one_session_only(self):
+        data = self.write()
+        inp = CountingReader(data)
+        reader = ArchiveReader(inp)
+        entry = reader.index()[3]
+        self.assertSameSession(reader.load_session(entry), self.sessions[3])
+        self.assertLess(inp.bytes_read, len(data) / 4)
+
+    def test_streams_in_order(self):
+        reader = ArchiveReader(CountingReader(self.write(), seekable=False))
+        names = []
+        for entry, messages in reader.sessions():
+            names.append(entry.name)
+            if entry.name == "s3":
+                self.assertEqual(list(messages), list(self.sessions[3].histories))
+        self.assertEqual(names, ["s0", "s1", "s2", "s3"])
+
+    def test_damaged(self):
+        data = bytearray(self.write())
+        with self.assertRaises(CommandError):
+            ArchiveReader(io.BytesIO(b"PK\x03\x04" + bytes(data[4:])))
+        data[40] ^= 0xff
+        reader = ArchiveReader(io.BytesIO(bytes(data)))
+        with self.assertRaises(CommandError):
+            list(reader.records())
+        with self.assertRaises(CommandError):
+            ArchiveReader(io.BytesIO(bytes(data[:-3]))).index()
+
+    def test_gzip(self):
+        def compress(data, compresslevel=9):
+            # gzip.compress before 3.8 has no mtime
+            return gzip_compress(data, compresslevel)
+
+        gzip_compress = gzip.compress
+        with mock.patch("gzip.compress", compress):
+            data = self.write(codec="gzip")
+        # the blocks carry no timestamp, so the same sessions give the same archive
+        with mock.patch("time.time", return_value=1e9):
+            self.assertEqual(self.write(codec="gzip"), data)
+        reader = ArchiveReader(io.BytesIO(data))
+        self.assertSameSession(reader.load_session(reader.index()[2]), self.sessions[2])
+
+    def test_codecs(self):
+        try:
+            import zstandard  # type: ignore # pylint: disable=unused-import,import-outside-toplevel
+        except ImportError:
+            with self.assertRaises(CommandError):
+                ArchiveWriter(io.BytesIO(), codec="zstd")
+            return
+        data = self.write(codec="zstd")
+        reader = ArchiveReader(io.BytesIO(data))
+        self.assertSameSession(reader.load_session(reader.index()[2]), self.sessions[2])
+
+
+class TestSessionCommand(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.source = self.new_store("source.db")
+        for name, turns in [("alpha", 2), ("beta", 3)]:
+            session = ChatSession(name, "assist")
+            for message in make_session(name, turns).histories:
+                self.source.append_message(session, message)
+
+    def new_store(self, name):
+        store = SessionStore(os.path.join(self.tmp_dir, name))
+        self.addCleanup(store.close)
+        return store
+
+    def invoke(self, store, *args, exit_code=0, **kwargs):
+        errors = io.StringIO()
+        with mock.patch("chatgpt_cli.store.get_session_store", return_value=store), \
+                mock.patch("chatgpt_cli.term.err_console", Console(file=errors), create=True):
+            result = CliRunner().invoke(SessionCommand(), args, **kwargs)
+        self.assertEqual(result.exit_code, exit_code, errors.getvalue())
+        if exit_code:
+            # reported, not a traceback
+            self.assertIsInstance(result.exception, SystemExit)
+        return result
+
+    def test_export_import(self):
+        path = os.path.join(self.tmp_dir, "sessions.cgca")
+        self.invoke(self.source, "export", path)
+        target = self.new_store("target.db")
+        self.invoke(target, "import", path)
+        for meta, copied in zip(self.source.list_sessions(), target.list_sessions()):
+            self.assertEqual(meta[1:], copied[1:])
+            self.assertEqual(self.source.load_messages(meta.session_id),
+                             target.load_messages(copied.session_id))
+
+        result = self.invoke(self.source, "list", path)
+        self.assertIn("beta", result.stdout)
+        target = self.new_store("one.db")
+        self.invoke(target, "import", "--session", "beta", path)
+        self.assertEqual([meta.name for meta in target.list_sessions()], ["beta"])
+
+    def test_pipes(self):
+        result = self.invoke(self.source, "export", "-", "beta")
+        self.assertTrue(result.stdout_bytes.startswith(archive.MAGIC))
+        target = self.new_store("target.db")
+        self.invoke(target, "import", "-", input=result.stdout_bytes)
+        meta, = target.list_sessions()
+        self.assertEqual((meta.name, meta.message_count), ("beta", 6))
+
+    def test_errors(self):
+        path = os.path.join(self.tmp_dir, "sessions.cgca")
+        self.invoke(self.source, "export", path)
+        with open(path, "rb") as f:
+            data = f.read()
+        target = self.new_store("target.db")
+        self.invoke(target, "import", "--session", "beta", "-", exit_code=1,
+                    input=CountingReader(data, seekable=False))
+        short = os.path.join(self.tmp_dir, "short.cgca")
+        with open(short, "wb") as out:
+            out.write(data[:8])
+        self.invoke(self.source, "list", short, exit_code=1)
+        self.invoke(self.source, "export", os.path.join(self.tmp_dir, "none", "s.cgca"),
+                    exit_code=1)
+
+        def messages():
+            yield ChatMessage("question", ChatMessageType.USER)
+            raise CommandError("The archive is damaged.")
+
+        # a session is not left half imported
+        with self.assertRaises(CommandError):
+            target.import_session("broken", "assist", False, created=0.0, updated=0.0,
+                                  messages=messages(), batch=1)
+        self.assertEqual(target.list_sessions(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
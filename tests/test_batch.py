@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from chatgpt_cli.batch import BatchRunner, count_done, read_items
+from chatgpt_cli.chatapi import ChatSessionManager
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.error import CommandError
+
+
+class FakeSessionManager(ChatSessionManager):
+
+    def __init__(self):
+        super().__init__()
+        self.questions = []
+        self.lock = threading.Lock()
+
+    def complete(self, session, model=None, use_cache=False, on_delta=None):
+        question = session.histories[-1].message
+        with self.lock:
+            self.questions.append(question)
+        return question.upper(), {"total_tokens": 3}
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.tmp_dir, "in.jsonl")
+        self.output_path = os.path.join(self.tmp_dir, "out.jsonl")
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            for i in range(20):
+                f.write(json.dumps({"question": f"q{i}", "model": "m"}) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_output(self):
+        with open(self.output_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_ordered_output(self):
+        summary = BatchRunner(FakeSessionManager(), concurrency=4).run(
+            self.input_path, self.output_path)
+        records = self.read_output()
+        self.assertEqual([r["index"] for r in records], list(range(20)))
+        self.assertEqual(records[3]["answer"], "Q3")
+        self.assertEqual(records[3]["model"], "m")
+        self.assertEqual(summary.requests, 20)
+        self.assertEqual(summary.tokens, 60)
+
+    def test_resume(self):
+        BatchRunner(FakeSessionManager()).run(self.input_path, self.output_path)
+        with open(self.output_path, "rb") as f:
+            lines = f.readlines()
+        with open(self.output_path, "wb") as f:
+            f.writelines(lines[:5])
+            f.write(lines[5][:10])
+        self.assertEqual(count_done(self.output_path), 5)
+        session_mgr = FakeSessionManager()
+        summary = BatchRunner(session_mgr).run(self.input_path, self.output_path)
+        self.assertEqual(summary.skipped, 5)
+        self.assertEqual(sorted(session_mgr.questions), sorted(f"q{i}" for i in range(5, 20)))
+        self.assertEqual([r["index"] for r in self.read_output()], list(range(20)))
+
+    def test_default_prompt(self):
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"question": "hello"}) + "\n")
+            f.write(json.dumps({"question": "world", "prompt": "assist"}) + "\n")
+        BatchRunner(FakeSessionManager(), prompt="en-translator").run(
+            self.input_path, self.output_path)
+        self.assertEqual([r["prompt"] for r in self.read_output()], ["en-translator", "assist"])
+
+    def test_not_an_object(self):
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"question": "hello"}) + "\n")
+            f.write(json.dumps(["world"]) + "\n")
+        with self.assertRaises(CommandError) as raised:
+            list(read_items(self.input_path))
+        self.assertIn("item 1 is not an object", raised.exception.message)
+
+    def test_read_csv(self):
+        csv_path = os.path.join(self.tmp_dir, "in.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("question,prompt\nhello,en-translator\nworld,\n")
+        items = list(read_items(csv_path))
+        self.assertEqual(items[0].prompt, "en-translator")
+        self.assertIsNone(items[1].prompt)
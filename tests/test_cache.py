@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from chatgpt_cli.cache import ResponseCache, make_key
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMakeKey(unittest.TestCase):
+
+    def test_normalized(self):
+        messages = [{"role": "user", "content": "hello\r\nworld "}]
+        same = [{"role": "user", "content": "hello\nworld"}]
+        self.assertEqual(make_key("m", messages, 0), make_key("m", same, 0))
+        self.assertNotEqual(make_key("m", messages, 0), make_key("other", messages, 0))
+        self.assertNotEqual(make_key("m", messages, 0), make_key("m", messages, 1))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def new_cache(self, max_size=0, ttl=0):
+        cache = ResponseCache(os.path.join(self.tmp_dir, "cache.db"),
+                              max_size=max_size, ttl=ttl, clock=self.clock)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get_put(self):
+        cache = self.new_cache()
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", "answer")
+        self.assertEqual(cache.get("k"), "answer")
+        self.assertEqual(self.new_cache().get("k"), "answer")
+
+    def test_ttl(self):
+        cache = self.new_cache(ttl=60)
+        cache.put("k", "answer")
+        self.clock.now += 30
+        self.assertEqual(cache.get("k"), "answer")
+        self.clock.now += 31
+        self.assertIsNone(cache.get("k"))
+
+    def test_lru_eviction(self):
+        cache = self.new_cache(max_size=10)
+        cache.put("a", "aaaa")
+        self.clock.now += 1
+        cache.put("b", "bbbb")
+        self.clock.now += 1
+        cache.get("a")
+        self.clock.now += 1
+        cache.put("c", "cccc")
+        self.assertEqual(cache.get("a"), "aaaa")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "cccc")
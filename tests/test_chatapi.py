@@ -6,7 +6,7 @@
 
 import unittest
 
-from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSession, MessageHistory
 from chatgpt_cli.config import init as init_config
 from chatgpt_cli.config import get_config, reload_prompt
 
@@ -29,6 +29,34 @@ class TestChatMessage(unittest.TestCase):
 
 
 
+class TestMessageHistory(unittest.TestCase):
+
+    def test_columns_round_trip(self):
+        history = MessageHistory()
+        messages = [
+            ChatMessage("hello", ChatMessageType.USER, 1),
+            ChatMessage("", ChatMessageType.ASSISTANT, 2),
+            ChatMessage("你好, wörld", ChatMessageType.SYSTEM, 3, token_count=7),
+        ]
+        for message in messages:
+            history.append(message)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(list(history), messages)
+        self.assertEqual(history[-1].token_count, 7)
+        self.assertEqual(history[1:], messages[1:])
+        self.assertEqual(list(reversed(history)), messages[::-1])
+        self.assertEqual(history.role(0), ChatMessageType.USER)
+        self.assertEqual(history.message_json(2), messages[2].to_message_json())
+        with self.assertRaises(IndexError):
+            history[3]  # pylint: disable=pointless-statement
+
+    def test_token_count_is_cached(self):
+        history = MessageHistory()
+        history.append(ChatMessage("hello world", ChatMessageType.USER))
+        count = history.token_count(0, "gpt-3.5-turbo")
+        self.assertEqual(history[0].token_count, count)
+
+
 class TestChatSession(unittest.TestCase):
 
     def setUp(self):
@@ -46,12 +74,23 @@ class TestChatSession(unittest.TestCase):
         chat_session.add_message(ChatMessage("test message 2", ChatMessageType.USER))
 
         expected_result = [
-            ChatMessage("TEST ASSIST\n\ntest message", ChatMessageType.USER).to_message_json(),
+            ChatMessage("TEST ASSIST", ChatMessageType.SYSTEM).to_message_json(),
+            ChatMessage("test message", ChatMessageType.USER).to_message_json(),
             ChatMessage("system response", ChatMessageType.SYSTEM).to_message_json(),
-            ChatMessage("TEST ASSIST\n\ntest message 2", ChatMessageType.USER).to_message_json()
+            ChatMessage("test message 2", ChatMessageType.USER).to_message_json()
         ]
         self.assertEqual(chat_session.generate_query_messages(), expected_result)
 
+    def test_prompt_change_keeps_history(self):
+        chat_session = ChatSession("test_session", "assist")
+        chat_session.add_message(ChatMessage("test message", ChatMessageType.USER))
+        first = chat_session.generate_query_messages()
+        chat_session.prompt = ""
+        self.assertEqual(chat_session.generate_query_messages(), first[1:])
+        chat_session.no_context = True
+        chat_session.prompt = "assist"
+        self.assertEqual(chat_session.generate_query_messages(), first)
+
     def test_add_message(self):
         chat_session = ChatSession("test_session", "assist")
         chat_session.add_message(ChatMessage("test message", ChatMessageType.SYSTEM))
@@ -59,5 +98,65 @@ class TestChatSession(unittest.TestCase):
 
         self.assertEqual(len(chat_session.histories), 2)
         self.assertEqual(chat_session.histories[0].message, "test message")
-        self.assertEqual(chat_session.histories[1].message, "TEST ASSIST\n\ntest message 2")
+        self.assertEqual(chat_session.histories[1].message, "test message 2")
         self.assertEqual(chat_session.conversation_count, 1)
+
+
+class TestContextBudget(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        conf = get_config()
+        conf.set('CLI', 'default_enable_context', 'True')
+        conf.set('API', 'CONTEXT_WINDOW', '100')
+        conf.set('API', 'REPLY_TOKEN_RESERVE', '20')
+
+    def add_turns(self, session, count, tokens_per_message=20):
+        for i in range(count):
+            session.add_message(ChatMessage(f"q{i}", ChatMessageType.USER,
+                                            token_count=tokens_per_message))
+            session.add_message(ChatMessage(f"a{i}", ChatMessageType.ASSISTANT,
+                                            token_count=tokens_per_message))
+
+    def test_everything_fits(self):
+        chat_session = ChatSession("test_session", "")
+        self.add_turns(chat_session, 1)
+        self.assertEqual(chat_session.total_tokens, 40)
+        self.assertEqual(len(chat_session.generate_query_messages()), 2)
+        self.assertEqual(chat_session.dropped_turns, 0)
+        self.assertEqual(chat_session.context_tokens(), (40, 77))
+
+    def test_newest_turns_are_kept(self):
+        chat_session = ChatSession("test_session", "")
+        self.add_turns(chat_session, 3)
+        chat_session.add_message(ChatMessage("q3", ChatMessageType.USER, token_count=20))
+        messages = chat_session.generate_query_messages()
+        self.assertEqual([m["content"] for m in messages], ["q2", "a2", "q3"])
+        self.assertEqual(chat_session.dropped_turns, 2)
+        self.assertEqual(chat_session.context_tokens(), (60, 77))
+
+    def test_selection_starts_at_user_turn(self):
+        chat_session = ChatSession("test_session", "")
+        self.add_turns(chat_session, 3)
+        messages = chat_session.generate_query_messages()
+        # a1 would still fit, but it is the answer to a dropped question
+        self.assertEqual([m["content"] for m in messages], ["q2", "a2"])
+        self.assertEqual(chat_session.context_tokens(), (40, 77))
+
+    def test_prompt_counts_against_budget(self):
+        conf = get_config()
+        conf.set('PROMPT', 'assist', 'TEST ASSIST')
+        reload_prompt()
+        chat_session = ChatSession("test_session", "assist")
+        system_message = chat_session.system_message()
+        assert system_message is not None
+        system_message.token_count = 20
+        self.add_turns(chat_session, 2)
+        messages = chat_session.generate_query_messages()
+        self.assertEqual([m["content"] for m in messages], ["TEST ASSIST", "q1", "a1"])
+        self.assertEqual(chat_session.context_tokens(), (60, 77))
+
+    def test_newest_message_always_sent(self):
+        chat_session = ChatSession("test_session", "")
+        chat_session.add_message(ChatMessage("huge", ChatMessageType.USER, token_count=500))
+        self.assertEqual(len(chat_session.generate_query_messages()), 1)
@@ -4,9 +4,14 @@
 #
 
 
+import sys
+import subprocess
 import unittest
 from unittest.mock import Mock
-from chatgpt_cli.cmds.base import BaseCmd, load_cmd
+
+import click
+
+from chatgpt_cli.cmds.base import BaseCmd, LazyCmdGroup, load_cmd
 
 
 class TestCmdLoader(unittest.TestCase):
@@ -39,3 +44,25 @@ class TestCmdLoader(unittest.TestCase):
         with unittest.mock.patch("chatgpt_cli.cmds.base.importlib.import_module", return_value=module):
             cmd = load_cmd(cmd_name)
             cmd_cls.assert_called_once()
+
+
+class TestLazyCmdGroup(unittest.TestCase):
+
+    def test_loads_on_lookup(self):
+        group = LazyCmdGroup(lazy_cmds={"config": "ConfigCommand"})
+        ctx = click.Context(group)
+        self.assertEqual(group.list_commands(ctx), ["config"])
+        self.assertEqual(group.commands, {})
+        cmd = group.get_command(ctx, "config")
+        assert cmd is not None
+        self.assertEqual(cmd.name, "config")
+        self.assertIs(group.get_command(ctx, "config"), cmd)
+        self.assertIsNone(group.get_command(ctx, "missing"))
+
+    def test_main_import_is_light(self):
+        code = ("import sys, chatgpt_cli.main; "
+                "print(' '.join(m for m in ('openai', 'prompt_toolkit', 'pkg_resources', 'rich') "
+                "if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                             text=True, check=True).stdout
+        self.assertEqual(out.strip(), "")
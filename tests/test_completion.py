@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import random
+import unittest
+
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+
+from chatgpt_cli.completion import CompletionIndex, RadixTrie
+
+
+def complete(index, text):
+    return [c.text for c in index.get_completions(Document(text), CompleteEvent())]
+
+
+class TestRadixTrie(unittest.TestCase):
+
+    def test_prefix(self):
+        trie = RadixTrie(["/sessions", "/search", "/switch", "/stats", "/hist"])
+        self.assertEqual(list(trie.iter_prefix("/s")),
+                         ["/search", "/sessions", "/stats", "/switch"])
+        self.assertEqual(list(trie.iter_prefix("/se")), ["/search", "/sessions"])
+        self.assertEqual(list(trie.iter_prefix("/sea")), ["/search"])
+        self.assertEqual(list(trie.iter_prefix("/x")), [])
+        self.assertEqual(list(trie.iter_prefix("/s", limit=1)), ["/search"])
+        self.assertEqual(list(trie.iter_prefix("/searching")), [])
+
+    def test_matches_a_sorted_list(self):
+        rnd = random.Random(7)
+        words = {"".join(rnd.choice("abc") for _ in range(rnd.randint(0, 6)))
+                 for _ in range(300)}
+        trie = RadixTrie(words)
+        removed = set(rnd.sample(sorted(words), 100))
+        for word in removed:
+            trie.discard(word)
+        trie.discard("not-there")
+        words -= removed
+        self.assertEqual(len(trie), len(words))
+        for prefix in ["", "a", "ab", "cab", "bbb"]:
+            self.assertEqual(list(trie.iter_prefix(prefix)),
+                             sorted(w for w in words if w.startswith(prefix)))
+        for word in removed:
+            self.assertNotIn(word, trie)
+
+
+class TestCompletionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = CompletionIndex(max_questions=2)
+        self.index.add_command("/prompt", ["default", "en-translator"])
+        self.index.add_command("/switch", ["Chat01"])
+        self.index.add_command("/sessions")
+
+    def test_commands(self):
+        self.assertEqual(complete(self.index, "/s"), ["/sessions", "/switch"])
+        self.assertEqual(complete(self.index, "/prompt "), ["default", "en-translator"])
+        self.index.add_argument("/switch", "Chat02")
+        self.assertEqual(complete(self.index, "/switch Chat"), ["Chat01", "Chat02"])
+        self.assertEqual(complete(self.index, "/prompt default x"), [])
+        # fuzzy when nothing starts with it
+        self.assertEqual(complete(self.index, "/ssns"), ["/sessions"])
+        self.assertEqual(complete(self.index, "/prompt trans"), ["en-translator"])
+
+    def test_questions(self):
+        for question in ["how are you", "how old are you", "what time is it"]:
+            self.index.add_question(question)
+        self.index.add_question("/prompt default")
+        # only the latest two are kept
+        self.assertEqual(complete(self.index, "how"), ["how old are you"])
+        self.assertEqual(complete(self.index, "wh"), ["what time is it"])
+        self.assertEqual(complete(self.index, ""), [])
+
+    def test_large_buffers(self):
+        self.index.add_question("what time is it")
+        self.assertEqual(complete(self.index, "what " * 20000), [])
+        self.assertEqual(complete(self.index, "/s" + "x" * 100000), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
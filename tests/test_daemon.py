@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from chatgpt_cli import daemon
+from chatgpt_cli.cmds.ask import AskCommand
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.config import get_config
+from chatgpt_cli.error import CommandError
+from tests.test_metrics import FakeSessionManager
+
+
+@unittest.skipUnless(daemon.is_supported(), "no Unix sockets")
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        get_config().set('CACHE', 'enable', 'false')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, "daemon.sock")
+        patcher = mock.patch("chatgpt_cli.chatapi._session_manager",
+                             FakeSessionManager(["Hello ", "world"]), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self):
+        server = daemon.DaemonServer(self.path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.addCleanup(stop)
+        return server
+
+    def send(self, message):
+        sock = daemon.connect(self.path)
+        assert sock is not None
+        return list(daemon.request(sock, message))
+
+    def test_ask(self):
+        self.start()
+        self.assertEqual(os.stat(self.path).st_mode & 0o077, 0)
+        frames = self.send({"type": "ask", "question": "hi", "prompt": "assist"})
+        self.assertEqual([f["content"] for f in frames if f["type"] == "delta"],
+                         ["Hello ", "world"])
+        done = frames[-1]
+        self.assertEqual((done["type"], done["error"]), ("done", None))
+        self.assertGreater(done["usage"]["completion_tokens"], 0)
+
+    def test_errors(self):
+        self.start()
+        frames = self.send({"type": "ask", "question": "hi", "prompt": "missing"})
+        self.assertEqual(frames, [{"type": "error", "message": "Prompt 'missing' is not found.",
+                                   "exit_code": 1}])
+        frames = self.send({"type": "what"})
+        self.assertEqual(frames[0]["type"], "error")
+        self.assertEqual(self.send({"type": "ping"})[0]["pid"], os.getpid())
+
+    def test_socket_ownership(self):
+        # a socket file nobody listens on is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # pylint: disable=no-member
+        stale.bind(self.path)
+        stale.close()
+        self.assertIsNone(daemon.connect(self.path))
+        self.start()
+        with self.assertRaises(CommandError):
+            daemon.DaemonServer(self.path)
+
+    def test_client(self):
+        self.start()
+        out = io.StringIO()
+        with mock.patch("chatgpt_cli.daemon.socket_path", return_value=self.path), \
+                mock.patch("sys.stdout", out):
+            self.assertTrue(AskCommand().run_remote_cmd("hi", "assist", output_format="raw"))
+        self.assertEqual(out.getvalue(), "Hello world\n")
+        with mock.patch("chatgpt_cli.daemon.socket_path",
+                        return_value=os.path.join(self.tmp_dir, "none.sock")):
+            self.assertFalse(AskCommand().run_remote_cmd("hi", "assist", output_format="raw"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import json
+import time
+import threading
+import unittest
+
+from rich.console import Console
+
+from chatgpt_cli import fanout, metrics
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSessionManager
+from chatgpt_cli.config import init as init_config
+
+
+class StalledStream:
+    """A stream sending nothing until it is closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        self.closed.wait(10)
+        raise ConnectionError("closed")
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeSessionManager(ChatSessionManager):
+    """Answers "<model> <index> ..." with interleaved choices, "slow" models later."""
+
+    def _new_chat_completion(self, stream, session=None, model=None, n=1):
+        assert stream
+        if model == "broken":
+            raise RuntimeError("boom")
+        if model == "stalled":
+            self.stalled = StalledStream()
+            return self.stalled
+
+        def chunks():
+            if model == "slow":
+                time.sleep(0.05)
+            for word in ("one ", "two"):
+                for index in range(n):
+                    yield {"choices": [{"index": index,
+                                        "delta": {"content": f"{model} {index} {word}"}}]}
+            for index in range(n):
+                yield {"choices": [{"index": index, "delta": {}, "finish_reason": "stop"}]}
+
+        return chunks()
+
+
+class TestFanOut(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.manager = FakeSessionManager()
+        self.session = self.manager.create("s1")
+        self.session.add_message(ChatMessage("hi", ChatMessageType.USER))
+
+    def test_candidates(self):
+        fan_out = fanout.FanOut(self.manager, self.session, ["fast", "slow", "fast"], n=2)
+        candidates = fan_out.run()
+        self.assertEqual([c.label for c in candidates],
+                         ["fast #1", "fast #2", "slow #1", "slow #2"])
+        self.assertEqual(candidates[1].text, "fast 1 one fast 1 two")
+        self.assertTrue(all(c.done and c.record.chunks == 2 for c in candidates))
+        # every candidate is timed on its own
+        self.assertGreater(candidates[2].record.ttft, candidates[0].record.ttft)
+        self.assertGreaterEqual(candidates[2].record.total, candidates[2].record.ttft)
+        # nothing is added to the session
+        self.assertEqual(len(self.session.histories), 1)
+
+    def test_failed_model(self):
+        recorder = metrics.get_recorder()
+        recorder.clear()
+        fan_out = fanout.FanOut(self.manager, self.session, ["broken", "fast"])
+        broken, fast = fan_out.run()
+        self.assertEqual(broken.record.error, "RuntimeError: boom")
+        self.assertEqual(fast.text, "fast 0 one fast 0 two")
+        self.assertIsNone(fast.record.error)
+        self.assertEqual(len(recorder.records()), 2)
+
+    def test_interrupted(self):
+        fan_out = fanout.FanOut(self.manager, self.session, ["fast", "stalled"])
+
+        def interrupt():
+            if getattr(self.manager, "stalled", None) is not None:
+                raise KeyboardInterrupt()
+
+        start = time.perf_counter()
+        with self.assertRaises(KeyboardInterrupt):
+            fan_out.run(interrupt, interval=0.01)
+        self.assertLess(time.perf_counter() - start, 5)
+        # the connection of the stalled stream is closed, not waited for
+        self.assertTrue(self.manager.stalled.closed.is_set())
+
+    def test_show_and_write(self):
+        screen = io.StringIO()
+        console = Console(file=screen, width=120)
+        fan_out = fanout.FanOut(self.manager, self.session, ["fast", "slow"])
+        candidates = fanout.show(console, fan_out, numbered=True)
+        text = screen.getvalue()
+        self.assertIn("[1] fast", text)
+        self.assertIn("slow 0 one slow 0 two", text)
+        out = io.StringIO()
+        fanout.write(out, candidates, "jsonl")
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(line["model"], line["content"]) for line in lines],
+                         [("fast", "fast 0 one fast 0 two"), ("slow", "slow 0 one slow 0 two")])
+        out = io.StringIO()
+        fanout.write(out, candidates, "raw")
+        self.assertEqual(out.getvalue().splitlines()[:2], ["==> fast <==", "fast 0 one fast 0 two"])
+
+    def test_parse_models(self):
+        self.assertEqual(fanout.parse_models("a, b,,", "d"), ["a", "b"])
+        self.assertEqual(fanout.parse_models(None, "d"), ["d"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from prompt_toolkit.history import FileHistory
+
+from chatgpt_cli.history import BoundedHistory
+
+
+async def _collect(history):
+    return [text async for text in history.load()]
+
+
+class TestBoundedHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, "cli_history.db")
+
+    def new_history(self, max_entries=100, max_chars=50, legacy_file=None):
+        history = BoundedHistory(self.path, max_entries, max_chars, legacy_file)
+        self.addCleanup(history.close)
+        return history
+
+    def test_dedup_and_max_chars(self):
+        history = self.new_history()
+        for text in ["a", "b", "a", "x" * 51, "c"]:
+            history.append_string(text)
+        # the long entry is only kept for this prompt
+        self.assertEqual(history.get_strings(), ["b", "a", "x" * 51, "c"])
+        self.assertEqual(list(self.new_history().load_history_strings()), ["c", "a", "b"])
+
+    def test_compaction(self):
+        history = self.new_history(max_entries=10)
+        for i in range(25):
+            history.append_string(f"q{i}")
+        self.assertLessEqual(len(history), 11)
+        history.compact()
+        self.assertEqual(list(history.load_history_strings()),
+                         [f"q{i}" for i in range(24, 14, -1)])
+
+    def test_lazy_load(self):
+        history = self.new_history()
+        for i in range(12):
+            history.append_string(f"q{i}")
+        expected = [f"q{i}" for i in range(11, -1, -1)]
+        with mock.patch("chatgpt_cli.history._PAGE_SIZE", 5):
+            history = self.new_history()
+            history._load_page()  # pylint: disable=protected-access
+            self.assertEqual(history.get_strings(), expected[:5][::-1])
+            history.append_string("q3")
+            self.assertEqual(asyncio.run(_collect(history)), ["q3"] + expected[:8] + expected[9:])
+            # loaded once
+            self.assertEqual(asyncio.run(_collect(history)), ["q3"] + expected[:8] + expected[9:])
+
+    def test_legacy_import(self):
+        legacy = os.path.join(self.tmp_dir, "cli_history")
+        file_history = FileHistory(legacy)
+        for text in ["old", "multi\nline", "old", "y" * 60]:
+            file_history.store_string(text)
+        history = self.new_history(legacy_file=legacy)
+        self.assertEqual(list(history.load_history_strings()), ["old", "multi\nline"])
+        history.append_string("new")
+        history.close()
+        # imported once
+        history = self.new_history(legacy_file=legacy)
+        self.assertEqual(list(history.load_history_strings()), ["new", "old", "multi\nline"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import typing as t
+
+from chatgpt_cli.chatapi import ChatMessageType
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.config import get_config
+from chatgpt_cli.jobs import JobManager, JobState
+from chatgpt_cli.store import SessionStore
+from tests.test_metrics import FakeSessionManager
+
+
+class GatedSessionManager(FakeSessionManager):
+    """Holds every answer until `release` is set."""
+
+    def __init__(self, deltas, error=None):
+        super().__init__(deltas, error)
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _new_chat_completion(self, stream, session=None, model=None, n=1):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self.release.wait(5)
+            return super()._new_chat_completion(stream, session, model, n)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class EchoSessionManager(FakeSessionManager):
+    """Answers the question in upper case, "first" once "second" is answered."""
+
+    def __init__(self):
+        super().__init__([])
+        self.second_answered = threading.Event()
+        self.finished : t.List[str] = []
+
+    def _new_chat_completion(self, stream, session=None, model=None, n=1):
+        question = session.generate_query_messages(model)[-1]["content"]
+        if question == "first":
+            self.second_answered.wait(5)
+        self.finished.append(question)
+        if question == "second":
+            self.second_answered.set()
+        return iter([{"choices": [{"delta": {"content": question.upper()}}]}])
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+
+    def new_manager(self, deltas=("Hello ", "world"), error=None, max_in_flight=2):
+        session_mgr = GatedSessionManager(list(deltas), error)
+        job_mgr = JobManager(session_mgr, max_in_flight)
+        self.addCleanup(job_mgr.shutdown)
+        self.addCleanup(session_mgr.release.set)
+        return session_mgr, job_mgr
+
+    def test_answer_is_added(self):
+        session_mgr, job_mgr = self.new_manager()
+        session = session_mgr.create("s1")
+        job = job_mgr.submit(session, "hi")
+        # the question is added with its answer
+        self.assertEqual(len(session.histories), 0)
+        self.assertEqual(session.pending, 1)
+        self.assertIn("background:", job_mgr.status())
+        session_mgr.release.set()
+        job_mgr.wait(session)
+        self.assertEqual(job.state, JobState.DONE)
+        self.assertEqual(job.received, len("Hello world"))
+        self.assertEqual([m.message_type for m in session.histories],
+                         [ChatMessageType.USER, ChatMessageType.ASSISTANT])
+        self.assertEqual(session.histories[-1].message, "Hello world")
+        self.assertEqual(session.pending, 0)
+        self.assertEqual(job_mgr.take_finished(), [job])
+        self.assertEqual(job_mgr.take_finished(), [])
+
+    def test_max_in_flight(self):
+        session_mgr, job_mgr = self.new_manager(max_in_flight=2)
+        sessions = [session_mgr.create(f"s{i}") for i in range(5)]
+        submitted = [job_mgr.submit(session, "hi") for session in sessions]
+        self.assertEqual(len(job_mgr.active()), 5)
+        session_mgr.release.set()
+        for session in sessions:
+            job_mgr.wait(session)
+        self.assertEqual(session_mgr.max_in_flight, 2)
+        self.assertTrue(all(job.state == JobState.DONE for job in submitted))
+        self.assertEqual(job_mgr.active(), [])
+
+    def test_answers_are_added_in_order(self):
+        session_mgr = EchoSessionManager()
+        job_mgr = JobManager(session_mgr, 2)
+        self.addCleanup(job_mgr.shutdown)
+        session = session_mgr.create("s1")
+        first = job_mgr.submit(session, "first")
+        second = job_mgr.submit(session, "second")
+        job_mgr.wait(session)
+        self.assertEqual(session_mgr.finished, ["second", "first"])
+        self.assertEqual((first.state, second.state), (JobState.DONE, JobState.DONE))
+        # each answered its own question, in the order they were asked
+        self.assertEqual([m.message for m in session.histories],
+                         ["first", "FIRST", "second", "SECOND"])
+        self.assertEqual(session.pending, 0)
+
+    def test_failure(self):
+        session_mgr, job_mgr = self.new_manager(error=RuntimeError("boom"))
+        session = session_mgr.create("s1")
+        job = job_mgr.submit(session, "hi")
+        session_mgr.release.set()
+        job_mgr.wait(session)
+        self.assertEqual(job.state, JobState.FAILED)
+        self.assertEqual(job.error, "RuntimeError: boom")
+        self.assertEqual(session.pending, 0)
+        self.assertEqual(job_mgr.status(), "background: 1 failed")
+
+    def test_busy_sessions_are_kept(self):
+        get_config().set('CLI', 'max_loaded_sessions', '1')
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        store = SessionStore(os.path.join(tmp_dir, "sessions.db"))
+        self.addCleanup(store.close)
+        session_mgr, job_mgr = self.new_manager()
+        session_mgr.attach_store(store)
+        session = session_mgr.create("s1")
+        job_mgr.submit(session, "hi")
+        session_mgr.create("s2")
+        self.assertIn("s1", session_mgr.sessions)
+        session_mgr.release.set()
+        job_mgr.wait(session)
+        session_mgr.create("s3")
+        self.assertNotIn("s1", session_mgr.sessions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import random
+import threading
+import time
+import unittest
+
+from chatgpt_cli.batch import ordered_map
+from chatgpt_cli.chatapi import ChatSessionManager
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.config import get_prompt_message
+from chatgpt_cli.mapreduce import REDUCE_PROMPT, MapReduce, iter_paragraphs, split_chunks
+from chatgpt_cli.tokens import count_tokens
+
+
+MODEL = "gpt-3.5-turbo"
+
+
+class FakeSessionManager(ChatSessionManager):
+    """Upper-cases map chunks and joins reduce groups with '+'."""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.calls = []
+        self.instructions = set()
+
+    def complete(self, session, model=None, use_cache=False, on_delta=None):
+        messages = session.generate_query_messages(model)
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        content = messages[-1]["content"]
+        with self.lock:
+            self.calls.append(session.session_name)
+            self.instructions.add((session.session_name, system))
+        time.sleep(random.random() * 0.01)
+        if session.session_name == "reduce":
+            return "+".join(content.split("\n\n---\n\n")), {}
+        return f"<{content.upper()}>" if system else content, {}
+
+
+class TestChunking(unittest.TestCase):
+
+    def test_paragraphs_are_packed(self):
+        text = "\n\n".join(f"paragraph {i} " + "word " * 10 for i in range(20))
+        chunks = list(split_chunks(io.StringIO(text), 40, MODEL))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk, MODEL), 40)
+        self.assertEqual("\n\n".join(chunks).split(), text.split())
+        # paragraphs stay whole
+        self.assertTrue(all(chunk.startswith("paragraph") for chunk in chunks))
+
+    def test_long_paragraph_split_at_sentences(self):
+        text = " ".join(f"Sentence number {i} is here." for i in range(50))
+        chunks = list(split_chunks(io.StringIO(text), 30, MODEL))
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk, MODEL), 30)
+            self.assertTrue(chunk.endswith("."))
+        self.assertEqual(" ".join(chunks).split(), text.split())
+
+    def test_huge_line_is_bounded(self):
+        text = "x" * 300000
+        pieces = list(iter_paragraphs(io.StringIO(text), 1000))
+        self.assertEqual(max(len(p) for p in pieces), 1000)
+        self.assertEqual("".join(pieces), text)
+
+
+class TestMapReduce(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+
+    def test_ordered_map_is_bounded(self):
+        started = []
+
+        def work(i):
+            started.append(i)
+            time.sleep(0.001)
+            return i * 2
+
+        results = ordered_map(work, iter(range(1000)), concurrency=2, window=4)
+        self.assertEqual(next(results), 0)
+        self.assertLessEqual(len(started), 5)
+        self.assertEqual(list(results), [i * 2 for i in range(1, 1000)])
+
+    def test_map_keeps_order(self):
+        text = "\n\n".join(f"part {i}" for i in range(30))
+        out = io.StringIO()
+        runner = MapReduce(FakeSessionManager(), "en-translator", chunk_tokens=2, concurrency=4)
+        summary = runner.run(io.StringIO(text), out)
+        self.assertEqual(summary.chunks, 30)
+        self.assertEqual(out.getvalue(), "\n\n".join(f"<PART {i}>" for i in range(30)) + "\n")
+
+    def test_reduce_merges_everything(self):
+        text = "\n\n".join(f"part {i}" for i in range(9))
+        session_mgr = FakeSessionManager()
+        runner = MapReduce(session_mgr, "en-translator", chunk_tokens=2, concurrency=3)
+        runner.group_tokens = 12
+        out = io.StringIO()
+        summary = runner.run(io.StringIO(text), out, reduce=True)
+        self.assertEqual(out.getvalue(), "+".join(f"<PART {i}>" for i in range(9)) + "\n")
+        self.assertEqual(session_mgr.calls.count("map"), 9)
+        self.assertGreater(session_mgr.calls.count("reduce"), 1)
+        self.assertEqual(session_mgr.instructions, {
+            ("map", get_prompt_message("en-translator")), ("reduce", REDUCE_PROMPT)})
+        self.assertEqual(summary.requests, len(session_mgr.calls))
+
+    def test_single_chunk_is_not_reduced(self):
+        session_mgr = FakeSessionManager()
+        out = io.StringIO()
+        MapReduce(session_mgr, "en-translator").run(io.StringIO("hello"), out, reduce=True)
+        self.assertEqual(out.getvalue(), "<HELLO>\n")
+        self.assertEqual(session_mgr.calls, ["map"])
+
+
+if __name__ == '__main__':
+    unittest.main()
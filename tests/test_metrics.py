@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from rich.console import Console
+
+from chatgpt_cli import metrics
+from chatgpt_cli.chatapi import ChatSessionManager
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.metrics import MetricsRecorder, RequestMetrics, percentile
+
+
+class FakeSessionManager(ChatSessionManager):
+
+    def __init__(self, deltas, error=None):
+        super().__init__()
+        self.deltas = deltas
+        self.error = error
+
+    def _new_chat_completion(self, stream, session=None, model=None, n=1):
+        if self.error is not None:
+            raise self.error
+        chunks = [{"choices": [{"delta": {"role": "assistant"}}]}]
+        chunks += [{"choices": [{"delta": {"content": d}}]} for d in self.deltas]
+        return iter(chunks)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summarize_groups(self):
+        recorder = MetricsRecorder()
+        recorder.record(RequestMetrics("a", "m1", True, ttft=0.1, tokens=10, streaming=2.0))
+        recorder.record(RequestMetrics("a", "m2", True, ttft=0.3))
+        recorder.record(RequestMetrics("b", "m1", True, cached=True, ttft=5.0))
+        recorder.record(RequestMetrics("b", "m1", True, error="Timeout"))
+        by_session = recorder.summarize(lambda m: m.session)
+        self.assertEqual(by_session["a"]["requests"], 2)
+        self.assertEqual(by_session["a"]["ttft p95"], 0.3)
+        self.assertEqual(by_session["b"]["cached"], 1)
+        self.assertEqual(by_session["b"]["errors"], 1)
+        # cached and failed requests have no timings
+        self.assertEqual(by_session["b"]["ttft p50"], 0.0)
+        by_model = recorder.summarize(lambda m: m.model)
+        self.assertEqual(by_model["m1"]["tokens/s p50"], 5.0)
+
+    def test_log(self):
+        path = os.path.join(self.tmp_dir, "metrics.jsonl")
+        recorder = MetricsRecorder(max_records=1, log_path=path)
+        recorder.record(RequestMetrics("a", "m", True))
+        recorder.record(RequestMetrics("b", "m", True))
+        self.assertEqual([r.session for r in recorder.records()], ["b"])
+        with open(path, "r", encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["session"] for line in f], ["a", "b"])
+
+    def test_ask_records_request(self):
+        recorder = metrics.get_recorder()
+        recorder.clear()
+        console = Console(file=io.StringIO(), force_terminal=True)
+        manager = FakeSessionManager(["Hello ", "world"])
+        manager.create("s1")
+        manager.ask("hi", stream=True, console=console)
+        manager = FakeSessionManager([], error=RuntimeError("boom"))
+        manager.create("s2")
+        with self.assertRaises(RuntimeError):
+            manager.ask("hi", stream=True, console=console)
+        ok, failed = recorder.records()
+        self.assertEqual((ok.session, ok.chunks, ok.error), ("s1", 2, None))
+        self.assertGreater(ok.tokens, 0)
+        self.assertGreaterEqual(ok.total, ok.ttft)
+        self.assertEqual(failed.error, "RuntimeError: boom")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import json
+import unittest
+
+from rich.console import Console
+
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.output import default_format
+from tests.test_metrics import FakeSessionManager
+
+
+class TestOutputFormats(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.console = Console(file=io.StringIO(), force_terminal=True)
+
+    def ask(self, manager, output_format, stream=True):
+        out = io.StringIO()
+        manager.create("s1")
+        answer = manager.ask("hi", stream=stream, console=self.console,
+                             output_format=output_format, out=out)
+        return answer, out.getvalue()
+
+    def test_default_format(self):
+        self.assertEqual(default_format(io.StringIO()), "raw")
+
+    def test_raw(self):
+        answer, out = self.ask(FakeSessionManager(["Hello ", "**world**"]), "raw")
+        self.assertEqual(answer, "Hello **world**")
+        self.assertEqual(out, "Hello **world**\n")
+        # the console only showed the progress
+        self.assertNotIn("world", self.console.file.getvalue())  # type: ignore
+
+    def test_jsonl(self):
+        _, out = self.ask(FakeSessionManager(["Hello ", "world"]), "jsonl")
+        lines = [json.loads(line) for line in out.splitlines()]
+        deltas, done = lines[:-1], lines[-1]
+        self.assertEqual([d["content"] for d in deltas], ["Hello ", "world"])
+        self.assertLessEqual(deltas[0]["t"], deltas[1]["t"])
+        self.assertEqual(done["type"], "done")
+        self.assertEqual(done["chunks"], 2)
+        self.assertIsNone(done["error"])
+        usage = done["usage"]
+        self.assertGreater(usage["prompt_tokens"], 0)
+        self.assertGreater(usage["completion_tokens"], 0)
+        self.assertEqual(usage["total_tokens"],
+                         usage["prompt_tokens"] + usage["completion_tokens"])
+
+    def test_jsonl_error(self):
+        manager = FakeSessionManager([], error=RuntimeError("boom"))
+        manager.create("s1")
+        out = io.StringIO()
+        with self.assertRaises(RuntimeError):
+            manager.ask("hi", stream=True, console=self.console,
+                        output_format="jsonl", out=out)
+        done = json.loads(out.getvalue())
+        self.assertEqual(done["error"], "RuntimeError: boom")
+
+
+if __name__ == '__main__':
+    unittest.main()
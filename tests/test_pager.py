@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import unittest
+from unittest import mock
+
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, MessageHistory
+from chatgpt_cli.pager import HistoryPager, HistoryView
+
+
+def make_history(turns):
+    histories = MessageHistory()
+    histories.append(ChatMessage("Be helpful.", ChatMessageType.SYSTEM))
+    for turn in range(1, turns + 1):
+        histories.append(ChatMessage(f"question {turn}", ChatMessageType.USER))
+        histories.append(ChatMessage(f"# Answer {turn}\n\nline one\n\nline two",
+                                     ChatMessageType.ASSISTANT))
+    return histories
+
+
+class TestHistoryView(unittest.TestCase):
+
+    def setUp(self):
+        self.view = HistoryView(make_history(5000), 60, color_system=None)
+        self.render = mock.patch.object(self.view, "_render", wraps=self.view._render).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_renders_the_screen_only(self):
+        lines = self.view.lines(20)
+        self.assertEqual(len(lines), 20)
+        self.assertIn("system", lines[0])
+        self.assertLess(self.render.call_count, 10)
+        self.view.goto_end(20)
+        self.assertIn("Answer 5000", "\n".join(self.view.lines(20)))
+        self.assertLess(self.render.call_count, 20)
+
+    def test_cached_per_width(self):
+        self.view.lines(20)
+        calls = self.render.call_count
+        self.view.lines(20)
+        self.assertEqual(self.render.call_count, calls)
+        self.view.resize(40, 20)
+        self.view.lines(20)
+        self.assertGreater(self.render.call_count, calls)
+        self.assertTrue(all(len(line) <= 40 for line in self.view.lines(20)))
+
+    def test_scroll(self):
+        block = len(self.view.block(0))
+        self.view.scroll(block + 1, 20)
+        self.assertEqual((self.view.top, self.view.offset), (1, 1))
+        self.view.scroll(-2, 20)
+        self.assertEqual((self.view.top, self.view.offset), (0, block - 1))
+        self.view.scroll(-100, 20)
+        self.assertEqual((self.view.top, self.view.offset), (0, 0))
+        self.view.goto_end(20)
+        bottom = (self.view.top, self.view.offset)
+        self.view.scroll(100, 20)
+        self.assertEqual((self.view.top, self.view.offset), bottom)
+
+    def test_turns_and_search(self):
+        self.assertTrue(self.view.goto_turn(1234, 20))
+        self.assertEqual(self.view.histories.text(self.view.top), "question 1234")
+        self.assertEqual(self.view.turn_of(self.view.top + 1), 1234)
+        self.assertFalse(self.view.goto_turn(5001, 20))
+        self.view.next_turn(1, 20)
+        self.assertEqual(self.view.turn_of(self.view.top), 1235)
+        self.view.next_turn(-1, 20)
+        self.assertEqual(self.view.turn_of(self.view.top), 1234)
+        self.assertTrue(self.view.search("ANSWER 17\n", 20))
+        self.assertEqual(self.view.turn_of(self.view.top), 17)
+        self.assertTrue(self.view.search("question 4000", 20, forward=False))
+        self.assertEqual(self.view.turn_of(self.view.top), 4000)
+        self.assertFalse(self.view.search("nothing like it", 20))
+
+    def test_grows(self):
+        self.assertEqual(self.view.turn_count, 5000)
+        self.view.histories.append(ChatMessage("one more", ChatMessageType.USER))
+        self.assertTrue(self.view.goto_turn(5001, 20))
+
+
+class TestHistoryPager(unittest.TestCase):
+
+    def test_keys(self):
+        view = HistoryView(make_history(100), 80, color_system=None)
+        pager = HistoryPager(view)
+        with create_pipe_input() as pipe:
+            app = pager.make_app(input=pipe, output=DummyOutput())
+            pipe.send_text(":42\r" + "/answer 7\r" + "n" + "q")
+            app.run()
+        # "answer 7" first matches answer 70, then answer 71
+        self.assertEqual(view.turn_of(view.top), 71)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import asyncio
+import threading
+import time
+import unittest
+import typing as t
+
+from chatgpt_cli.pipeline import Delta, StreamPipeline
+
+
+def _chunk(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+class TestStreamPipeline(unittest.TestCase):
+
+    def test_reading_does_not_wait_for_rendering(self):
+        read_at = []
+        rendered = []
+
+        def response():
+            yield {"choices": [{"delta": {"role": "assistant"}}]}
+            for i in range(20):
+                read_at.append(time.perf_counter())
+                yield _chunk(f"{i} ")
+
+        def sink(deltas):
+            time.sleep(0.02)
+            rendered.append((time.perf_counter(), "".join(c for _, c in deltas)))
+
+        stats = StreamPipeline(response(), sink).run_sync()
+        self.assertEqual("".join(text for _, text in rendered),
+                         "".join(f"{i} " for i in range(20)))
+        self.assertEqual(stats.chunks, 20)
+        # the whole stream was read while the slow sink rendered its first
+        # batch, which then got the pending deltas at once
+        self.assertLess(read_at[-1], rendered[0][0])
+        self.assertLessEqual(len(rendered), 2)
+        self.assertGreater(stats.render, 0.0)
+        self.assertLessEqual(stats.first, stats.last)
+
+    def test_queue_is_bounded(self):
+        read = []
+        rendered = []
+        pending = []
+
+        def response():
+            for i in range(50):
+                read.append(i)
+                yield _chunk("x")
+
+        def sink(deltas):
+            rendered.extend(deltas)
+            time.sleep(0.005)
+            pending.append(len(read) - len(rendered))
+
+        StreamPipeline(response(), sink, max_queue=4).run_sync()
+        # at most the queued deltas plus the one being read are ahead
+        self.assertLessEqual(max(pending), 5)
+
+    def test_errors_are_raised(self):
+
+        def response():
+            yield _chunk("a")
+            raise ConnectionError("reset")
+
+        output : t.List[Delta] = []
+        with self.assertRaises(ConnectionError):
+            StreamPipeline(response(), output.extend).run_sync()
+        self.assertEqual([c for _, c in output], ["a"])
+
+    def test_cancel_aborts_the_reader(self):
+        release = threading.Event()
+        aborted = []
+
+        def response():
+            yield _chunk("a")
+            release.wait(5)
+
+        def abort():
+            aborted.append(True)
+            release.set()
+
+        async def main():
+            task = asyncio.ensure_future(StreamPipeline(response(), lambda _: None,
+                                                        abort=abort).run())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            start = time.perf_counter()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(main())
+        self.assertEqual(aborted, [True])
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
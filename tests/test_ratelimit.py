@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import openai
+from requests.structures import CaseInsensitiveDict
+
+from chatgpt_cli import ratelimit, transport
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSessionManager
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.config import get_config
+from chatgpt_cli.ratelimit import RateLimiter, parse_duration, retry_after
+from tests.test_cache import FakeClock
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, **headers):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(
+            {name.replace("_", "-"): value for name, value in headers.items()})
+
+
+class TransientError(Exception):
+    pass
+
+
+class TestDurations(unittest.TestCase):
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("20"), 20.0)
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("1.5s") or 0.0, 1.5)
+        self.assertAlmostEqual(parse_duration("120ms") or 0.0, 0.12)
+        self.assertIsNone(parse_duration("soon"))
+        self.assertIsNone(parse_duration("1s later"))
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(CaseInsensitiveDict({"Retry-After": "3"})), 3.0)
+        self.assertEqual(retry_after({"retry-after-ms": "250", "retry-after": "1"}), 0.25)
+        self.assertEqual(retry_after({"x-ratelimit-reset-requests": "1s",
+                                      "x-ratelimit-reset-tokens": "6m0s"}), 360.0)
+        self.assertIsNone(retry_after({}))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, "ratelimit.json")
+        self.clock = FakeClock()
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.clock.now += seconds
+
+    def new_limiter(self, **kwargs):
+        return RateLimiter(self.path, clock=self.clock, sleep=self.sleep, **kwargs)
+
+    def test_requests_per_minute(self):
+        limiter = self.new_limiter(rpm=2)
+        self.assertEqual(limiter.acquire(10), 0.0)
+        self.assertEqual(limiter.acquire(10), 0.0)
+        self.assertAlmostEqual(limiter.acquire(10), 30.0)
+        self.clock.now += 60
+        self.assertEqual(limiter.reserve(10), 0.0)
+
+    def test_tokens_per_minute(self):
+        limiter = self.new_limiter(tpm=600)
+        self.assertEqual(limiter.reserve(500), 0.0)
+        self.assertAlmostEqual(limiter.reserve(200), 10.0)
+        # larger than the budget, waits for a full bucket only
+        self.clock.now += 60
+        self.assertEqual(limiter.reserve(10000), 0.0)
+
+    def test_shared_between_processes(self):
+        self.new_limiter(rpm=1).acquire(1)
+        self.assertAlmostEqual(self.new_limiter(rpm=1).reserve(1), 60.0)
+
+    def test_observe(self):
+        limiter = self.new_limiter()
+        self.assertEqual(limiter.reserve(1), 0.0)
+        limiter.observe(FakeResponse(x_ratelimit_limit_requests="60",
+                                     x_ratelimit_remaining_requests="0",
+                                     x_ratelimit_limit_tokens="1000",
+                                     x_ratelimit_remaining_tokens="900"))
+        self.assertAlmostEqual(limiter.reserve(1), 1.0)
+        self.clock.now += 1
+        self.assertEqual(limiter.reserve(900), 0.0)
+        limiter.observe(FakeResponse(429, retry_after="20"))
+        self.assertAlmostEqual(limiter.reserve(1), 20.0)
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["rpm"], 60)
+
+    def test_observe_without_state_file(self):
+        self.path = os.path.join(self.tmp_dir, "missing", "ratelimit.json")
+        limiter = self.new_limiter()
+        limiter.observe(FakeResponse(429, retry_after="20",
+                                     x_ratelimit_limit_requests="60"))
+        with self.assertRaises(OSError):
+            limiter.reserve(1)
+
+    def test_call_retries(self):
+        limiter = self.new_limiter(max_retries=2)
+        errors : t.List[Exception] = [TransientError(), TransientError()]
+
+        def send():
+            if errors:
+                raise errors.pop()
+            return "answer"
+
+        waits = []
+        self.assertEqual(limiter.call(send, 1, lambda e: isinstance(e, TransientError),
+                                      on_wait=lambda delay, attempt: waits.append(attempt)),
+                         "answer")
+        self.assertEqual(waits, [1, 2])
+        self.assertTrue(0.5 <= self.sleeps[0] <= 1.0 and 1.0 <= self.sleeps[1] <= 2.0)
+
+        errors = [TransientError()] * 3
+        with self.assertRaises(TransientError):
+            limiter.call(send, 1, lambda e: True)
+        errors = [ValueError()]
+        with self.assertRaises(ValueError):
+            limiter.call(send, 1, lambda e: isinstance(e, TransientError))
+        self.assertEqual(len(self.sleeps), 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1  # type: ignore
+        if self.server.requests == 1:  # type: ignore
+            body : t.Dict[str, t.Any] = {
+                "error": {"message": "Slow down", "type": "requests", "code": None}}
+            self.reply(429, body, {"Retry-After": "0.01"})
+            return
+        body = {"id": "c", "object": "chat.completion", "model": "m",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "Hello"}}]}
+        self.reply(200, body, {"x-ratelimit-limit-requests": "3500",
+                               "x-ratelimit-remaining-requests": "3499"})
+
+    def reply(self, status, body, headers):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class TestRetriedRequest(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.requests = 0  # type: ignore
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(setattr, openai, "api_base", openai.api_base)
+        get_config().set('API', 'OPENAI_API_BASE',
+                         f"http://127.0.0.1:{self.server.server_address[1]}/v1")
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.limiter = RateLimiter(os.path.join(tmp_dir, "ratelimit.json"))
+        patcher = mock.patch.object(ratelimit, "_rate_limiter", self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(transport.get_session().hooks["response"].remove, self.limiter.observe)
+
+    def test_retried_after_429(self):
+        manager = ChatSessionManager()
+        session = manager.create("s")
+        session.add_message(ChatMessage("hi", ChatMessageType.USER))
+        with mock.patch("chatgpt_cli.ratelimit.backoff", return_value=0.0):
+            response = manager._new_chat_completion(stream=False, session=session)
+        self.assertEqual(response["choices"][0]["message"]["content"], "Hello")
+        self.assertEqual(self.server.requests, 2)  # type: ignore
+        with open(self.limiter.path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["rpm"], 3500)
+
+
+if __name__ == '__main__':
+    unittest.main()
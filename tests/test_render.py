@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import unittest
+
+from chatgpt_cli.render import MarkdownStream, RefreshScheduler
+
+
+def feed_all(stream, text, size=3):
+    blocks = []
+    for i in range(0, len(text), size):
+        blocks.extend(stream.feed(text[i:i + size]))
+    return blocks
+
+
+class TestMarkdownStream(unittest.TestCase):
+
+    def test_paragraphs(self):
+        stream = MarkdownStream()
+        blocks = feed_all(stream, "first line\nsecond\n\nthird")
+        self.assertEqual(blocks, ["first line\nsecond"])
+        self.assertEqual(stream.tail, "third")
+        self.assertEqual(stream.flush(), ["third"])
+        self.assertEqual(stream.tail, "")
+
+    def test_code_fence_with_blank_lines(self):
+        stream = MarkdownStream()
+        blocks = feed_all(stream, "```py\na = 1\n\nb = 2\n")
+        self.assertEqual(blocks, [])
+        self.assertEqual(stream.tail, "```py\na = 1\n\nb = 2")
+        blocks = feed_all(stream, "```\nafter")
+        self.assertEqual(blocks, ["```py\na = 1\n\nb = 2\n```"])
+        self.assertEqual(stream.tail, "after")
+
+    def test_loose_list_stays_open(self):
+        stream = MarkdownStream()
+        blocks = feed_all(stream, "- a\n\n- b\n\n  more b\n\n")
+        self.assertEqual(blocks, [])
+        blocks = feed_all(stream, "text\n")
+        self.assertEqual(blocks, ["- a\n\n- b\n\n  more b"])
+        self.assertEqual(stream.flush(), ["text"])
+
+    def test_heading_and_rule_are_single_blocks(self):
+        stream = MarkdownStream()
+        blocks = feed_all(stream, "# Title\nbody\n\n---\n")
+        self.assertEqual(blocks, ["# Title", "body", "---"])
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRefreshScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.paints = 0
+
+    def paint(self):
+        self.paints += 1
+
+    def test_coalesces_within_frame(self):
+        scheduler = RefreshScheduler(self.paint, max_fps=10, clock=self.clock)
+        scheduler.request()
+        for _ in range(5):
+            self.clock.now += 0.01
+            scheduler.request()
+        self.assertEqual(self.paints, 1)
+        self.assertEqual(scheduler.coalesced, 5)
+        self.clock.now += 0.1
+        scheduler.request()
+        self.assertEqual(self.paints, 2)
+        scheduler.flush()
+        self.assertEqual(self.paints, 3)
+        self.assertEqual(scheduler.frames, 3)
+
+    def test_unlimited(self):
+        scheduler = RefreshScheduler(self.paint, max_fps=0, clock=self.clock)
+        for _ in range(5):
+            scheduler.request()
+        self.assertEqual(self.paints, 5)
+        self.assertEqual(scheduler.coalesced, 0)
+
+    def test_slow_paint_stretches_interval(self):
+        def slow_paint():
+            self.clock.now += 0.5
+        scheduler = RefreshScheduler(slow_paint, max_fps=4, min_fps=1, clock=self.clock)
+        scheduler.request()
+        self.assertEqual(scheduler.interval, 0.25)
+        self.clock.now += 0.25
+        scheduler.request()
+        self.assertEqual(scheduler.interval, 1.0)
+        self.clock.now += 0.5
+        scheduler.request()
+        self.assertEqual(scheduler.frames, 2)
+        self.clock.now += 0.5
+        scheduler.flush()
+        self.assertEqual(scheduler.frames, 3)
+        self.assertEqual(scheduler.dropped, 1)
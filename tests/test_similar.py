@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from rich.console import Console
+
+from chatgpt_cli import cache, similar
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.config import get_config
+from chatgpt_cli.similar import SimilarityIndex, jaccard, normalize, shingles, signature
+from tests.test_metrics import FakeSessionManager
+
+
+class TestSimilarity(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  What's  the\tTIME, now?? "), "what s the time now")
+        self.assertEqual(normalize("Ｆｕｌｌ_width"), "full width")
+
+    def test_signature_estimates_jaccard(self):
+        a = shingles(normalize("how do I parse a json file in python"))
+        b = shingles(normalize("how do I parse a json file with python"))
+        sig_a, sig_b = signature(a), signature(b)
+        self.assertEqual(signature(a), sig_a)
+        estimate = sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+        self.assertAlmostEqual(estimate, jaccard(a, b), delta=0.25)
+        # short questions fill every bin
+        self.assertTrue(all(value < 1 << 65 for value in signature(shingles("hi"))))
+
+
+class TestSimilarityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.index = SimilarityIndex(os.path.join(self.tmp_dir, "similar.db"), max_entries=3)
+        self.addCleanup(self.index.close)
+
+    def test_lookup(self):
+        self.index.add("s", "How do I reverse a list in Python?", "k1")
+        self.index.add("s", "What is the capital of France?", "k2")
+        self.assertEqual(self.index.lookup("s", "how do i reverse a list in python", 0.8),
+                         [("k1", 1.0)])
+        (key, similarity), = self.index.lookup("s", "How do I reverse a list in Python 3?", 0.8)
+        self.assertEqual(key, "k1")
+        self.assertLess(similarity, 1.0)
+        self.assertEqual(self.index.lookup("s", "How do I sort a dict in Python?", 0.8), [])
+        # other prompts and models
+        self.assertEqual(self.index.lookup("other", "What is the capital of France?", 0.8), [])
+
+    def test_max_entries(self):
+        for i in range(5):
+            self.index.add("s", f"question number {i}", f"k{i}")
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.lookup("s", "question number 0", 1.0), [])
+        self.assertEqual(self.index.lookup("s", "question number 4", 1.0), [("k4", 1.0)])
+
+
+class TestAskNearDuplicate(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        get_config().set('CACHE', 'similar', 'true')
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        response_cache = cache.ResponseCache(
+            os.path.join(tmp_dir, "cache.db"), max_size=0, ttl=0)
+        similarity_index = SimilarityIndex(os.path.join(tmp_dir, "similar.db"), max_entries=0)
+        for module, attr, value in [
+            (cache, "_response_cache", response_cache),
+            (similar, "_similarity_index", similarity_index),
+        ]:
+            patcher = mock.patch.object(module, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(response_cache.close)
+        self.addCleanup(similarity_index.close)
+        self.screen = io.StringIO()
+        self.console = Console(file=self.screen)
+
+    def ask(self, manager, question):
+        manager.create(manager.new_session_name())
+        return manager.ask(question, stream=True, console=self.console, use_cache=True)
+
+    def test_hit(self):
+        self.assertEqual(self.ask(FakeSessionManager(["Paris"]),
+                                 "What is the capital of France?"), "Paris")
+        failing = FakeSessionManager([], error=RuntimeError("not cached"))
+        self.assertEqual(self.ask(failing, "what is the capital of france"), "Paris")
+        self.assertIn("Near-duplicate", self.screen.getvalue())
+        with self.assertRaises(RuntimeError):
+            self.ask(failing, "What is the capital of Spain?")
+
+    def test_context_is_not_matched(self):
+        manager = FakeSessionManager(["Paris"])
+        self.ask(manager, "What is the capital of France?")
+        manager = FakeSessionManager([], error=RuntimeError("not cached"))
+        session = manager.create("s")
+        session.no_context = False
+        session.add_message(ChatMessage("hello", ChatMessageType.USER))
+        session.add_message(ChatMessage("hi", ChatMessageType.ASSISTANT))
+        with self.assertRaises(RuntimeError):
+            manager.ask("What is the capital of France?", stream=True,
+                        console=self.console, use_cache=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
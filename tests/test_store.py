@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from chatgpt_cli import tokens
+from chatgpt_cli.chatapi import ChatMessage, ChatMessageType, ChatSessionManager
+from chatgpt_cli.config import init as init_config
+from chatgpt_cli.config import get_config, reload_prompt
+from chatgpt_cli.error import CommandError
+from chatgpt_cli.store import MATCH_END, MATCH_START, SessionStore, fts_query
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        init_config()
+        get_config().set('CLI', 'max_loaded_sessions', '2')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "sessions.db")
+        self.store = SessionStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def new_manager(self, store):
+        manager = ChatSessionManager()
+        manager.attach_store(store)
+        return manager
+
+    def test_sessions_are_saved_on_first_message(self):
+        manager = self.new_manager(self.store)
+        session = manager.create("empty")
+        self.assertIsNone(session.session_id)
+        session = manager.create("first")
+        session.add_message(ChatMessage("q", ChatMessageType.USER))
+        session.add_message(ChatMessage("a", ChatMessageType.ASSISTANT))
+        manager.rename("first", "renamed")
+        metas = self.store.list_sessions()
+        self.assertEqual([(m.name, m.message_count) for m in metas], [("renamed", 2)])
+
+    def test_rename_to_a_loaded_name(self):
+        manager = self.new_manager(self.store)
+        manager.create("Chat01")
+        manager.create("other")
+        with self.assertRaises(CommandError):
+            manager.rename("other", "Chat01")
+        self.assertEqual(sorted(manager.sessions), ["Chat01", "other"])
+        self.assertEqual(manager.sessions["other"].session_name, "other")
+        manager.rename("other", "other")
+
+    def test_switch_loads_messages(self):
+        manager = self.new_manager(self.store)
+        session = manager.create("first")
+        session.add_message(ChatMessage("q", ChatMessageType.USER))
+        self.store.close()
+
+        store = SessionStore(self.path)
+        self.addCleanup(store.close)
+        manager = self.new_manager(store)
+        manager.create(manager.new_session_name())
+        self.assertEqual(manager.current_session.session_name, "Chat01")
+        loaded = manager.switch("first")
+        self.assertEqual(loaded.conversation_count, 1)
+        self.assertEqual(loaded.histories[0].message_type, ChatMessageType.USER)
+        self.assertIs(manager.switch(f"#{loaded.session_id}"), loaded)
+
+    def test_loaded_tokens_are_counted_lazily(self):
+        get_config().set('CLI', 'default_enable_context', 'True')
+        manager = self.new_manager(self.store)
+        session = manager.create("long", prompt="")
+        for i in range(50):
+            session.add_message(ChatMessage(f"q{i}", ChatMessageType.USER))
+            session.add_message(ChatMessage(f"a{i}", ChatMessageType.ASSISTANT))
+        self.store.close()
+
+        store = SessionStore(self.path)
+        self.addCleanup(store.close)
+        manager = self.new_manager(store)
+        with mock.patch("chatgpt_cli.tokens.count_tokens", return_value=1) as count_tokens:
+            loaded = manager.switch("long")
+            self.assertEqual(count_tokens.call_count, 0)
+            self.assertIsNone(loaded.total_tokens)
+            self.assertEqual(len(loaded.generate_query_messages()), 100)
+            self.assertEqual(count_tokens.call_count, 100)
+            self.assertEqual(loaded.total_tokens, 100 * (1 + tokens.MESSAGE_OVERHEAD))
+            loaded.generate_query_messages()
+            self.assertEqual(count_tokens.call_count, 100)
+
+    def test_inactive_sessions_are_evicted(self):
+        manager = self.new_manager(self.store)
+        for name in ("a", "b", "c"):
+            manager.create(name).add_message(ChatMessage(name, ChatMessageType.USER))
+        self.assertEqual(list(manager.sessions), ["b", "c"])
+        self.assertEqual(manager.switch("a").histories[-1].message, "a")
+        self.assertEqual(list(manager.sessions), ["c", "a"])
+
+    def test_prompt_prefixes_are_migrated(self):
+        self.store.close()
+        get_config().set('PROMPT', 'assist', 'TEST ASSIST')
+        reload_prompt()
+        db = sqlite3.connect(self.path)
+        with db:
+            db.execute("INSERT INTO sessions (id, name, prompt, no_context, created, updated) "
+                       "VALUES (1, 'old', 'assist', 0, 0, 0)")
+            db.executemany(
+                "INSERT INTO messages (session_id, role, content, timestamp) VALUES (1, ?, ?, 0)",
+                [("user", "TEST ASSIST\n\nq"), ("assistant", "TEST ASSIST\n\na")])
+            db.execute("PRAGMA user_version = 0")
+        db.close()
+
+        store = SessionStore(self.path)
+        self.addCleanup(store.close)
+        self.assertEqual([content for _, content, _ in store.load_messages(1)],
+                         ["q", "TEST ASSIST\n\na"])
+
+    def test_search(self):
+        manager = self.new_manager(self.store)
+        first = manager.create("first")
+        first.add_message(ChatMessage("how to sort a list in python", ChatMessageType.USER))
+        first.add_message(ChatMessage("Use sorted(items).", ChatMessageType.ASSISTANT))
+        second = manager.create("second")
+        second.add_message(ChatMessage("python python python list", ChatMessageType.USER))
+        hits = manager.search(["python", "list"])
+        self.assertEqual([hit.session_name for hit in hits], ["second", "first"])
+        self.assertIn(f"{MATCH_START}python{MATCH_END}", hits[1].snippet)
+        self.assertEqual(hits[1].role, "user")
+        self.assertEqual([hit.role for hit in manager.search(["sorted"])], ["assistant"])
+        self.assertEqual(len(manager.search(["sort*"])), 2)
+        self.assertEqual(manager.search(["missing"]), [])
+        # operators are searched for, not interpreted
+        self.assertEqual(manager.search(["python", "OR", "missing"]), [])
+        self.assertEqual(fts_query(['a"b', "c*", "*"]), '"a""b" "c"*')
+
+    def test_search_without_index(self):
+        manager = self.new_manager(self.store)
+        session = manager.create("first")
+        text = " ".join(f"word{i}" for i in range(100))
+        session.add_message(ChatMessage(f"{text} Needle {text}", ChatMessageType.USER))
+        with mock.patch.object(SessionStore, "has_search_index", False):
+            hit, = manager.search(["needle"])
+        self.assertIn(f"{MATCH_START}Needle{MATCH_END}", hit.snippet)
+        self.assertTrue(hit.snippet.startswith("...") and hit.snippet.endswith("..."))
+        self.assertLess(len(hit.snippet), len(text))
+
+    def test_search_index_is_migrated(self):
+        self.store.close()
+        db = sqlite3.connect(self.path)
+        with db:
+            for trigger in ("insert", "delete", "update"):
+                db.execute(f"DROP TRIGGER messages_fts_{trigger}")
+            db.execute("DROP TABLE messages_fts")
+            db.execute("INSERT INTO sessions (id, name, prompt, no_context, created, updated) "
+                       "VALUES (1, 'old', 'assist', 0, 0, 0)")
+            db.execute("INSERT INTO messages (session_id, role, content, timestamp) "
+                       "VALUES (1, 'user', 'an old question', 0)")
+            db.execute("PRAGMA user_version = 1")
+        db.close()
+
+        store = SessionStore(self.path)
+        self.addCleanup(store.close)
+        self.assertEqual([hit.session_name for hit in store.search(["question"])], ["old"])
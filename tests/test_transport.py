@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023, JayPei <jaypei97159@gmail.com>
+#
+
+
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chatgpt_cli import transport
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1  # type: ignore
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = do_HEAD
+
+
+class TestPooledSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.connections = 0  # type: ignore
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.session = transport.PooledSession()
+
+    def tearDown(self):
+        self.session.shutdown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_close_keeps_connections(self):
+        self.session.get(self.url)
+        self.session.close()
+        self.session.get(self.url)
+        self.assertEqual(self.server.connections, 1)  # type: ignore
+        self.session.shutdown()
+        self.session.get(self.url)
+        self.assertEqual(self.server.connections, 2)  # type: ignore
+
+    def test_connect_time(self):
+        transport.take_connect_time()
+        self.session.get(self.url)
+        self.assertGreater(transport.take_connect_time(), 0.0)
+        self.session.get(self.url)
+        self.assertEqual(transport.take_connect_time(), 0.0)
+
+    def test_prewarm(self):
+        old_session = transport._session  # pylint: disable=protected-access
+        transport._session = self.session  # pylint: disable=protected-access
+        try:
+            self.assertFalse(transport.is_warm())
+            thread = transport.prewarm(lambda: self.url)
+            self.assertIsNotNone(thread)
+            thread.join()  # type: ignore
+            self.assertTrue(transport.is_warm())
+            self.assertIsNone(transport.prewarm(lambda: self.url))
+            self.session.get(self.url)
+            self.assertEqual(self.server.connections, 1)  # type: ignore
+        finally:
+            transport._session = old_session  # pylint: disable=protected-access
+
+
+if __name__ == '__main__':
+    unittest.main()